@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+from datetime import datetime, timedelta, timezone
+
+from db import IS_POSTGRES, get_db_connection, db_execute
+import jobs
+
+# Bookings rolled up into time buckets, so admin trend reports read one row per
+# bucket x key x status instead of grouping the bookings table on every request.
+# Each booking is counted in the buckets of its created_at, under its current status:
+#
+#   service x hour / day / week      bookings per service, cancellation rates
+#   worker  x day / week             revenue per worker
+#
+# Request paths only enqueue a job (like counters.py): the job worker sums a batch of
+# deltas and applies one upsert per rollup row. Deletes queue their subtraction the
+# same way, behind the jobs of the bookings they remove, and rebuild() recomputes
+# everything from the bookings table.
+
+SERVICE = 'service'
+WORKER = 'worker'
+DIMENSIONS = {SERVICE: 'service_key', WORKER: 'worker_id'}
+ROLLUPS = [(SERVICE, 'hour'), (SERVICE, 'day'), (SERVICE, 'week'), (WORKER, 'day'), (WORKER, 'week')]
+GRAINS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+
+# Window used when a report gives no `from`, and the most buckets one report may span
+DEFAULT_WINDOW = {'hour': timedelta(hours=48), 'day': timedelta(days=30), 'week': timedelta(weeks=12)}
+ANALYTICS_MAX_BUCKETS = int(os.environ.get('ANALYTICS_MAX_BUCKETS', 1000))
+
+# Bucket labels are ISO strings (weeks start on Monday), so ranges compare as text
+if IS_POSTGRES:
+    BUCKET_SQL = {
+        'hour': "to_char(created_at, 'YYYY-MM-DD\"T\"HH24:00')",
+        'day': "to_char(created_at, 'YYYY-MM-DD')",
+        'week': "to_char(date_trunc('week', created_at), 'YYYY-MM-DD')",
+    }
+else:
+    BUCKET_SQL = {
+        'hour': "strftime('%Y-%m-%dT%H:00', created_at)",
+        'day': 'date(created_at)',
+        'week': "date(created_at, 'weekday 0', '-6 days')",
+    }
+
+UPSERT = '''
+    INSERT INTO booking_rollups (dim, grain, bucket, key, status, bookings, revenue) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (dim, grain, bucket, key, status) DO UPDATE SET
+        bookings = booking_rollups.bookings + excluded.bookings,
+        revenue = booking_rollups.revenue + excluded.revenue
+'''
+
+
+def parse_time(value):
+    # created_at as SQLite text or a Postgres datetime -> naive UTC datetime
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket(grain, ts):
+    if grain == 'hour':
+        return ts.strftime('%Y-%m-%dT%H:00')
+    if grain == 'week':
+        ts -= timedelta(days=ts.weekday())
+    return ts.strftime('%Y-%m-%d')
+
+
+def _grouped(dim, grain, where):
+    return f'''
+        SELECT {BUCKET_SQL[grain]} as bucket, {DIMENSIONS[dim]} as key, COALESCE(status, '') as status,
+               COUNT(*) as bookings, COALESCE(SUM(price), 0) as revenue
+        FROM bookings WHERE created_at IS NOT NULL AND ({where})
+        GROUP BY 1, 2, 3
+    '''
+
+
+def booking_deltas(booking, status, sign):
+    # booking: created_at, service_key, worker_id, price -> [(dim, grain, bucket, key, status, bookings, revenue)]
+    ts = parse_time(booking['created_at'])
+    price = float(booking['price'] or 0)
+    return [(dim, grain, bucket(grain, ts), booking[DIMENSIONS[dim]], status or '', sign, sign * price)
+            for dim, grain in ROLLUPS]
+
+
+def _booking(created_at, service_key, worker_id, price):
+    return {'created_at': str(created_at), 'service_key': service_key, 'worker_id': worker_id, 'price': price}
+
+
+def defer_booking_created(conn, created_at, service_key, worker_id, price, status='confirmed'):
+    jobs.enqueue(conn, 'analytics', {'booking': _booking(created_at, service_key, worker_id, price), 'to': status})
+
+
+def defer_booking_status_changed(conn, booking, new_status):
+    # booking: the row before the change (created_at, service_key, worker_id, price, status)
+    if (booking['status'] or '') != (new_status or ''):
+        jobs.enqueue(conn, 'analytics', {
+            'booking': _booking(booking['created_at'], booking['service_key'], booking['worker_id'], booking['price']),
+            'from': booking['status'], 'to': new_status,
+        })
+
+
+def apply_deltas(conn, deltas):
+    totals = {}
+    for dim, grain, label, key, status, bookings, revenue in deltas:
+        entry = totals.setdefault((dim, grain, label, key, status), [0, 0.0])
+        entry[0] += bookings
+        entry[1] += revenue
+    # Sorted, so concurrent batches take row locks in the same order
+    for row_key, (bookings, revenue) in sorted(totals.items()):
+        if bookings or revenue:
+            db_execute(conn, UPSERT, row_key + (bookings, revenue))
+
+
+def apply_jobs(conn, payloads):
+    deltas = []
+    for payload in payloads:
+        if 'deltas' in payload:
+            deltas.extend(tuple(d) for d in payload['deltas'])
+            continue
+        if 'from' in payload:
+            deltas.extend(booking_deltas(payload['booking'], payload['from'], -1))
+        deltas.extend(booking_deltas(payload['booking'], payload['to'], 1))
+    apply_deltas(conn, deltas)
+
+
+jobs.register('analytics', apply_jobs, batch=True)
+
+
+def _upsert_grouped(conn, where, params, sign):
+    # One INSERT ... SELECT per rollup, adding (sign=1) or subtracting (sign=-1) the matched bookings
+    for dim, grain in ROLLUPS:
+        db_execute(conn, f'''
+            INSERT INTO booking_rollups (dim, grain, bucket, key, status, bookings, revenue)
+            SELECT '{dim}', '{grain}', g.bucket, g.key, g.status, {sign} * g.bookings, {sign} * g.revenue
+            FROM ({_grouped(dim, grain, where)}) g WHERE 1 = 1
+            ON CONFLICT (dim, grain, bucket, key, status) DO UPDATE SET
+                bookings = booking_rollups.bookings + excluded.bookings,
+                revenue = booking_rollups.revenue + excluded.revenue
+        ''', params)
+
+
+def forget_bookings(conn, where, params):
+    # Call before deleting the bookings matched by `where`. The subtraction is queued, so
+    # it applies after the jobs still pending for those bookings and no rollup row dips
+    # below zero; one grouped SELECT per rollup, however many bookings match
+    deltas = []
+    for dim, grain in ROLLUPS:
+        rows = db_execute(conn, _grouped(dim, grain, where), params).fetchall()
+        deltas.extend([dim, grain, r['bucket'], r['key'], r['status'], -r['bookings'], -float(r['revenue'])]
+                      for r in rows)
+    if deltas:
+        jobs.enqueue(conn, 'analytics', {'deltas': deltas})
+
+
+def rebuild(conn):
+    # Backfill / reconciliation from the bookings table in the caller's transaction.
+    # Pending analytics jobs are already reflected in the bookings table
+    jobs.discard(conn, 'analytics')
+    db_execute(conn, 'DELETE FROM booking_rollups')
+    _upsert_grouped(conn, '1 = 1', (), 1)
+    return db_execute(conn, 'SELECT COUNT(*) as cnt FROM booking_rollups').fetchone()['cnt']
+
+
+def parse_range(args, now=None):
+    # Query args -> (dim, grain, first bucket, last bucket, key); raises ValueError
+    dim = args.get('by', SERVICE)
+    grain = args.get('grain', 'day')
+    if dim not in DIMENSIONS:
+        raise ValueError(f"by must be one of: {', '.join(DIMENSIONS)}")
+    if (dim, grain) not in ROLLUPS:
+        raise ValueError(f"grain for by={dim} must be one of: {', '.join(g for d, g in ROLLUPS if d == dim)}")
+    try:
+        end = parse_time(args['to']) if args.get('to') else (now or datetime.now(timezone.utc).replace(tzinfo=None))
+        start = parse_time(args['from']) if args.get('from') else end - DEFAULT_WINDOW[grain]
+    except ValueError:
+        raise ValueError('from and to must be ISO dates or timestamps')
+    if start > end:
+        raise ValueError('from must not be after to')
+    if (end - start) / GRAINS[grain] >= ANALYTICS_MAX_BUCKETS:
+        raise ValueError(f'Range spans more than {ANALYTICS_MAX_BUCKETS} {grain} buckets; narrow it or use a coarser grain')
+    return dim, grain, bucket(grain, start), bucket(grain, end), args.get(dim) or None
+
+
+def _summary(entry, bookings, status, revenue):
+    entry['bookings'] += bookings
+    entry['bookedValue'] += revenue
+    entry['statuses'][status] = entry['statuses'].get(status, 0) + bookings
+    if status == 'completed':
+        entry['revenue'] += revenue
+
+
+def _finish(entry):
+    entry['cancellationRate'] = round(entry['statuses'].get('cancelled', 0) / entry['bookings'], 4) if entry['bookings'] else 0
+    return entry
+
+
+def range_report(conn, dim, grain, first, last, key=None):
+    # Reads only the rollup rows inside [first, last]: cost follows the window, not the table size
+    query = 'SELECT bucket, key, status, bookings, revenue FROM booking_rollups WHERE dim = ? AND grain = ? AND bucket >= ? AND bucket <= ?'
+    params = [dim, grain, first, last]
+    if key:
+        query += ' AND key = ?'
+        params.append(key)
+    rows = db_execute(conn, query + ' ORDER BY bucket, key', params).fetchall()
+
+    series = {}
+    totals = {'bookings': 0, 'revenue': 0, 'bookedValue': 0, 'statuses': {}}
+    for r in rows:
+        if not r['bookings']:
+            continue
+        entry = series.get((r['bucket'], r['key']))
+        if entry is None:
+            entry = series[(r['bucket'], r['key'])] = {'bucket': r['bucket'], dim: r['key'], 'bookings': 0, 'revenue': 0,
+                                                       'bookedValue': 0, 'statuses': {}}
+        _summary(entry, r['bookings'], r['status'], r['revenue'])
+        _summary(totals, r['bookings'], r['status'], r['revenue'])
+    return {'by': dim, 'grain': grain, 'from': first, 'to': last,
+            'series': [_finish(e) for e in series.values()], 'totals': _finish(totals)}
+
+
+if __name__ == '__main__':
+    # python analytics.py rebuild                          -> backfill every rollup from bookings
+    # python analytics.py report [by] [grain] [from] [to]  -> print a range report as JSON
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command not in ('rebuild', 'report'):
+        sys.exit('usage: python analytics.py rebuild | report [service|worker] [hour|day|week] [from] [to]')
+    conn = get_db_connection()
+    try:
+        if command == 'rebuild':
+            rows = rebuild(conn)
+            conn.commit()
+            print(f'Rebuilt {rows} rollup rows')
+        else:
+            names = ('by', 'grain', 'from', 'to')
+            print(json.dumps(range_report(conn, *parse_range(dict(zip(names, sys.argv[2:]))))))
+    finally:
+        conn.close()
@@ -1,42 +1,50 @@
-import sqlite3
+import time
+BOOT_STARTED = time.perf_counter()
+
+import sys
 import json
 import logging
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 from datetime import datetime
 import uuid
 import os
 import math
 
-try:
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
-    HAS_POSTGRES = True
-except ImportError:
-    HAS_POSTGRES = False
-
-DATABASE_URL = os.environ.get('DATABASE_URL')
-IS_POSTGRES = HAS_POSTGRES and DATABASE_URL is not None
+from db import IS_POSTGRES, IntegrityError, get_db_connection, db_execute, qry
+from geo_index import GeoIndex, ensure_geo_index, load_geo_index
+from service_keys import ServiceResolver, normalize_service_key, save_service_aliases
+from migrations import LATEST_VERSION, run_migrations, schema_lock
+from cache import TTLCache
+import responses
+from pagination import MAX_PAGE_SIZE, keyset_query, split_page, page_limit, ndjson_lines
+import counters
+import analytics
+import slots
+import bulk
+import metrics
+import reviews
+import events
+import jobs
+import search_projection
+import worker_snapshot
+import cascade
+import replicas
+import sessions
+from replicas import get_read_connection
+from ranking import SORT_KEYS, WorkerArrays, facet_counts
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-app = Flask(__name__, static_folder='public', static_url_path='')
-CORS(app)
+# Seconds spent in each startup phase of this process (exported as boot_seconds)
+boot_timings = {'imports': time.perf_counter() - BOOT_STARTED}
 
-def get_db_connection():
-    if IS_POSTGRES:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        return conn
-    else:
-        db_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'service_finder.db')
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+# SCHEMA_INIT=auto  (default) create_app() checks the schema with one query and only creates
+#                   tables, migrates and seeds when the database is behind this code
+# SCHEMA_INIT=off   the database is prepared by a release step (`python app.py init-db`)
+SCHEMA_INIT = os.environ.get('SCHEMA_INIT', 'auto')
 
-def db_execute(conn, query, params=None):
-    cur = conn.cursor()
-    cur.execute(qry(query), params or ())
-    return cur
+routes = Blueprint('routes', __name__)
 
 def haversine(lat1, lon1, lat2, lon2):
     if not (lat1 and lon1 and lat2 and lon2): return 0
@@ -47,11 +55,34 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * math.asin(math.sqrt(a))
     return R * c
 
-# Adapt query placeholder based on DB type
-def qry(q):
-    if IS_POSTGRES:
-        return q.replace('?', '%s')
-    return q
+# Load rows for a list of ids without blowing the bound-parameter limit
+def fetch_by_ids(conn, query, ids, column='w.id', chunk=500, params=()):
+    rows = []
+    for i in range(0, len(ids), chunk):
+        part = ids[i:i + chunk]
+        rows.extend(db_execute(conn, query + f' AND {column} IN ({", ".join("?" * len(part))})', list(params) + part).fetchall())
+    return rows
+
+# Nearest-worker index over verified, available workers (kept in sync on worker writes)
+worker_geo_index = GeoIndex()
+
+# Free-text service input -> canonical service keys
+service_resolver = ServiceResolver()
+
+# Hot read caches; writes in this process invalidate them, the TTL bounds staleness across processes
+services_cache = TTLCache('services', maxsize=1, ttl=float(os.environ.get('SERVICES_CACHE_TTL', 300)))
+worker_profile_cache = TTLCache('worker_profiles', maxsize=int(os.environ.get('WORKER_CACHE_SIZE', 2048)),
+                                ttl=float(os.environ.get('WORKER_CACHE_TTL', 30)))
+# Earnings and booking totals land when the counters job runs, after the request that caused them
+counters.on_worker_stats_changed(lambda worker_ids: worker_profile_cache.invalidate(*worker_ids))
+metrics.metrics.register_collector(lambda: [
+    (f'cache_{k}', {'cache': c.name}, v) for c in (services_cache, worker_profile_cache) for k, v in c.stats().items()
+] + [(f'events_{k}', {}, v) for k, v in events.get_broker().info().items() if k != 'backend']
+  + [(f'jobs_{k}', {}, v) for k, v in jobs.worker_info().items()]
+  + [(f'db_replica_{k}', {}, v) for k, v in replicas.replica_info().items()]
+  + [(f'sessions_{k}', {}, v) for k, v in sessions.sessions.info().items()]
+  + [(f'worker_snapshot_{k}', {}, v) for k, v in worker_snapshot.snapshot.info().items()]
+  + [('boot_seconds', {'phase': k}, v) for k, v in boot_timings.items()])
 
 # Initial Services Seed Data
 DEFAULT_SERVICES = [
@@ -66,81 +97,112 @@ DEFAULT_SERVICES = [
     {'key': 'other', 'displayName': 'Others', 'icon': '🔧', 'categories': json.dumps(['Maintenance', 'Misc'])}
 ]
 
+# One round trip that tells whether init_db has anything to do
+SCHEMA_CHECK = '''
+    SELECT (SELECT MAX(version) FROM schema_migrations) as version,
+           (SELECT COUNT(*) FROM services) as services,
+           (SELECT COUNT(*) FROM users WHERE id = 'admin_1') as admin
+'''
+
+def schema_current(conn):
+    try:
+        row = db_execute(conn, SCHEMA_CHECK).fetchone()
+    except Exception:
+        # Fresh database: the tables do not exist yet
+        conn.rollback()
+        return False
+    return (row['version'] or 0) >= LATEST_VERSION and row['services'] > 0 and row['admin'] > 0
+
 def init_db():
+    # -> 'current' when the database was already up to date, 'initialized' after creating,
+    # migrating and seeding it, 'failed' otherwise
     conn = get_db_connection()
     try:
-        if IS_POSTGRES:
-            # Create Tables for Postgres
-            db_execute(conn, '''
-                CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, name TEXT NOT NULL, email TEXT, phone TEXT, password TEXT NOT NULL, role TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
-                CREATE TABLE IF NOT EXISTS services (key TEXT PRIMARY KEY, display_name TEXT NOT NULL, icon TEXT, categories TEXT, is_custom INTEGER DEFAULT 0);
-                CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, service TEXT NOT NULL, cost REAL, lat REAL, lng REAL, bio TEXT, verified INTEGER DEFAULT 1, gender TEXT, experience INTEGER DEFAULT 0, rating REAL DEFAULT 0, total_reviews INTEGER DEFAULT 0, slots TEXT, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(service) REFERENCES services(key));
-                CREATE TABLE IF NOT EXISTS bookings (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, service_key TEXT NOT NULL, slot TEXT, price REAL, status TEXT DEFAULT 'confirmed', address TEXT, lat REAL, lng REAL, notes TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
-                CREATE TABLE IF NOT EXISTS reviews (id TEXT PRIMARY KEY, booking_id TEXT NOT NULL, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, rating REAL, comments TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(booking_id) REFERENCES bookings(id), FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
-            ''')
-        else:
-            # SQLite Tables
-            conn.executescript('''
-                CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, name TEXT NOT NULL, email TEXT, phone TEXT, password TEXT NOT NULL, role TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
-                CREATE TABLE IF NOT EXISTS services (key TEXT PRIMARY KEY, display_name TEXT NOT NULL, icon TEXT, categories TEXT, is_custom INTEGER DEFAULT 0);
-                CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, service TEXT NOT NULL, cost REAL, lat REAL, lng REAL, bio TEXT, verified INTEGER DEFAULT 1, gender TEXT, experience INTEGER DEFAULT 0, rating REAL DEFAULT 0, total_reviews INTEGER DEFAULT 0, slots TEXT, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(service) REFERENCES services(key));
-                CREATE TABLE IF NOT EXISTS bookings (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, service_key TEXT NOT NULL, slot TEXT, price REAL, status TEXT DEFAULT 'confirmed', address TEXT, lat REAL, lng REAL, notes TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
-                CREATE TABLE IF NOT EXISTS reviews (id TEXT PRIMARY KEY, booking_id TEXT NOT NULL, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, rating REAL, comments TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(booking_id) REFERENCES bookings(id), FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
-            ''')
-        # Add available column if it doesn't exist
-        try:
-            db_execute(conn, 'ALTER TABLE workers ADD COLUMN available INTEGER DEFAULT 1')
+        if schema_current(conn):
+            return 'current'
+        with schema_lock(conn):
+            # Another process may have done the work while this one waited for the lock
+            if schema_current(conn):
+                return 'current'
+            if IS_POSTGRES:
+                # Create Tables for Postgres
+                db_execute(conn, '''
+                    CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, name TEXT NOT NULL, email TEXT, phone TEXT, password TEXT NOT NULL, role TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+                    CREATE TABLE IF NOT EXISTS services (key TEXT PRIMARY KEY, display_name TEXT NOT NULL, icon TEXT, categories TEXT, is_custom INTEGER DEFAULT 0);
+                    CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, service TEXT NOT NULL, cost REAL, lat REAL, lng REAL, bio TEXT, verified INTEGER DEFAULT 1, gender TEXT, experience INTEGER DEFAULT 0, rating REAL DEFAULT 0, total_reviews INTEGER DEFAULT 0, slots TEXT, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(service) REFERENCES services(key));
+                    CREATE TABLE IF NOT EXISTS bookings (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, service_key TEXT NOT NULL, slot TEXT, price REAL, status TEXT DEFAULT 'confirmed', address TEXT, lat REAL, lng REAL, notes TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
+                    CREATE TABLE IF NOT EXISTS reviews (id TEXT PRIMARY KEY, booking_id TEXT NOT NULL, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, rating REAL, comments TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(booking_id) REFERENCES bookings(id), FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
+                ''')
+            else:
+                # WAL is stored in the database file, so it is set once here rather than per connection
+                db_execute(conn, 'PRAGMA journal_mode=WAL')
+                # SQLite Tables
+                conn.executescript('''
+                    CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, name TEXT NOT NULL, email TEXT, phone TEXT, password TEXT NOT NULL, role TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+                    CREATE TABLE IF NOT EXISTS services (key TEXT PRIMARY KEY, display_name TEXT NOT NULL, icon TEXT, categories TEXT, is_custom INTEGER DEFAULT 0);
+                    CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, service TEXT NOT NULL, cost REAL, lat REAL, lng REAL, bio TEXT, verified INTEGER DEFAULT 1, gender TEXT, experience INTEGER DEFAULT 0, rating REAL DEFAULT 0, total_reviews INTEGER DEFAULT 0, slots TEXT, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(service) REFERENCES services(key));
+                    CREATE TABLE IF NOT EXISTS bookings (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, service_key TEXT NOT NULL, slot TEXT, price REAL, status TEXT DEFAULT 'confirmed', address TEXT, lat REAL, lng REAL, notes TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
+                    CREATE TABLE IF NOT EXISTS reviews (id TEXT PRIMARY KEY, booking_id TEXT NOT NULL, user_id TEXT NOT NULL, worker_id TEXT NOT NULL, rating REAL, comments TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY(booking_id) REFERENCES bookings(id), FOREIGN KEY(user_id) REFERENCES users(id), FOREIGN KEY(worker_id) REFERENCES workers(id));
+                ''')
             conn.commit()
-        except:
-            conn.rollback()
+
+            # Columns and indexes added after the base tables are versioned migrations; they may
+            # rewrite worker_search, so a snapshot built before them is stale once they commit
+            if run_migrations(conn):
+                worker_snapshot.invalidate()
             
-        # Seed Services if empty
-        if db_execute(conn, 'SELECT COUNT(*) as cnt FROM services').fetchone()['cnt'] == 0:
-            for s in DEFAULT_SERVICES:
-                db_execute(conn, 'INSERT INTO services (key, display_name, icon, categories) VALUES (?, ?, ?, ?)', 
-                          (s['key'], s['displayName'], s['icon'], s['categories']))
+            # Seed Services if empty
+            if db_execute(conn, 'SELECT COUNT(*) as cnt FROM services').fetchone()['cnt'] == 0:
+                for s in DEFAULT_SERVICES:
+                    db_execute(conn, 'INSERT INTO services (key, display_name, icon, categories) VALUES (?, ?, ?, ?)', 
+                              (s['key'], s['displayName'], s['icon'], s['categories']))
+                    save_service_aliases(conn, s['key'], s['displayName'])
         
-        # Seed Admin User if not exists
-        if db_execute(conn, "SELECT COUNT(*) as cnt FROM users WHERE id = ?", ('admin_1',)).fetchone()['cnt'] == 0:
-            db_execute(conn, '''
-                INSERT INTO users (id, name, email, phone, password, role) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', ('admin_1', 'Admin', 'admin@smartlocal.com', '0000000000', 'Admin@123', 'admin'))
+            # Seed Admin User if not exists
+            if db_execute(conn, "SELECT COUNT(*) as cnt FROM users WHERE id = ?", ('admin_1',)).fetchone()['cnt'] == 0:
+                db_execute(conn, '''
+                    INSERT INTO users (id, name, email, phone, password, role) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', ('admin_1', 'Admin', 'admin@smartlocal.com', '0000000000', 'Admin@123', 'admin'))
+                counters.bump(conn, counters.USERS)
             
-        conn.commit()
+            conn.commit()
+        print("Database initialized successfully.")
+        return 'initialized'
     except Exception as e:
         print(f"Error initializing db: {e}")
         conn.rollback()
+        return 'failed'
     finally:
         conn.close()
-    print("Database initialized successfully.")
-
-init_db()
 
 # --- ROUTES ---
 
-@app.route('/')
+# Registered on the app itself (not the blueprint) so its endpoint stays 'serve_index'
 def serve_index():
-    return app.send_static_file('indexx.html')
+    return current_app.send_static_file('indexx.html')
 
-@app.route('/api/services', methods=['GET'])
+@routes.route('/api/services', methods=['GET'])
 def get_services():
-    conn = get_db_connection()
-    services = db_execute(conn, 'SELECT * FROM services').fetchall()
-    conn.close()
-    
-    result = []
-    for s in services:
-        result.append({
-            'key': s['key'],
-            'displayName': s['display_name'],
-            'icon': s['icon'],
-            'categories': json.loads(s['categories'] or '[]'),
-            'isCustom': bool(s['is_custom'])
-        })
+    result = services_cache.get('all')
+    if result is None:
+        conn = get_db_connection()
+        services = db_execute(conn, 'SELECT * FROM services').fetchall()
+        conn.close()
+        
+        result = []
+        for s in services:
+            result.append({
+                'key': s['key'],
+                'displayName': s['display_name'],
+                'icon': s['icon'],
+                'categories': json.loads(s['categories'] or '[]'),
+                'isCustom': bool(s['is_custom'])
+            })
+        services_cache.set('all', result)
     return jsonify(result)
 
-@app.route('/api/admin/services', methods=['POST'])
+@routes.route('/api/admin/services', methods=['POST'])
 def add_service():
     data = request.json
     conn = get_db_connection()
@@ -149,14 +211,17 @@ def add_service():
             INSERT INTO services (key, display_name, icon, categories, is_custom) 
             VALUES (?, ?, ?, ?, ?)
         ''', (data['name'], data['displayName'], data.get('icon', '🔧'), json.dumps(data.get('categories', [])), 1))
+        save_service_aliases(conn, data['name'], data['displayName'])
         conn.commit()
+        service_resolver.add(data['name'], data['displayName'])
+        services_cache.invalidate()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/auth/register', methods=['POST'])
+@routes.route('/api/auth/register', methods=['POST'])
 def register_user():
     data = request.json
     user_id = 'user_' + str(uuid.uuid4().hex)
@@ -164,7 +229,8 @@ def register_user():
     conn = get_db_connection()
     try:
         # Check if user exists
-        existing = db_execute(conn, 'SELECT id FROM users WHERE phone = ? OR email = ?', (data.get('phone'), data.get('email'))).fetchone()
+        existing = db_execute(conn, 'SELECT id FROM users WHERE (phone = ? OR email = ?) AND deleted_at IS NULL',
+                              (data.get('phone'), data.get('email'))).fetchone()
         if existing:
             return jsonify({'error': 'User already exists with this phone or email.'}), 400
             
@@ -172,6 +238,7 @@ def register_user():
             INSERT INTO users (id, name, email, phone, password, role)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (user_id, data['name'], data.get('email'), data.get('phone'), data['password'], data['role']))
+        counters.defer_bump(conn, counters.USERS)
         conn.commit()
         
         return jsonify({'success': True, 'user': {'id': user_id, 'name': data['name'], 'email': data.get('email'), 'role': data['role']}})
@@ -180,7 +247,7 @@ def register_user():
     finally:
         conn.close()
 
-@app.route('/api/auth/login', methods=['POST'])
+@routes.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.json
     role = data.get('role')
@@ -194,13 +261,13 @@ def login():
     try:
         # For Admin, strict check
         if role == 'admin':
-            user = db_execute(conn, 'SELECT * FROM users WHERE role = ? AND password = ? AND LOWER(name) = LOWER(?)', 
+            user = db_execute(conn, 'SELECT * FROM users WHERE role = ? AND password = ? AND LOWER(name) = LOWER(?) AND deleted_at IS NULL', 
                                 (role, password, name)).fetchone()
             if not user:
                 return jsonify({'error': 'Invalid admin credentials'}), 401
         else:
             # For Users/Workers, find by phone
-            user = db_execute(conn, 'SELECT * FROM users WHERE role = ? AND phone = ?', (role, phone)).fetchone()
+            user = db_execute(conn, 'SELECT * FROM users WHERE role = ? AND phone = ? AND deleted_at IS NULL', (role, phone)).fetchone()
             
             # Auto-register if not exists (since we removed OTP/verification)
             if not user and name and phone:
@@ -209,6 +276,7 @@ def login():
                     INSERT INTO users (id, name, email, phone, password, role)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', (user_id, name, email, phone, password or 'Password@123', role))
+                counters.defer_bump(conn, counters.USERS)
                 conn.commit()
                 user = db_execute(conn, 'SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
             
@@ -226,7 +294,7 @@ def login():
 
         return jsonify({
             'success': True, 
-            'token': str(uuid.uuid4().hex),
+            'token': sessions.sessions.issue(user['id'], user['role'], user['name'], user_res.get('workerId')),
             'user': user_res
         })
     except Exception as e:
@@ -234,7 +302,23 @@ def login():
     finally:
         conn.close()
 
-@app.route('/api/check-duplicate', methods=['GET'])
+# Revokes the bearer token; it is rejected everywhere within SESSION_REVOCATION_REFRESH_SECONDS
+@routes.route('/api/auth/logout', methods=['POST'])
+def logout():
+    if g.session is None:
+        return jsonify({'success': True})
+    conn = get_db_connection()
+    try:
+        sessions.sessions.revoke(conn, g.session)
+        conn.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@routes.route('/api/check-duplicate', methods=['GET'])
 def check_duplicate():
     phone = request.args.get('phone')
     name = request.args.get('name', '')
@@ -248,12 +332,13 @@ def check_duplicate():
                 SELECT COUNT(*) as cnt FROM users u
                 JOIN workers w ON u.id = w.user_id
                 WHERE (u.phone = ? OR LOWER(u.name) = LOWER(?)) AND w.service = ?
+                  AND u.deleted_at IS NULL AND w.deleted_at IS NULL
             ''', (phone, name, service)).fetchone()
             return jsonify({'exists': res['cnt'] > 0})
             
         res = db_execute(conn, '''
             SELECT COUNT(*) as cnt FROM users 
-            WHERE phone = ? OR LOWER(name) = LOWER(?) OR (email != '' AND LOWER(email) = LOWER(?))
+            WHERE (phone = ? OR LOWER(name) = LOWER(?) OR (email != '' AND LOWER(email) = LOWER(?))) AND deleted_at IS NULL
         ''', (phone, name, email)).fetchone()
         
         return jsonify({'exists': res['cnt'] > 0})
@@ -262,7 +347,7 @@ def check_duplicate():
     finally:
         conn.close()
 
-@app.route('/api/workers/register', methods=['POST'])
+@routes.route('/api/workers/register', methods=['POST'])
 def register_worker():
     data = request.json
     user_data = data.get('user')
@@ -270,8 +355,8 @@ def register_worker():
     
     conn = get_db_connection()
     try:
-        # 1. User setup
-        user = db_execute(conn, 'SELECT id FROM users WHERE phone = ?', (user_data.get('phone'),)).fetchone()
+        # 1. User setup (a soft-deleted account is left to its purge, which would take the new worker with it)
+        user = db_execute(conn, 'SELECT id FROM users WHERE phone = ? AND deleted_at IS NULL', (user_data.get('phone'),)).fetchone()
         if user:
             user_id = user['id']
         else:
@@ -280,18 +365,27 @@ def register_worker():
                 INSERT INTO users (id, name, email, phone, password, role)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (user_id, user_data.get('name'), user_data.get('email'), user_data.get('phone'), user_data.get('password'), 'worker'))
+            counters.defer_bump(conn, counters.USERS)
             
         # 2. Worker setup
         worker_id = 'worker_' + str(uuid.uuid4().hex)
+        service_key = normalize_service_key(worker_data.get('service'))
         db_execute(conn, '''
-            INSERT INTO workers (id, user_id, service, cost, lat, lng, bio, gender, experience, slots)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (worker_id, user_id, worker_data.get('service'), worker_data.get('cost'), 
+            INSERT INTO workers (id, user_id, service, service_key, cost, lat, lng, bio, gender, experience, slots)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (worker_id, user_id, worker_data.get('service'), service_key, worker_data.get('cost'), 
               worker_data.get('latitude'), worker_data.get('longitude'), worker_data.get('bio'), 
               worker_data.get('gender'), worker_data.get('experience', 0), json.dumps(worker_data.get('slots', {}))))
+        save_service_aliases(conn, worker_data.get('service'))
+        slots.save_worker_slots(conn, worker_id, worker_data.get('slots', {}))
+        counters.defer_bump(conn, counters.WORKERS)
+        search = search_projection.refresh_workers(conn, [worker_id])
               
         conn.commit()
-        token = str(uuid.uuid4().hex)
+        search.publish()
+        service_resolver.add(worker_data.get('service'))
+        worker_geo_index.upsert(worker_id, worker_data.get('latitude'), worker_data.get('longitude'), service_key)
+        token = sessions.sessions.issue(user_id, 'worker', user_data.get('name'), worker_id)
         return jsonify({'success': True, 'token': token, 'user': {'id': user_id, 'name': user_data.get('name'), 'role': 'worker', 'workerId': worker_id}})
     except Exception as e:
         conn.rollback()
@@ -299,88 +393,118 @@ def register_worker():
     finally:
         conn.close()
 
-@app.route('/api/workers', methods=['GET'])
+# Filters: min_cost, max_cost, min_rating, min_experience, gender=a,b, available_now=1 (or at=5pm);
+# sort=relevance blends distance, rating, review count and price; facets=1 wraps the page as
+# {"workers": [...], "total": N, "facets": {"service": {...}, "price": {...}}}
+@routes.route('/api/workers', methods=['GET'])
 def get_workers():
     service = request.args.get('service')
     lat = request.args.get('lat')
     lng = request.args.get('lng')
+    radius_km = request.args.get('radius_km', type=float)
+    limit = request.args.get('limit', type=int)
+    sort = request.args.get('sort')
+    with_facets = request.args.get('facets', '').lower() in ('1', 'true', 'yes')
+    try:
+        filters = search_projection.parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if limit:
+        limit = min(limit, MAX_PAGE_SIZE)
+    filter_sql, filter_params = search_projection.filter_sql(filters)
     
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
-        query = '''
-            SELECT w.*, u.name, u.phone, u.email 
-            FROM workers w
-            JOIN users u ON w.user_id = u.id
-            WHERE w.verified = 1 AND (w.available IS NULL OR w.available = 1)
-        '''
-        params = []
+        # Rows come from the worker_search projection with their JSON already serialized
+        query = search_projection.SEARCH_QUERY + filter_sql
+        # Resolve free-text service input to canonical keys in memory, then filter with an index seek
+        service_keys = None
         if service and service != 'all':
-            query += ''' AND (
-                LOWER(w.service) = LOWER(?) 
-                OR LOWER(w.service) LIKE LOWER(?)
-                OR LOWER(w.service) LIKE LOWER(?)
-                OR LOWER(REPLACE(w.service, '_', ' ')) LIKE LOWER(?)
-            )'''
-            params.append(service)
-            params.append('%_' + service)
-            params.append('%' + service + '%')
-            params.append('%' + service + '%')
-            
-        workers = db_execute(conn, query, params).fetchall()
-        
-        result = []
-        for w in workers:
-            try:
-                dist = haversine(lat, lng, w['lat'], w['lng']) if lat and lng else 0
-                result.append({
-                    'id': w['id'],
-                    '_id': w['id'],
-                    'userId': w['user_id'],
-                    'service': w['service'],
-                    'cost': w['cost'],
-                    'lat': w['lat'],
-                    'lng': w['lng'],
-                    'bio': w['bio'],
-                    'verified': bool(w['verified']),
-                    'gender': w['gender'],
-                    'experience': w['experience'],
-                    'rating': w['rating'],
-                    'totalReviews': w['total_reviews'],
-                    'name': w['name'],
-                    'phone': w['phone'],
-                    'distance': round(dist, 1),
-                    'slots': json.loads(w['slots'] or '{}')
-                })
-            except Exception as row_error:
-                logging.warning(f"Error processing worker row: {row_error}")
-                continue
-        return jsonify(result)
+            service_keys = sorted(service_resolver.ensure(get_db_connection).resolve(service))
+
+        nearest_first = sort in (None, 'distance')
+        nearest = bool(lat and lng and (radius_km is not None or sort == 'distance' or (limit and nearest_first)))
+        if service_keys == []:
+            workers = []
+            ranked = WorkerArrays.from_rows(workers)
+        elif worker_snapshot.enabled() and worker_snapshot.snapshot.ensure(get_db_connection):
+            # Filter, rank and facet against the shared snapshot; only the final page is read from the database
+            free_ids = slots.free_worker_ids_at(conn, filters['minute']) if filters['available_now'] else None
+            ids, distances, total, facets = worker_snapshot.snapshot.search(
+                service_keys, lat, lng, radius_km, sort, limit, nearest, filters, free_ids, with_facets)
+            by_id = {w['id']: w for w in fetch_by_ids(conn, query, ids, 's.worker_id', params=filter_params)}
+            page = [j for j, wid in enumerate(ids) if wid in by_id and (not service_keys or by_id[wid]['service_key'] in service_keys)]
+            if len(page) < len(ids) and len(page) < (limit or len(ids)):
+                # Rows the snapshot still ranks but that are gone or changed; have it rebuilt
+                worker_snapshot.invalidate()
+            page = page[:limit] if limit else page
+            workers = [by_id[ids[j]] for j in page]
+            if facets is not None:
+                names = worker_snapshot.snapshot.service_names(get_db_connection, facets[0])
+                facets = ({names.get(code, str(code)): n for code, n in facets[0].items()}, facets[1])
+            return search_response(workers, distances and [distances[j] for j in page], None, total, facets)
+        elif nearest:
+            # Nearest-first search: only candidates found in nearby grid cells are loaded
+            ensure_geo_index(worker_geo_index, get_db_connection)
+            match = service_keys.__contains__ if service_keys else None
+            # Filters and facets are applied after the grid search, so it cannot stop at `limit`
+            cut = limit if nearest_first and not filter_sql and not with_facets else None
+            found = worker_geo_index.nearest(float(lat), float(lng), radius_km, cut, match)
+            by_id = {wid: d for d, wid in found}
+            workers = fetch_by_ids(conn, query, list(by_id), 's.worker_id', params=filter_params)
+            workers.sort(key=lambda w: by_id[w['id']])
+            ranked = WorkerArrays.from_rows(workers)
+            ranked.distances = [by_id[w['id']] for w in workers]
+        else:
+            params = list(filter_params)
+            if service_keys:
+                query += f' AND s.service_key IN ({", ".join("?" * len(service_keys))})'
+                params.extend(service_keys)
+                
+            workers = db_execute(conn, query, params).fetchall()
+            ranked = WorkerArrays.from_rows(workers)
+            if lat and lng:
+                ranked.compute_distances(lat, lng)
+
+        # Rank all candidates at once and keep only the top k rows
+        if sort in SORT_KEYS:
+            order = ranked.top_k(sort, limit)
+        else:
+            order = range(min(limit, len(workers)) if limit else len(workers))
+        facets = facet_counts([w['service_key'] for w in workers], ranked.column('costs')) if with_facets else None
+        return search_response(workers, ranked.distances, order, len(workers), facets)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/workers/<worker_id>', methods=['GET'])
+def search_response(workers, distances, order, total, facets):
+    body = search_projection.render(workers, distances, order)
+    if facets is not None:
+        body = search_projection.render_faceted(body, total, facets)
+    return Response(body, mimetype='application/json')
+
+@routes.route('/api/workers/<worker_id>', methods=['GET'])
 def get_worker(worker_id):
-    conn = get_db_connection()
+    cached = worker_profile_cache.get(worker_id)
+    if cached is not None:
+        return jsonify(cached)
+
+    conn = get_read_connection()
     try:
         worker = db_execute(conn, '''
             SELECT w.*, u.name, u.phone, u.email 
             FROM workers w
             JOIN users u ON w.user_id = u.id
-            WHERE w.id = ?
+            WHERE w.id = ? AND w.deleted_at IS NULL
         ''', (worker_id,)).fetchone()
         
         if not worker:
             return jsonify({'error': 'Worker not found'}), 404
             
-        stats = db_execute(conn, '''
-            SELECT COUNT(*) as bookings, SUM(price) as earnings
-            FROM bookings
-            WHERE worker_id = ? AND status = 'completed'
-        ''', (worker_id,)).fetchone()
+        stats = counters.get_worker_stats(conn, worker_id)
             
-        return jsonify({
+        profile = {
             'id': worker['id'],
             '_id': worker['id'],
             'userId': worker['user_id'],
@@ -400,17 +524,19 @@ def get_worker(worker_id):
             'totalBookings': stats['bookings'] or 0,
             'available': bool(worker['available'] if worker['available'] is not None else 1),
             'slots': json.loads(worker['slots'] or '{}')
-        })
+        }
+        worker_profile_cache.set(worker_id, profile)
+        return jsonify(profile)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/workers/<worker_id>/availability', methods=['PATCH'])
+@routes.route('/api/workers/<worker_id>/availability', methods=['PATCH'])
 def toggle_availability(worker_id):
     conn = get_db_connection()
     try:
-        worker = db_execute(conn, 'SELECT available FROM workers WHERE id = ?', (worker_id,)).fetchone()
+        worker = db_execute(conn, 'SELECT available, verified, lat, lng, service_key FROM workers WHERE id = ?', (worker_id,)).fetchone()
         if not worker:
             return jsonify({'error': 'Worker not found'}), 404
             
@@ -418,7 +544,14 @@ def toggle_availability(worker_id):
         new_avail = 0 if curr == 1 else 1
         
         db_execute(conn, 'UPDATE workers SET available = ? WHERE id = ?', (new_avail, worker_id))
+        search = search_projection.refresh_workers(conn, [worker_id])
         conn.commit()
+        search.publish()
+        worker_profile_cache.invalidate(worker_id)
+        if new_avail and worker['verified'] == 1:
+            worker_geo_index.upsert(worker_id, worker['lat'], worker['lng'], worker['service_key'])
+        else:
+            worker_geo_index.remove(worker_id)
         return jsonify({'success': True, 'available': bool(new_avail)})
     except Exception as e:
         conn.rollback()
@@ -426,38 +559,103 @@ def toggle_availability(worker_id):
     finally:
         conn.close()
 
-@app.route('/api/bookings', methods=['POST'])
+@routes.route('/api/availability', methods=['GET'])
+def get_availability():
+    # Workers with a free slot in [from, to), e.g. ?service=plumber&from=5pm&to=7pm
+    service = request.args.get('service')
+    limit = request.args.get('limit', type=int)
+    try:
+        start = slots.parse_clock(request.args.get('from', '0:00'))
+        end = slots.parse_clock(request.args.get('to', '24:00'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_read_connection()
+    try:
+        service_keys = None
+        if service and service != 'all':
+            service_keys = sorted(service_resolver.ensure(get_db_connection).resolve(service))
+        return jsonify(slots.free_workers(conn, start, end, service_keys, limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@routes.route('/api/bookings', methods=['POST'])
 def create_booking():
     data = request.json
     booking_id = 'book_' + str(uuid.uuid4().hex)
     location = data.get('location', {})
+    user_id = sessions.request_user_id(data.get('userId'))
+    if not user_id:
+        return jsonify({'error': 'Please log in again.'}), 401
     
     conn = get_db_connection()
     try:
-        db_execute(conn, '''
+        created_at = db_execute(conn, '''
             INSERT INTO bookings (id, user_id, worker_id, service_key, slot, price, address, lat, lng, notes)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (booking_id, data.get('userId'), data.get('workerId'), data.get('service'), data.get('slot'), 
-              data.get('price'), data.get('address'), location.get('lat', 0), location.get('lng', 0), data.get('notes')))
+            RETURNING created_at
+        ''', (booking_id, user_id, data.get('workerId'), data.get('service'), data.get('slot'), 
+              data.get('price'), data.get('address'), location.get('lat', 0), location.get('lng', 0), data.get('notes'))).fetchone()['created_at']
+        if data.get('slot'):
+            # Primary key on (worker_id, slot): a concurrent booking of the same slot fails here
+            slots.reserve_slot(conn, data.get('workerId'), data.get('slot'), booking_id)
+        counters.defer_bump(conn, counters.BOOKINGS)
+        analytics.defer_booking_created(conn, created_at, data.get('service'), data.get('workerId'), data.get('price'))
               
         conn.commit()
+        events.publish_booking('booking.created', booking_id, user_id, data.get('workerId'),
+                               status='confirmed', slot=data.get('slot'), service=data.get('service'))
         return jsonify({'success': True, 'bookingId': booking_id})
+    except IntegrityError:
+        conn.rollback()
+        return jsonify({'error': 'This slot is already booked. Please pick another slot.'}), 409
     except Exception as e:
         conn.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/bookings/user', methods=['GET'])
+# Server-Sent Events: booking.created / booking.status for the session's own bookings and
+# for the worker profiles it owns. The channels come from the session, never from the
+# query; EventSource cannot send headers, so the client passes its token as ?token=
+@routes.route('/api/events', methods=['GET'])
+def booking_events():
+    user_id = sessions.request_user_id()
+    if not user_id:
+        return jsonify({'error': 'Please log in again.'}), 401
+    worker_ids = {g.user['workerId']} if g.user.get('workerId') else set()
+    conn = get_read_connection()
+    try:
+        worker_ids.update(r['id'] for r in db_execute(conn, 'SELECT id FROM workers WHERE user_id = ? AND deleted_at IS NULL',
+                                                      (user_id,)).fetchall())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+    channels = [events.user_channel(user_id)] + [events.worker_channel(w) for w in sorted(worker_ids)]
+    subscription = events.get_broker().subscribe_limited(channels)
+    if subscription is None:
+        return jsonify({'error': 'Too many live update streams; try again later'}), 503
+    response = Response(events.sse_stream(subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@routes.route('/api/bookings/user', methods=['GET'])
 def get_user_bookings():
-    user_id = request.args.get('userId')
-    conn = get_db_connection()
+    user_id = sessions.request_user_id(request.args.get('userId'))
+    if not user_id:
+        return jsonify({'error': 'Please log in again.'}), 401
+    conn = get_read_connection()
     try:
         bookings = db_execute(conn, '''
-            SELECT b.*, u.name as worker_name
+            SELECT b.*, u.name as worker_name, rv.id as review_id
             FROM bookings b
             JOIN workers w ON b.worker_id = w.id
             JOIN users u ON w.user_id = u.id
+            LEFT JOIN reviews rv ON rv.booking_id = b.id
             WHERE b.user_id = ?
             ORDER BY b.created_at DESC
         ''', (user_id,)).fetchall()
@@ -471,6 +669,7 @@ def get_user_bookings():
                 'slot': b['slot'],
                 'price': b['price'],
                 'status': b['status'],
+                'reviewed': b['review_id'] is not None,
                 'createdAt': b['created_at']
             })
         return jsonify(res)
@@ -479,9 +678,9 @@ def get_user_bookings():
     finally:
         conn.close()
 
-@app.route('/api/bookings/worker/<worker_id>', methods=['GET'])
+@routes.route('/api/bookings/worker/<worker_id>', methods=['GET'])
 def get_worker_bookings(worker_id):
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         bookings = db_execute(conn, '''
             SELECT b.*, u.name as user_name
@@ -508,34 +707,121 @@ def get_worker_bookings(worker_id):
     finally:
         conn.close()
 
-@app.route('/api/bookings/<booking_id>/status', methods=['PATCH'])
+# Status changes that lose a race re-read the booking and try again this many times
+STATUS_UPDATE_ATTEMPTS = 3
+
+@routes.route('/api/bookings/<booking_id>/status', methods=['PATCH'])
 def update_booking_status(booking_id):
     data = request.json
+    status = data.get('status')
     conn = get_db_connection()
     try:
-        db_execute(conn, 'UPDATE bookings SET status = ? WHERE id = ?', (data.get('status'), booking_id))
+        for _ in range(STATUS_UPDATE_ATTEMPTS):
+            booking = db_execute(conn, 'SELECT user_id, worker_id, service_key, slot, price, status, created_at FROM bookings WHERE id = ?', (booking_id,)).fetchone()
+            if not booking or booking['status'] == status:
+                # Nothing changes, so there are no counter or rollup deltas to record
+                return jsonify({'success': True})
+            # Compare-and-set: only the request that still sees the status it read applies the
+            # change (and its deltas); a concurrent change makes this match no rows
+            if db_execute(conn, "UPDATE bookings SET status = ? WHERE id = ? AND COALESCE(status, '') = ?",
+                          (status, booking_id, booking['status'] or '')).rowcount:
+                break
+            conn.rollback()
+        else:
+            return jsonify({'error': 'This booking is being updated by someone else. Please try again.'}), 409
+        counters.defer_booking_status_changed(conn, booking['worker_id'], booking['price'], booking['status'], status)
+        analytics.defer_booking_status_changed(conn, booking, status)
+        # Completed/cancelled bookings free their slot; reopening one has to win it back
+        was_released = booking['status'] in slots.RELEASED_STATUSES
+        if status in slots.RELEASED_STATUSES and not was_released:
+            slots.release_slot(conn, booking_id)
+        elif was_released and status not in slots.RELEASED_STATUSES and booking['slot']:
+            slots.reserve_slot(conn, booking['worker_id'], booking['slot'], booking_id)
         conn.commit()
+        worker_profile_cache.invalidate(booking['worker_id'])
+        events.publish_booking('booking.status', booking_id, booking['user_id'], booking['worker_id'],
+                               status=status, previous=booking['status'], slot=booking['slot'])
         return jsonify({'success': True})
+    except IntegrityError:
+        conn.rollback()
+        return jsonify({'error': 'This slot has been booked by someone else.'}), 409
     except Exception as e:
         conn.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/admin/stats', methods=['GET'])
-def get_admin_stats():
+@routes.route('/api/reviews', methods=['POST'])
+def create_review():
+    data = request.json or {}
+    user_id = sessions.request_user_id(data.get('userId'))
+    if not user_id:
+        return jsonify({'error': 'Please log in again.'}), 401
     conn = get_db_connection()
     try:
-        users = db_execute(conn, 'SELECT COUNT(*) as cnt FROM users').fetchone()['cnt']
-        workers = db_execute(conn, 'SELECT COUNT(*) as cnt FROM workers').fetchone()['cnt']
-        bookings = db_execute(conn, 'SELECT COUNT(*) as cnt FROM bookings').fetchone()['cnt']
-        earnings = db_execute(conn, "SELECT SUM(price) as total FROM bookings WHERE status = 'completed'").fetchone()['total'] or 0
+        review_id, worker_id = reviews.add_review(conn, data.get('bookingId'), user_id,
+                                                  data.get('rating'), data.get('comment'))
+        search = search_projection.refresh_workers(conn, [worker_id])
+        conn.commit()
+        search.publish()
+        worker_profile_cache.invalidate(worker_id)
+        return jsonify({'success': True, 'reviewId': review_id})
+    except reviews.ReviewError as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), e.status
+    except IntegrityError:
+        conn.rollback()
+        return jsonify({'error': 'This booking has already been reviewed.'}), 409
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Newest first, ?limit=N&cursor=... (next cursor in X-Next-Cursor)
+@routes.route('/api/workers/<worker_id>/reviews', methods=['GET'])
+def get_worker_reviews(worker_id):
+    conn = get_read_connection()
+    try:
+        limit = page_limit(request.args.get('limit', 20))
+        sql, params = keyset_query('''
+            SELECT r.id, r.booking_id, r.user_id, r.rating, r.comments, r.created_at, u.name as user_name
+            FROM reviews r
+            JOIN users u ON r.user_id = u.id
+            WHERE r.worker_id = ?
+        ''', [worker_id], 'r.created_at', 'r.id', request.args.get('cursor'), limit)
+        rows, next_cursor = split_page(db_execute(conn, sql, params).fetchall(), limit)
+        response = jsonify([{
+            '_id': r['id'],
+            'bookingId': r['booking_id'],
+            'userId': r['user_id'],
+            'userName': r['user_name'],
+            'rating': r['rating'],
+            'comment': r['comments'],
+            'createdAt': r['created_at']
+        } for r in rows])
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?limit={limit}&cursor={next_cursor}>; rel="next"'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@routes.route('/api/admin/stats', methods=['GET'])
+def get_admin_stats():
+    conn = get_read_connection()
+    try:
+        totals = counters.get_counters(conn)
         
         return jsonify({
-            'totalUsers': users,
-            'totalWorkers': workers,
-            'totalBookings': bookings,
-            'totalEarnings': earnings,
+            'totalUsers': int(totals.get(counters.USERS, 0)),
+            'totalWorkers': int(totals.get(counters.WORKERS, 0)),
+            'totalBookings': int(totals.get(counters.BOOKINGS, 0)),
+            'totalEarnings': totals.get(counters.REVENUE, 0),
             'pendingVerifications': 0
         })
     except Exception as e:
@@ -543,89 +829,290 @@ def get_admin_stats():
     finally:
         conn.close()
 
-@app.route('/api/admin/bookings', methods=['GET'])
-def get_all_bookings():
+@routes.route('/api/admin/stats/rebuild', methods=['POST'])
+def rebuild_admin_stats():
     conn = get_db_connection()
     try:
-        bookings = db_execute(conn, '''
-            SELECT b.*, u.name as user_name
-            FROM bookings b
-            JOIN users u ON b.user_id = u.id
-            ORDER BY b.created_at DESC
-        ''').fetchall()
-        res = []
-        for b in bookings:
-            res.append({
-                '_id': b['id'],
-                'userId': b['user_id'],
-                'workerId': b['worker_id'],
-                'serviceKey': b['service_key'],
-                'slot': b['slot'],
-                'price': b['price'],
-                'status': b['status'],
-                'userName': b['user_name'],
-                'createdAt': b['created_at']
-            })
-        return jsonify(res)
+        totals = counters.rebuild_counters(conn)
+        conn.commit()
+        worker_profile_cache.invalidate()
+        return jsonify({'success': True, 'totals': totals})
     except Exception as e:
+        conn.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/admin/users', methods=['GET'])
-def get_all_users():
+# Booking trends from the time-bucketed rollups:
+#   ?by=service|worker&grain=hour|day|week&from=2026-01-01&to=2026-01-31[&service=plumber | &worker=<id>]
+@routes.route('/api/admin/analytics/bookings', methods=['GET'])
+def get_booking_analytics():
+    try:
+        dim, grain, first, last, key = analytics.parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conn = get_read_connection()
+    try:
+        return jsonify(analytics.range_report(conn, dim, grain, first, last, key))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@routes.route('/api/admin/analytics/rebuild', methods=['POST'])
+def rebuild_booking_analytics():
     conn = get_db_connection()
     try:
-        users = db_execute(conn, 'SELECT * FROM users ORDER BY created_at DESC').fetchall()
-        res = []
-        for u in users:
-            res.append({
-                '_id': u['id'],
-                'name': u['name'],
-                'email': u['email'],
-                'phone': u['phone'],
-                'role': u['role'],
-                'createdAt': u['created_at']
-            })
-        return jsonify(res)
+        rows = analytics.rebuild(conn)
+        conn.commit()
+        return jsonify({'success': True, 'rows': rows})
     except Exception as e:
+        conn.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/admin/users/<user_id>', methods=['DELETE'])
-def delete_user(user_id):
+@routes.route('/api/admin/reviews/recompute', methods=['POST'])
+def recompute_review_ratings():
     conn = get_db_connection()
     try:
-        db_execute(conn, 'DELETE FROM bookings WHERE user_id = ?', (user_id,))
-        workers = db_execute(conn, 'SELECT id FROM workers WHERE user_id = ?', (user_id,)).fetchall()
-        for w in workers:
-            db_execute(conn, 'DELETE FROM bookings WHERE worker_id = ?', (w['id'],))
-        db_execute(conn, 'DELETE FROM workers WHERE user_id = ?', (user_id,))
-        db_execute(conn, 'DELETE FROM users WHERE id = ?', (user_id,))
+        updated = reviews.recompute_ratings(conn)
+        search_projection.rebuild(conn)
         conn.commit()
-        return jsonify({'success': True})
+        worker_snapshot.invalidate()
+        worker_profile_cache.invalidate()
+        return jsonify({'success': True, 'workers': updated})
     except Exception as e:
         conn.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
-@app.route('/api/admin/workers/<worker_id>', methods=['DELETE'])
-def delete_worker(worker_id):
+@routes.route('/api/admin/cache', methods=['GET'])
+def get_cache_stats():
+    return jsonify({c.name: c.stats() for c in (services_cache, worker_profile_cache)})
+
+@routes.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Sampling profiler for slow requests: POST {"slowMs": 250} to enable, {"slowMs": 0} to disable
+@routes.route('/api/admin/profiler', methods=['GET', 'POST'])
+def profiler_settings():
+    if request.method == 'POST':
+        try:
+            metrics.profiler.configure((request.json or {}).get('slowMs', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'slowMs must be a number'}), 400
+    return jsonify(metrics.profiler.info())
+
+# Background job queue: depth by status, and requeueing of jobs that exhausted their retries
+@routes.route('/api/admin/jobs', methods=['GET'])
+def get_job_queue():
     conn = get_db_connection()
     try:
-        db_execute(conn, 'DELETE FROM bookings WHERE worker_id = ?', (worker_id,))
-        db_execute(conn, 'DELETE FROM workers WHERE id = ?', (worker_id,))
+        return jsonify(dict(jobs.queue_info(conn), worker=jobs.worker_info()))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@routes.route('/api/admin/jobs/retry', methods=['POST'])
+def retry_dead_jobs():
+    conn = get_db_connection()
+    try:
+        requeued = jobs.retry_dead(conn, (request.json or {}).get('kind') if request.is_json else None)
         conn.commit()
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'requeued': requeued})
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Bulk onboarding: the request body is streamed through bulk.import_rows in batches
+@routes.route('/api/admin/import/<kind>', methods=['POST'])
+def bulk_import(kind):
+    if kind not in bulk.KINDS:
+        return jsonify({'error': f'Unknown kind: {kind}'}), 404
+    fmt = request.args.get('format') or ('ndjson' if 'json' in (request.mimetype or '') else 'csv')
+    conn = get_db_connection()
+    try:
+        report = bulk.import_rows(conn, kind, bulk.read_rows(request.stream, fmt))
+        if kind == 'workers':
+            load_geo_index(worker_geo_index, conn)
+            service_resolver.load(conn)
+        worker_profile_cache.invalidate()
+        return jsonify(report)
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@routes.route('/api/admin/export/<kind>', methods=['GET'])
+def bulk_export(kind):
+    if kind not in bulk.KINDS:
+        return jsonify({'error': f'Unknown kind: {kind}'}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+
+    def generate():
+        conn = get_read_connection()
+        try:
+            yield from bulk.export_lines(conn, kind, fmt)
+        finally:
+            conn.close()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    return response
+
+def serialize_admin_booking(b):
+    return {
+        '_id': b['id'],
+        'userId': b['user_id'],
+        'workerId': b['worker_id'],
+        'serviceKey': b['service_key'],
+        'slot': b['slot'],
+        'price': b['price'],
+        'status': b['status'],
+        'userName': b['user_name'],
+        'createdAt': b['created_at']
+    }
+
+def serialize_admin_user(u):
+    return {
+        '_id': u['id'],
+        'name': u['name'],
+        'email': u['email'],
+        'phone': u['phone'],
+        'role': u['role'],
+        'createdAt': u['created_at']
+    }
+
+# Shared by the admin list endpoints:
+#   ?format=ndjson         stream every row as newline-delimited JSON
+#   ?limit=N[&cursor=...]  one keyset page; the next cursor is in X-Next-Cursor
+#   neither                the full list, as before
+def admin_list(query, created_col, id_col, serialize):
+    if request.args.get('format') == 'ndjson':
+        return Response(ndjson_lines(get_read_connection, query + f' ORDER BY {created_col} DESC, {id_col} DESC', (), serialize),
+                        mimetype='application/x-ndjson')
+
+    paginate = 'limit' in request.args or 'cursor' in request.args
+    conn = get_read_connection()
+    try:
+        next_cursor = None
+        if paginate:
+            limit = page_limit(request.args.get('limit'))
+            sql, params = keyset_query(query, [], created_col, id_col, request.args.get('cursor'), limit)
+            rows, next_cursor = split_page(db_execute(conn, sql, params).fetchall(), limit)
+        else:
+            rows = db_execute(conn, query + f' ORDER BY {created_col} DESC').fetchall()
+        response = jsonify([serialize(r) for r in rows])
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?limit={limit}&cursor={next_cursor}>; rel="next"'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@routes.route('/api/admin/bookings', methods=['GET'])
+def get_all_bookings():
+    return admin_list('''
+        SELECT b.*, u.name as user_name
+        FROM bookings b
+        JOIN users u ON b.user_id = u.id
+        WHERE 1 = 1
+    ''', 'b.created_at', 'b.id', serialize_admin_booking)
+
+@routes.route('/api/admin/users', methods=['GET'])
+def get_all_users():
+    return admin_list('SELECT * FROM users WHERE deleted_at IS NULL', 'created_at', 'id', serialize_admin_user)
+
+# Set-based cascade over bookings, reviews, slots, workers and users (see cascade.py);
+# ?mode=soft hides the account now and leaves the purge to the job worker
+def delete_accounts(user_ids=(), worker_ids=()):
+    mode = request.args.get('mode') or cascade.DELETE_MODE
+    if mode not in ('hard', 'soft'):
+        return jsonify({'error': 'mode must be hard or soft'}), 400
+    conn = get_db_connection()
+    try:
+        if mode == 'soft':
+            result = cascade.soft_delete_accounts(conn, user_ids, worker_ids)
+        else:
+            result = cascade.delete_accounts(conn, user_ids, worker_ids)
+        conn.commit()
+        result['search'].publish()
+        for worker_id in result['workers']:
+            worker_geo_index.remove(worker_id)
+            worker_profile_cache.invalidate(worker_id)
+        for worker_id in result.get('rated', []):
+            worker_profile_cache.invalidate(worker_id)
+        return jsonify({'success': True, 'mode': mode, 'workers': len(result['workers'])})
     except Exception as e:
         conn.rollback()
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
+@routes.route('/api/admin/users/<user_id>', methods=['DELETE'])
+def delete_user(user_id):
+    return delete_accounts(user_ids=[user_id])
+
+@routes.route('/api/admin/workers/<worker_id>', methods=['DELETE'])
+def delete_worker(worker_id):
+    return delete_accounts(worker_ids=[worker_id])
+
+def create_app():
+    started = time.perf_counter()
+    app = Flask(__name__, static_folder='public', static_url_path='')
+    CORS(app)
+    metrics.init_app(app)
+    responses.init_app(app)
+    jobs.init_app(app)
+    replicas.init_app(app)
+    sessions.init_app(app)
+    app.add_url_rule('/', 'serve_index', serve_index)
+    app.register_blueprint(routes)
+    boot_timings['app'] = time.perf_counter() - started
+
+    state = 'skipped'
+    if SCHEMA_INIT != 'off':
+        started = time.perf_counter()
+        state = init_db()
+        boot_timings['schema'] = time.perf_counter() - started
+    boot_timings['total'] = time.perf_counter() - BOOT_STARTED
+    logging.info('Boot: ' + ', '.join(f'{k} {v * 1000:.0f} ms' for k, v in boot_timings.items()) + f' (schema {state})')
+    return app
+
+def __getattr__(name):
+    # `gunicorn app:app` and `from app import app` build the application on first use;
+    # importing this module alone (tools, benchmarks) does no database work
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
+    # python app.py            -> development server on $PORT
+    # python app.py init-db    -> create, migrate and seed the database, then exit
+    if sys.argv[1:] == ['init-db']:
+        state = init_db()
+        print(f'Schema: {state}')
+        sys.exit(1 if state == 'failed' else 0)
+    app = create_app()
     mode = "PostgreSQL" if IS_POSTGRES else "SQLite"
     print(f"Starting Flask server with {mode} DB...")
     port = int(os.environ.get('PORT', 80))
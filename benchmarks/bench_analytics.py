@@ -0,0 +1,61 @@
+# Weekly bookings per service: GROUP BY over bookings vs. a range read of booking_rollups.
+#
+#   python benchmarks/bench_analytics.py [--bookings 20000 200000] [--requests 50]
+#
+# Uses a throwaway SQLite file per size unless DATABASE_URL points at Postgres.
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+FROM, TO = '2025-12-01', '2025-12-31'
+
+
+def timeit(fn, n):
+    fn()
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def run(n_bookings, requests):
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    import datagen
+    datagen.load(datagen.generate(n_users=2000, n_workers=1000, n_bookings=n_bookings, n_reviews=0, days=365))
+    import analytics
+    from db import get_db_connection, db_execute
+
+    conn = get_db_connection()
+    try:
+        scan = analytics._grouped(analytics.SERVICE, 'week', 'created_at >= ? AND created_at < ?')
+        t_scan = timeit(lambda: db_execute(conn, scan, (FROM, '2026-01-01')).fetchall(), requests)
+        window = analytics.parse_range({'by': 'service', 'grain': 'week', 'from': FROM, 'to': TO})
+        t_rollup = timeit(lambda: analytics.range_report(conn, *window), requests)
+    finally:
+        conn.close()
+    print(f'{n_bookings:>10} {t_scan * 1000:>12.2f} {t_rollup * 1000:>12.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bookings', type=int, nargs='+', default=[20000, 200000])
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+    print(f"{'bookings':>10} {'group by ms':>12} {'rollups ms':>12}")
+    for n in args.bookings:
+        # Each size gets a fresh process so db.py picks up its own SQLITE_PATH
+        if len(args.bookings) > 1:
+            os.system(f'{sys.executable} {os.path.abspath(__file__)} --bookings {n} --requests {args.requests} | tail -n 1')
+        else:
+            run(n, args.requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Scalar haversine loop (as get_workers used to run it) vs. the batched ranking engine.
+#
+#   python benchmarks/bench_haversine.py [--sizes 1000 10000 100000] [--k 20]
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from app import haversine  # noqa: E402
+from ranking import HAS_NUMPY, WorkerArrays  # noqa: E402
+
+
+def make_rows(n, rnd):
+    return [{'lat': 12.8 + rnd.random() * 0.4, 'lng': 77.4 + rnd.random() * 0.4,
+             'rating': round(rnd.random() * 5, 1), 'cost': rnd.randint(200, 900)} for _ in range(n)]
+
+
+def scalar(rows, lat, lng, k):
+    dists = [haversine(lat, lng, r['lat'], r['lng']) for r in rows]
+    return sorted(range(len(rows)), key=dists.__getitem__)[:k]
+
+
+def batched(rows, lat, lng, k):
+    arrays = WorkerArrays.from_rows(rows)
+    arrays.compute_distances(lat, lng)
+    return arrays.top_k('distance', k)
+
+
+def timeit(fn, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--k', type=int, default=20)
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    lat, lng = '12.97', '77.59'
+    print(f"backend: {'numpy' if HAS_NUMPY else 'pure python'}")
+    print(f"{'workers':>8} {'scalar ms':>10} {'batched ms':>11} {'speedup':>8}")
+    for n in args.sizes:
+        rows = make_rows(n, rnd)
+        assert scalar(rows, lat, lng, args.k) == batched(rows, lat, lng, args.k)
+        t_scalar = timeit(scalar, rows, lat, lng, args.k)
+        t_batched = timeit(batched, rows, lat, lng, args.k)
+        print(f'{n:>8} {t_scalar * 1000:>10.2f} {t_batched * 1000:>11.2f} {t_scalar / t_batched:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
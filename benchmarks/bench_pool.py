@@ -0,0 +1,71 @@
+# Compare /api/workers throughput with and without the connection pool.
+#
+#   python benchmarks/bench_pool.py --workers 2000 --requests 500
+#
+# Each mode runs in a fresh interpreter because db.py reads DB_POOL at import time.
+# Uses a throwaway SQLite file unless DATABASE_URL points at Postgres.
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+URL = '/api/workers?service=plumber&lat=12.97&lng=77.59'
+
+
+def seed(n_workers):
+    # Through bulk.py like the other benchmarks, so service keys, slots and the search
+    # projection are filled and the timed query ranks real rows
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import datagen
+    datagen.load(datagen.generate(n_users=n_workers, n_workers=n_workers, n_bookings=0, n_reviews=0))
+
+
+def run(n_requests):
+    sys.path.insert(0, ROOT)
+    from app import app
+
+    client = app.test_client()
+    workers = client.get(URL).get_json()
+    assert workers, 'seeded database returned no workers'
+    start = time.perf_counter()
+    for _ in range(n_requests):
+        resp = client.get(URL)
+        assert resp.status_code == 200
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'requests': n_requests, 'rows': len(workers), 'seconds': elapsed, 'rps': n_requests / elapsed}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--phase', choices=['seed', 'run'])
+    args = parser.parse_args()
+
+    if args.phase == 'seed':
+        return seed(args.workers)
+    if args.phase == 'run':
+        return run(args.requests)
+
+    os.environ.setdefault('SESSION_SECRET', 'bench')  # tokens only live as long as the run
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    subprocess.run([sys.executable, __file__, '--phase', 'seed', '--workers', str(args.workers)], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    results = {}
+    for label, flag in (('connect_per_request', '0'), ('pooled', '1')):
+        out = subprocess.run([sys.executable, __file__, '--phase', 'run', '--requests', str(args.requests)],
+                             env=dict(env, DB_POOL=flag), check=True, capture_output=True, text=True).stdout
+        results[label] = json.loads(out.strip().splitlines()[-1])
+        print(f"{label:>20}: {results[label]['rps']:.1f} req/s ({results[label]['rows']} workers per response)")
+    print(f"{'speedup':>20}: {results['pooled']['rps'] / results['connect_per_request']['rps']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
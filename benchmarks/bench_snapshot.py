@@ -0,0 +1,62 @@
+# /api/workers served from the worker_search table vs. the shared memory-mapped snapshot.
+#
+#   python benchmarks/bench_snapshot.py [--workers 20000] [--requests 200]
+#
+# Uses a throwaway SQLite file unless DATABASE_URL points at Postgres.
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+if not os.environ.get('DATABASE_URL'):
+    os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('SESSION_SECRET', 'bench')  # tokens only live as long as the run
+
+QUERIES = [
+    '/api/workers?service=plumber&lat=12.97&lng=77.59&limit=20',
+    '/api/workers?lat=12.97&lng=77.59&radius_km=5&sort=rating&limit=20',
+    '/api/workers?service=all&sort=cost&limit=20',
+    '/api/workers?service=electrician&lat=12.97&lng=77.59&sort=distance&limit=10',
+    '/api/workers?lat=12.97&lng=77.59&radius_km=10&sort=relevance&min_rating=4&max_cost=600&facets=1&limit=20',
+]
+
+
+def timeit(client, url, n):
+    assert client.get(url).status_code == 200
+    start = time.perf_counter()
+    for _ in range(n):
+        client.get(url)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    import datagen
+    datagen.load(datagen.generate(n_users=args.workers, n_workers=args.workers, n_bookings=0, n_reviews=0))
+    from app import app
+    import worker_snapshot
+    from ranking import HAS_NUMPY
+
+    client = app.test_client()
+    print(f"backend: {'numpy' if HAS_NUMPY else 'pure python'}, {args.workers} workers")
+    print(f"{'query':<100} {'table ms':>9} {'snapshot ms':>12}")
+    for url in QUERIES:
+        worker_snapshot.WORKER_SNAPSHOT = 'off'
+        t_table = timeit(client, url, args.requests)
+        worker_snapshot.WORKER_SNAPSHOT = 'on'
+        t_snapshot = timeit(client, url, args.requests)
+        print(f'{url:<100} {t_table * 1000:>9.2f} {t_snapshot * 1000:>12.2f}')
+    info = worker_snapshot.snapshot.info()
+    print(f"snapshot: {info['rows']} rows, {os.path.getsize(worker_snapshot.snapshot.path) / 1e6:.1f} MB shared by all processes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# Deterministic synthetic dataset: users, workers scattered over a city bounding box,
+# bookings and reviews.
+#
+#   python benchmarks/datagen.py --users 5000 --workers 2000 --bookings 20000 --reviews 5000
+#   python benchmarks/datagen.py --out /tmp/dataset    # write CSV/NDJSON for `python bulk.py import`
+#
+# Without --out the rows are loaded into the configured database (SQLITE_PATH / DATABASE_URL)
+# through bulk.py. The same --seed always produces the same ids, phones and coordinates, so
+# benchmark runs on different commits see identical data.
+import os
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SERVICES = ['ac_service', 'plumber', 'electrician', 'cleaning', 'carpenter', 'painter', 'pest_control', 'gardener']
+SLOT_LABELS = ['9:00 AM - 10:00 AM', '10:00 AM - 11:00 AM', '11:00 AM - 12:00 PM', '2:00 PM - 3:00 PM',
+               '3:00 PM - 4:00 PM', '4:00 PM - 5:00 PM', '6:00 PM - 7:00 PM']
+STATUSES = ['confirmed'] * 2 + ['accepted'] * 2 + ['completed'] * 5 + ['cancelled']
+
+# Bengaluru, where the existing demo coordinates are
+DEFAULT_BBOX = (12.85, 77.45, 13.10, 77.75)
+
+NOW = datetime(2026, 1, 1)
+
+
+def user_id(i):
+    return f'bench_user_{i}'
+
+
+def worker_id(i):
+    return f'bench_worker_{i}'
+
+
+def generate(n_users, n_workers, n_bookings, n_reviews, bbox=DEFAULT_BBOX, seed=42, days=90):
+    rnd = random.Random(seed)
+    min_lat, min_lng, max_lat, max_lng = bbox
+
+    users = [{'id': user_id(i), 'name': f'User {i}', 'phone': f'8{i:09d}', 'email': f'user{i}@example.com',
+              'password': 'Password@123', 'role': 'user'} for i in range(n_users)]
+
+    workers = []
+    for i in range(n_workers):
+        # A few dense neighbourhoods plus uniform background, like a real city
+        if rnd.random() < 0.6:
+            lat = rnd.gauss((min_lat + max_lat) / 2, (max_lat - min_lat) / 8)
+            lng = rnd.gauss((min_lng + max_lng) / 2, (max_lng - min_lng) / 8)
+        else:
+            lat, lng = rnd.uniform(min_lat, max_lat), rnd.uniform(min_lng, max_lng)
+        labels = rnd.sample(SLOT_LABELS, rnd.randint(2, len(SLOT_LABELS)))
+        cost = rnd.randrange(200, 1500, 50)
+        workers.append({
+            'id': worker_id(i), 'name': f'Worker {i}', 'phone': f'9{i:09d}', 'email': None,
+            'password': 'Password@123', 'service': rnd.choice(SERVICES), 'cost': cost,
+            'lat': round(min(max(lat, min_lat), max_lat), 6), 'lng': round(min(max(lng, min_lng), max_lng), 6),
+            'bio': 'Synthetic benchmark worker', 'gender': rnd.choice(['male', 'female']),
+            'experience': rnd.randint(0, 20),
+            'slots': {label: {'available': True, 'price': cost} for label in sorted(labels)},
+        })
+
+    bookings = []
+    if users and workers:
+        for i in range(n_bookings):
+            w = workers[rnd.randrange(n_workers)]
+            created = NOW - timedelta(seconds=rnd.randrange(days * 86400))
+            bookings.append({
+                'id': f'bench_booking_{i}', 'user_id': user_id(rnd.randrange(n_users)), 'worker_id': w['id'],
+                'service_key': w['service'], 'slot': rnd.choice(list(w['slots'])), 'price': w['cost'],
+                'status': rnd.choice(STATUSES), 'address': f'{rnd.randint(1, 999)} Main Road',
+                'lat': w['lat'], 'lng': w['lng'], 'notes': None, 'created_at': created.strftime('%Y-%m-%d %H:%M:%S'),
+            })
+
+    completed = [b for b in bookings if b['status'] == 'completed']
+    reviews = []
+    for i, b in enumerate(rnd.sample(completed, min(n_reviews, len(completed)))):
+        reviews.append({
+            'id': f'bench_review_{i}', 'booking_id': b['id'], 'user_id': b['user_id'], 'worker_id': b['worker_id'],
+            'rating': rnd.choice([3, 4, 4, 5, 5, 5]), 'comments': 'Synthetic review',
+            'created_at': b['created_at'],
+        })
+    return {'users': users, 'workers': workers, 'bookings': bookings, 'reviews': reviews}
+
+
+def load(data):
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('SESSION_SECRET', 'bench')  # tokens only live as long as the run
+    from app import app  # noqa: F401  (runs init_db)
+    import bulk
+    from db import get_db_connection
+    from reviews import recompute_ratings
+    import search_projection
+
+    conn = get_db_connection()
+    try:
+        report = {}
+        for kind in bulk.KINDS:
+            report[kind] = bulk.import_rows(conn, kind, enumerate(data[kind], 1))
+        columns = ['id', 'booking_id', 'user_id', 'worker_id', 'rating', 'comments', 'created_at']
+        for i in range(0, len(data['reviews']), bulk.BATCH_SIZE):
+            part = data['reviews'][i:i + bulk.BATCH_SIZE]
+            bulk.insert_many(conn, 'reviews', columns, [tuple(r[c] for c in columns) for r in part],
+                             'ON CONFLICT (id) DO NOTHING')
+        recompute_ratings(conn, [w['id'] for w in data['workers']])
+        search = search_projection.refresh_workers(conn, [w['id'] for w in data['workers']])
+        conn.commit()
+        search.publish()
+        report['reviews'] = {'inserted': len(data['reviews'])}
+        return report
+    finally:
+        conn.close()
+
+
+def write_files(data, out):
+    import csv
+    os.makedirs(out, exist_ok=True)
+    for kind in ('users', 'workers'):
+        rows = data[kind]
+        with open(os.path.join(out, f'{kind}.csv'), 'w', newline='') as f:
+            if rows:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow(dict(row, slots=json.dumps(row['slots'])) if 'slots' in row else row)
+    for kind in ('bookings', 'reviews'):
+        with open(os.path.join(out, f'{kind}.ndjson'), 'w') as f:
+            for row in data[kind]:
+                f.write(json.dumps(row) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic benchmark dataset')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--bbox', type=float, nargs=4, default=DEFAULT_BBOX, metavar=('MIN_LAT', 'MIN_LNG', 'MAX_LAT', 'MAX_LNG'))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write files to this directory instead of loading the database')
+    args = parser.parse_args()
+
+    data = generate(args.users, args.workers, args.bookings, args.reviews, tuple(args.bbox), args.seed)
+    if args.out:
+        write_files(data, args.out)
+        print(json.dumps({kind: len(rows) for kind, rows in data.items()}))
+    else:
+        report = load(data)
+        print(json.dumps({kind: r['inserted'] for kind, r in report.items()}))
+
+
+if __name__ == '__main__':
+    main()
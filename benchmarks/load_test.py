@@ -0,0 +1,183 @@
+# Concurrent HTTP load test, and a gunicorn sync worker vs. gthread worker comparison.
+#
+#   python benchmarks/load_test.py --url http://127.0.0.1:8000/api/workers?service=plumber -c 200 -d 10
+#   python benchmarks/load_test.py --compare -c 200 -d 10
+#
+# --compare loads a synthetic dataset (benchmarks/datagen.py) into a throwaway SQLite
+# database (unless DATABASE_URL is set), starts one gunicorn process with the sync worker
+# and one with the gthread worker of the Procfile in turn, and drives both with the same
+# load as a logged-in customer.
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_load(urls, concurrency, duration, headers=None):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(n):
+        conn = None
+        i = n
+        while time.perf_counter() < stop_at:
+            url = urlsplit(urls[i % len(urls)])
+            i += 1
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+                start = time.perf_counter()
+                conn.request('GET', url.path + ('?' + url.query if url.query else ''), headers=headers or {})
+                resp = conn.getresponse()
+                resp.read()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if resp.status == 200:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn = None
+
+    threads = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / wall,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'concurrency': concurrency,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def datagen_phone(i):
+    # Customer phones as benchmarks/datagen.py generates them
+    return f'8{i:09d}'
+
+
+def login(port, phone):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('POST', '/api/auth/login', json.dumps({'role': 'user', 'phone': phone}),
+                 {'Content-Type': 'application/json'})
+    body = json.loads(conn.getresponse().read())
+    conn.close()
+    return body['token']
+
+
+def check(port, urls, headers):
+    # Refuse to time empty pages: every URL must return a non-empty list
+    for url in urls:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        parts = urlsplit(url)
+        conn.request('GET', parts.path + '?' + parts.query if parts.query else parts.path, headers=headers)
+        resp = conn.getresponse()
+        body = json.loads(resp.read())
+        conn.close()
+        if resp.status != 200 or not body:
+            raise RuntimeError(f'{url} returned {resp.status} with no rows; is the dataset loaded?')
+
+
+def compare(concurrency, duration, n_workers):
+    os.environ.setdefault('SESSION_SECRET', 'bench')  # tokens only live as long as the run
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'load.db')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'datagen.py'), '--users', str(n_workers),
+                    '--workers', str(n_workers), '--bookings', str(n_workers * 5), '--reviews', '0'],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+
+    servers = {
+        'sync': ['gunicorn', 'app:app', '--workers', '1', '--bind'],
+        'gthread --threads 32': ['gunicorn', 'app:app', '--workers', '1', '--worker-class', 'gthread', '--threads', '32',
+                                 '--bind'],
+    }
+    results = {}
+    for label, cmd in servers.items():
+        port = free_port()
+        proc = subprocess.Popen(cmd + [f'127.0.0.1:{port}'], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(port)
+            base = f'http://127.0.0.1:{port}'
+            headers = {'Authorization': 'Bearer ' + login(port, datagen_phone(1))}
+            urls = [f'{base}/api/workers?service=plumber&lat=12.97&lng=77.59&limit=20',
+                    f'{base}/api/bookings/user']
+            check(port, urls, headers)
+            run_load(urls, min(concurrency, 10), 1, headers)  # warm-up
+            results[label] = run_load(urls, concurrency, duration, headers)
+        finally:
+            proc.terminate()
+            proc.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', action='append', help='URL to request (repeatable)')
+    parser.add_argument('-c', '--concurrency', type=int, default=100)
+    parser.add_argument('-d', '--duration', type=float, default=10)
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--workers', type=int, default=2000, help='workers to seed for --compare')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results only')
+    args = parser.parse_args()
+
+    if args.compare:
+        results = compare(args.concurrency, args.duration, args.workers)
+    elif args.url:
+        results = {'target': run_load(args.url, args.concurrency, args.duration)}
+    else:
+        parser.error('pass --url or --compare')
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'server':<26} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for label, r in results.items():
+        print(f"{label:<26} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
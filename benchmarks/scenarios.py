@@ -0,0 +1,306 @@
+# Scripted scenarios against a synthetic dataset, with machine-readable results for
+# tracking regressions from one commit to the next.
+#
+#   python benchmarks/scenarios.py --out results.json                 # Flask test client, fresh SQLite dataset
+#   python benchmarks/scenarios.py --target gunicorn -c 16 --out results.json
+#   python benchmarks/scenarios.py --baseline main.json               # exit 1 if p95 regressed
+#
+# Scenarios:
+#   search   GET /api/workers by service and location (radius, limit and sort variants)
+#   booking  login -> search -> worker profile -> book a slot -> complete it -> list my bookings
+#   admin    dashboard stats plus the first pages of the bookings and users lists
+#   login    a storm of user/worker/admin logins
+#
+# Unless DATABASE_URL is set, each run generates its own SQLite dataset with datagen.py
+# (same seed every time), so numbers are comparable across commits.
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import percentile, free_port, wait_for  # noqa: E402
+import datagen  # noqa: E402
+
+ROOT = datagen.ROOT
+SCENARIOS = ('search', 'booking', 'admin', 'login')
+
+
+class ClientTarget:
+    # In-process Flask test client
+    def __init__(self):
+        sys.path.insert(0, ROOT)
+        from app import app
+        logging.getLogger().setLevel(logging.WARNING)  # per-login INFO lines would dominate the timings
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        resp = self.client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_json(silent=True), {k.lower(): v for k, v in resp.headers.items()}
+
+    def close(self):
+        pass
+
+
+class HttpTarget:
+    # A local gunicorn; one keep-alive connection per client thread
+    def __init__(self, workers, env):
+        self.port = free_port()
+        self.proc = subprocess.Popen(['gunicorn', 'app:app', '--workers', str(workers), '--threads', '4',
+                                      '--bind', f'127.0.0.1:{self.port}'],
+                                     cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._local = threading.local()
+        wait_for(self.port)
+
+    def request(self, method, path, body=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self._local.conn = None
+            raise
+        headers = {k.lower(): v for k, v in resp.getheaders()}
+        try:
+            return resp.status, json.loads(data) if data else None, headers
+        except ValueError:
+            return resp.status, None, headers
+
+    def close(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.steps = {}  # step -> [latencies]
+        self.errors = {}
+
+    def call(self, target, step, method, path, body=None, ok=(200,)):
+        start = time.perf_counter()
+        try:
+            status, data, headers = target.request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            status, data, headers = None, None, {}
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            if status in ok:
+                self.steps.setdefault(step, []).append(elapsed)
+            else:
+                self.errors[step] = self.errors.get(step, 0) + 1
+        return status, data, headers
+
+    def summary(self, wall):
+        steps = {}
+        every = []
+        for step, latencies in sorted(self.steps.items()):
+            every.extend(latencies)
+            steps[step] = _stats(latencies)
+        total = dict(_stats(every), errors=sum(self.errors.values()), rps=len(every) / wall if wall else 0,
+                     seconds=wall)
+        total['steps'] = steps
+        if self.errors:
+            total['errors_by_step'] = dict(self.errors)
+        return total
+
+
+def _stats(latencies):
+    return {'requests': len(latencies),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000}
+
+
+def random_point(rnd, bbox):
+    return round(rnd.uniform(bbox[0], bbox[2]), 5), round(rnd.uniform(bbox[1], bbox[3]), 5)
+
+
+def scenario_search(target, rec, rnd, sizes, bbox):
+    lat, lng = random_point(rnd, bbox)
+    service = rnd.choice(datagen.SERVICES)
+    variant = rnd.choice([f'&radius_km={rnd.choice([2, 5, 10])}', '&limit=20&sort=distance',
+                          '&limit=20&sort=rating', '&limit=20&sort=cost', ''])
+    rec.call(target, f'search{variant.split("=")[0] if variant else ""}', 'GET',
+             f'/api/workers?service={service}&lat={lat}&lng={lng}{variant}')
+
+
+def scenario_booking(target, rec, rnd, sizes, bbox):
+    i = rnd.randrange(sizes['users'])
+    status, data, _ = rec.call(target, 'login', 'POST', '/api/auth/login',
+                               {'role': 'user', 'phone': f'8{i:09d}', 'name': f'User {i}'})
+    if status != 200:
+        return
+    user_id = data['user']['id']
+    lat, lng = random_point(rnd, bbox)
+    service = rnd.choice(datagen.SERVICES)
+    status, workers, _ = rec.call(target, 'search', 'GET', f'/api/workers?service={service}&lat={lat}&lng={lng}&limit=10&sort=distance')
+    if status != 200 or not workers:
+        return
+    worker = rnd.choice(workers)
+    worker_id = worker.get('id') or worker.get('_id')
+    status, profile, _ = rec.call(target, 'profile', 'GET', f'/api/workers/{worker_id}')
+    if status != 200:
+        return
+    slot = rnd.choice(list(profile.get('slots') or {'Anytime': {}}))
+    # 409 means the slot is taken, which is a normal outcome of the flow
+    status, booked, _ = rec.call(target, 'book', 'POST', '/api/bookings', {
+        'userId': user_id, 'workerId': worker_id, 'service': service, 'slot': slot,
+        'price': profile.get('cost'), 'address': 'Benchmark Street', 'location': {'lat': lat, 'lng': lng},
+    }, ok=(200, 409))
+    if status == 200:
+        rec.call(target, 'complete', 'PATCH', f"/api/bookings/{booked['bookingId']}/status", {'status': 'completed'})
+    rec.call(target, 'my_bookings', 'GET', f'/api/bookings/user?userId={user_id}')
+
+
+def scenario_admin(target, rec, rnd, sizes, bbox):
+    rec.call(target, 'stats', 'GET', '/api/admin/stats')
+    for kind in ('bookings', 'users'):
+        cursor = None
+        for page in range(3):
+            path = f'/api/admin/{kind}?limit=100' + (f'&cursor={cursor}' if cursor else '')
+            status, _, headers = rec.call(target, f'{kind}_page', 'GET', path)
+            cursor = headers.get('x-next-cursor')
+            if status != 200 or not cursor:
+                break
+
+
+def scenario_login(target, rec, rnd, sizes, bbox):
+    r = rnd.random()
+    if r < 0.7:
+        i = rnd.randrange(sizes['users'])
+        rec.call(target, 'login_user', 'POST', '/api/auth/login', {'role': 'user', 'phone': f'8{i:09d}', 'name': f'User {i}'})
+    elif r < 0.95:
+        i = rnd.randrange(sizes['workers'])
+        rec.call(target, 'login_worker', 'POST', '/api/auth/login', {'role': 'worker', 'phone': f'9{i:09d}', 'name': f'Worker {i}'})
+    else:
+        rec.call(target, 'login_admin', 'POST', '/api/auth/login', {'role': 'admin', 'name': 'admin', 'password': 'Admin@123'})
+
+
+RUNNERS = {'search': scenario_search, 'booking': scenario_booking, 'admin': scenario_admin, 'login': scenario_login}
+
+
+def run_scenario(target, name, iterations, concurrency, sizes, bbox, seed):
+    rec = Recorder()
+    per_thread = [iterations // concurrency + (1 if n < iterations % concurrency else 0) for n in range(concurrency)]
+
+    def worker(n):
+        rnd = random.Random(f'{seed}-{name}-{n}')
+        for _ in range(per_thread[n]):
+            RUNNERS[name](target, rec, rnd, sizes, bbox)
+
+    # Warm caches and code paths so the first timed iteration is not an outlier
+    RUNNERS[name](target, Recorder(), random.Random(seed), sizes, bbox)
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(0)
+    else:
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return dict(rec.summary(time.perf_counter() - started), iterations=iterations, concurrency=concurrency)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_regression):
+    # -> list of (scenario, metric, old, new) for p95 regressions beyond max_regression
+    regressions = []
+    for name, r in results['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old or not old.get('p95_ms'):
+            continue
+        if r['p95_ms'] > old['p95_ms'] * (1 + max_regression):
+            regressions.append((name, 'p95_ms', old['p95_ms'], r['p95_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run benchmark scenarios and emit JSON results')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='repeatable; default all')
+    parser.add_argument('--target', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--gunicorn-workers', type=int, default=2)
+    parser.add_argument('-n', '--iterations', type=int, default=300, help='iterations per scenario')
+    parser.add_argument('-c', '--concurrency', type=int, default=1)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='write results JSON here (default: stdout)')
+    parser.add_argument('--baseline', help='results JSON from an earlier commit to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed p95 slowdown, as a fraction')
+    args = parser.parse_args()
+
+    sizes = {'users': args.users, 'workers': args.workers, 'bookings': args.bookings, 'reviews': args.reviews}
+    os.environ.setdefault('SESSION_SECRET', 'bench')  # tokens only live as long as the run
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['SQLITE_PATH'] = os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # Generate in a child process so the app (and its env-dependent settings) loads fresh below
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'datagen.py'), '--seed', str(args.seed)] +
+                   [f'--{k}={v}' for k, v in sizes.items()], env=env, check=True, stdout=subprocess.DEVNULL)
+
+    target = ClientTarget() if args.target == 'client' else HttpTarget(args.gunicorn_workers, env)
+    try:
+        scenarios = {}
+        for name in args.scenario or SCENARIOS:
+            scenarios[name] = run_scenario(target, name, args.iterations, args.concurrency, sizes,
+                                           datagen.DEFAULT_BBOX, args.seed)
+    finally:
+        target.close()
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'target': args.target,
+            'database': 'postgres' if env.get('DATABASE_URL') else 'sqlite',
+            'dataset': dict(sizes, seed=args.seed),
+        },
+        'scenarios': scenarios,
+    }
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for name, r in scenarios.items():
+        print(f"{name:<8} {r['rps']:>8.1f} req/s  p50 {r['p50_ms']:>7.2f}ms  p95 {r['p95_ms']:>7.2f}ms  "
+              f"p99 {r['p99_ms']:>7.2f}ms  errors {r['errors']}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for name, metric, old, new in regressions:
+            print(f'REGRESSION {name} {metric}: {old:.2f} -> {new:.2f}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
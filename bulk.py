@@ -0,0 +1,392 @@
+import io
+import sys
+import csv
+import json
+import uuid
+import argparse
+
+from db import IS_POSTGRES, get_db_connection, db_execute
+from service_keys import normalize_service_key, save_service_aliases
+from slots import RELEASED_STATUSES, parse_slot_label
+from pagination import stream_rows
+import counters
+import analytics
+import search_projection
+
+# Bulk import/export for users, workers and bookings in CSV or NDJSON.
+# Rows are validated, then written in batches of BATCH_SIZE (execute_values on
+# PostgreSQL, executemany on SQLite), one transaction per batch.
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+DEFAULT_PASSWORD = 'Password@123'
+
+KINDS = ('users', 'workers', 'bookings')
+
+EXPORT_QUERIES = {
+    'users': ('SELECT id, name, email, phone, role, created_at FROM users',
+              ['id', 'name', 'email', 'phone', 'role', 'created_at']),
+    'workers': ('''
+        SELECT w.id, u.name, u.phone, u.email, w.service, w.cost, w.lat, w.lng, w.bio, w.gender,
+               w.experience, w.rating, w.total_reviews, w.available, w.slots
+        FROM workers w JOIN users u ON w.user_id = u.id
+    ''', ['id', 'name', 'phone', 'email', 'service', 'cost', 'lat', 'lng', 'bio', 'gender',
+          'experience', 'rating', 'total_reviews', 'available', 'slots']),
+    'bookings': ('''
+        SELECT id, user_id, worker_id, service_key, slot, price, status, address, lat, lng, notes, created_at
+        FROM bookings
+    ''', ['id', 'user_id', 'worker_id', 'service_key', 'slot', 'price', 'status', 'address', 'lat', 'lng',
+          'notes', 'created_at']),
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    # Yields (line number, dict) from a binary or text stream
+    if not hasattr(stream, 'encoding'):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {k.strip(): (v if v != '' else None) for k, v in row.items() if k}
+    elif fmt == 'ndjson':
+        for n, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield n, json.loads(line)
+                except ValueError as e:
+                    yield n, RowError(f'Invalid JSON: {e}')
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def _float(row, key, required=False, lo=None, hi=None):
+    value = row.get(key)
+    if value is None:
+        if required:
+            raise RowError(f'{key} is required')
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{key} must be a number')
+    if (lo is not None and value < lo) or (hi is not None and value > hi):
+        raise RowError(f'{key} out of range')
+    return value
+
+
+def _flag(row, key, default):
+    # 1/0, true/false or yes/no (as JSON or CSV text) -> 1 or 0
+    value = row.get(key)
+    if value is None:
+        return default
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes'):
+        return 1
+    if text in ('0', 'false', 'no'):
+        return 0
+    raise RowError(f'{key} must be 1 or 0')
+
+
+def _required(row, key):
+    value = row.get(key)
+    if value is None or str(value).strip() == '':
+        raise RowError(f'{key} is required')
+    return str(value).strip()
+
+
+def _slots(row):
+    value = row.get('slots')
+    if value is None:
+        return {}
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise RowError('slots must be a JSON object')
+    if not isinstance(value, dict):
+        raise RowError('slots must be a JSON object')
+    return value
+
+
+def validate_user(row):
+    phone, email = row.get('phone'), row.get('email')
+    if not phone and not email:
+        raise RowError('phone or email is required')
+    role = row.get('role') or 'user'
+    if role not in ('user', 'worker', 'admin'):
+        raise RowError('role must be user, worker or admin')
+    return {'id': row.get('id') or 'user_' + uuid.uuid4().hex, 'name': _required(row, 'name'),
+            'email': email, 'phone': str(phone) if phone else None,
+            'password': row.get('password') or DEFAULT_PASSWORD, 'role': role}
+
+
+def validate_worker(row):
+    user = validate_user(dict(row, role='worker', id=row.get('user_id')))
+    service = _required(row, 'service')
+    experience = row.get('experience')
+    try:
+        experience = int(float(experience)) if experience is not None else 0
+    except (TypeError, ValueError):
+        raise RowError('experience must be a number')
+    total_reviews = _float(row, 'total_reviews', lo=0)
+    if total_reviews is not None and total_reviews != int(total_reviews):
+        raise RowError('total_reviews must be a whole number')
+    return user, {
+        'id': row.get('id') or 'worker_' + uuid.uuid4().hex,
+        'service': service, 'service_key': normalize_service_key(service),
+        'cost': _float(row, 'cost', lo=0), 'lat': _float(row, 'lat', lo=-90, hi=90),
+        'lng': _float(row, 'lng', lo=-180, hi=180), 'bio': row.get('bio'), 'gender': row.get('gender'),
+        'experience': experience, 'slots': _slots(row),
+        # Exported with the worker, so an export re-imports with its rating and availability
+        'rating': _float(row, 'rating', lo=0, hi=5) or 0, 'total_reviews': int(total_reviews or 0),
+        'available': _flag(row, 'available', 1),
+    }
+
+
+def validate_booking(row):
+    return {
+        'id': row.get('id') or 'book_' + uuid.uuid4().hex,
+        'user_id': _required(row, 'user_id'), 'worker_id': _required(row, 'worker_id'),
+        'service_key': _required(row, 'service_key'), 'slot': row.get('slot'),
+        'price': _float(row, 'price', lo=0), 'status': row.get('status') or 'confirmed',
+        'address': row.get('address'), 'lat': _float(row, 'lat'), 'lng': _float(row, 'lng'),
+        'notes': row.get('notes'), 'created_at': row.get('created_at'),
+    }
+
+
+def insert_many(conn, table, columns, rows, suffix=''):
+    # -> rows written (exact as long as len(rows) <= BATCH_SIZE)
+    if not rows:
+        return 0
+    cur = conn.cursor()
+    cols = ', '.join(columns)
+    if IS_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cur, f'INSERT INTO {table} ({cols}) VALUES %s {suffix}', rows, page_size=BATCH_SIZE)
+    else:
+        cur.executemany(f'INSERT INTO {table} ({cols}) VALUES ({", ".join("?" * len(columns))}) {suffix}', rows)
+    return cur.rowcount
+
+
+def existing_ids(conn, table, column, values):
+    values = list({v for v in values if v is not None})
+    found = {}
+    for i in range(0, len(values), 500):
+        part = values[i:i + 500]
+        rows = db_execute(conn, f'SELECT id, {column} FROM {table} WHERE {column} IN ({", ".join("?" * len(part))})', part).fetchall()
+        found.update({r[column]: r['id'] for r in rows})
+    return found
+
+
+def slot_holders(conn, worker_ids):
+    # -> {(worker_id, slot): booking_id} for the slots these workers have reserved
+    worker_ids = sorted(set(worker_ids))
+    held = {}
+    for i in range(0, len(worker_ids), 500):
+        part = worker_ids[i:i + 500]
+        rows = db_execute(conn, f'SELECT worker_id, slot, booking_id FROM slot_reservations WHERE worker_id IN ({", ".join("?" * len(part))})',
+                          part).fetchall()
+        held.update({(r['worker_id'], r['slot']): r['booking_id'] for r in rows})
+    return held
+
+
+def _resolve_users(conn, users, seen_phones):
+    # Deduplicate by phone against the database and earlier rows, as register_worker does
+    by_phone = existing_ids(conn, 'users', 'phone', [u['phone'] for u in users])
+    new_users = []
+    for u in users:
+        phone = u['phone']
+        if phone and phone in by_phone:
+            u['id'] = by_phone[phone]
+        elif phone and phone in seen_phones:
+            u['id'] = seen_phones[phone]
+        else:
+            new_users.append(u)
+            if phone:
+                seen_phones[phone] = u['id']
+    return new_users
+
+
+def _write_users(conn, users):
+    return insert_many(conn, 'users', ['id', 'name', 'email', 'phone', 'password', 'role'],
+                       [(u['id'], u['name'], u['email'], u['phone'], u['password'], u['role']) for u in users],
+                       'ON CONFLICT (id) DO NOTHING')
+
+
+def import_batch(conn, kind, batch, seen_phones, errors, search):
+    # batch: [(line, validated row)] -> number of rows inserted (duplicates are skipped); the caller
+    # commits, then publishes the search projection changes collected in `search`
+    lines = [line for line, _ in batch]
+    batch = [item for _, item in batch]
+    if kind == 'users':
+        return _write_users(conn, _resolve_users(conn, batch, seen_phones))
+
+    if kind == 'workers':
+        users = [u for u, _ in batch]
+        new_users = _resolve_users(conn, users, seen_phones)
+        _write_users(conn, new_users)
+        existing = existing_ids(conn, 'workers', 'id', [w['id'] for _, w in batch])
+        inserted = insert_many(conn, 'workers', ['id', 'user_id', 'service', 'service_key', 'cost', 'lat', 'lng', 'bio',
+                                      'gender', 'experience', 'slots', 'rating', 'total_reviews', 'available'],
+                    [(w['id'], u['id'], w['service'], w['service_key'], w['cost'], w['lat'], w['lng'], w['bio'],
+                      w['gender'], w['experience'], json.dumps(w['slots']), w['rating'], w['total_reviews'],
+                      w['available']) for u, w in batch],
+                    'ON CONFLICT (id) DO NOTHING')
+        for service in sorted({w['service'] for _, w in batch}):
+            save_service_aliases(conn, service)
+        # Slots only for the workers this batch created (the first row of a repeated id);
+        # an existing worker keeps the slots it has
+        new_workers = {}
+        for _, w in batch:
+            if w['id'] not in existing:
+                new_workers.setdefault(w['id'], w)
+        slot_rows = []
+        for w in new_workers.values():
+            for label, info in w['slots'].items():
+                info = info if isinstance(info, dict) else {}
+                start, end = parse_slot_label(label)
+                slot_rows.append((w['id'], label, start, end, info.get('price'), 1 if info.get('available', True) else 0))
+        insert_many(conn, 'worker_slots', ['worker_id', 'slot', 'start_minute', 'end_minute', 'price', 'available'], slot_rows)
+        search.add(search_projection.refresh_workers(conn, [w['id'] for _, w in batch]))
+        return inserted
+
+    if kind == 'bookings':
+        users = existing_ids(conn, 'users', 'id', [b['user_id'] for b in batch])
+        workers = existing_ids(conn, 'workers', 'id', [b['worker_id'] for b in batch])
+        known = existing_ids(conn, 'bookings', 'id', [b['id'] for b in batch])
+        held = slot_holders(conn, [b['worker_id'] for b in batch if b['slot'] and b['status'] not in RELEASED_STATUSES])
+        valid = []
+        for line, b in zip(lines, batch):
+            if b['user_id'] not in users or b['worker_id'] not in workers:
+                errors.append({'line': line, 'error': 'Unknown user_id or worker_id'})
+                continue
+            if b['id'] in known:
+                # Already imported (or repeated in this file): skipped as a duplicate
+                continue
+            known[b['id']] = b['id']
+            if b['slot'] and b['status'] not in RELEASED_STATUSES:
+                # An active booking needs its slot free, in the database and among earlier rows
+                holder = held.get((b['worker_id'], b['slot']))
+                if holder is not None:
+                    errors.append({'line': line, 'error': f"Slot {b['slot']} of worker {b['worker_id']} is already reserved by booking {holder}"})
+                    continue
+                held[(b['worker_id'], b['slot'])] = b['id']
+            valid.append(b)
+        columns = ['id', 'user_id', 'worker_id', 'service_key', 'slot', 'price', 'status', 'address', 'lat', 'lng', 'notes']
+        with_ts = [b for b in valid if b['created_at']]
+        without_ts = [b for b in valid if not b['created_at']]
+        inserted = insert_many(conn, 'bookings', columns + ['created_at'],
+                               [tuple(b[c] for c in columns + ['created_at']) for b in with_ts], 'ON CONFLICT (id) DO NOTHING')
+        inserted += insert_many(conn, 'bookings', columns, [tuple(b[c] for c in columns) for b in without_ts],
+                                'ON CONFLICT (id) DO NOTHING')
+        # No ON CONFLICT: a slot reserved concurrently since the check above fails the batch
+        # rather than committing a double booking
+        insert_many(conn, 'slot_reservations', ['worker_id', 'slot', 'booking_id'],
+                    [(b['worker_id'], b['slot'], b['id']) for b in valid
+                     if b['slot'] and b['status'] not in RELEASED_STATUSES])
+        return inserted
+
+    raise ValueError(f'Unknown kind: {kind}')
+
+
+VALIDATORS = {'users': validate_user, 'workers': validate_worker, 'bookings': validate_booking}
+
+
+def import_rows(conn, kind, rows):
+    # rows: iterable of (line, dict | RowError). Returns a report; counters (and booking rollups) are rebuilt at the end.
+    if kind not in KINDS:
+        raise ValueError(f'Unknown kind: {kind}')
+    validate = VALIDATORS[kind]
+    report = {'kind': kind, 'inserted': 0, 'skipped': 0, 'errors': []}
+    seen_phones = {}
+    batch = []
+
+    def flush():
+        if batch:
+            errors, search = [], search_projection.Changes()
+            inserted = import_batch(conn, kind, batch, seen_phones, errors, search)
+            conn.commit()
+            search.publish()
+            report['errors'].extend(errors[:MAX_REPORTED_ERRORS - len(report['errors'])])
+            report['inserted'] += inserted
+            report['skipped'] += len(batch) - inserted
+            batch.clear()
+
+    for line, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            if not isinstance(row, dict):
+                raise RowError('Row must be an object')
+            batch.append((line, validate(row)))
+        except RowError as e:
+            report['skipped'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line, 'error': str(e)})
+            continue
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    flush()
+    report['errors'].sort(key=lambda e: e['line'])
+
+    counters.rebuild_counters(conn)
+    if kind == 'bookings':
+        analytics.rebuild(conn)
+    conn.commit()
+    return report
+
+
+def export_lines(conn, kind, fmt):
+    # Generator of CSV or NDJSON text; streams from a server-side cursor
+    query, columns = EXPORT_QUERIES[kind]
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for n, row in enumerate(stream_rows(conn, query), 1):
+            writer.writerow([row[c] for c in columns])
+            if n % BATCH_SIZE == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+    elif fmt == 'ndjson':
+        for row in stream_rows(conn, query):
+            yield json.dumps({c: row[c] for c in columns}, default=str) + '\n'
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import/export for users, workers and bookings')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import')
+    imp.add_argument('kind', choices=KINDS)
+    imp.add_argument('path', help="CSV/NDJSON file, or '-' for stdin")
+    imp.add_argument('--format', choices=['csv', 'ndjson'])
+    exp = sub.add_parser('export')
+    exp.add_argument('kind', choices=KINDS)
+    exp.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        if args.command == 'import':
+            fmt = args.format or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+            stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+            with stream:
+                report = import_rows(conn, args.kind, read_rows(stream, fmt))
+            print(json.dumps(report, indent=2))
+        else:
+            for chunk in export_lines(conn, args.kind, args.format):
+                sys.stdout.write(chunk)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
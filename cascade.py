@@ -0,0 +1,135 @@
+import os
+import sys
+
+from db import get_db_connection, db_execute
+import counters
+import analytics
+import jobs
+import reviews
+import search_projection
+import sessions
+
+# Account deletes as a fixed number of set-based statements, however many workers,
+# bookings and reviews hang off the account. Dependent rows go first (reviews, slot
+# reservations, worker slots, bookings), then workers and users, with counters and the
+# search projection adjusted in the same transaction (counter decrements are queued
+# behind the increments they undo). The result's `search` changes are published to the
+# worker snapshot by the caller once the transaction has committed.
+#
+#   DELETE_MODE=hard   (default) delete everything inside the request
+#   DELETE_MODE=soft   mark the account deleted (hidden from login, search and admin lists)
+#                      and let the job worker purge it after PURGE_DELAY_SECONDS
+
+DELETE_MODE = os.environ.get('DELETE_MODE', 'hard')
+PURGE_DELAY_SECONDS = float(os.environ.get('PURGE_DELAY_SECONDS', 0))
+
+
+def _in(column, ids):
+    return f'{column} IN ({", ".join("?" * len(ids))})', list(ids)
+
+
+def _scope(user_ids, worker_ids, user_col='user_id', worker_col='worker_id'):
+    # SQL matching rows owned by any of the users or workers
+    parts, params = [], []
+    for column, ids in ((user_col, user_ids), (worker_col, worker_ids)):
+        if ids:
+            sql, values = _in(column, ids)
+            parts.append(sql)
+            params.extend(values)
+    return ' OR '.join(parts) or '1 = 0', params
+
+
+def account_workers(conn, user_ids=(), worker_ids=()):
+    # The given workers plus every worker profile of the given users
+    where, params = _scope(list(user_ids), list(worker_ids), 'user_id', 'id')
+    return [r['id'] for r in db_execute(conn, f'SELECT id FROM workers WHERE {where}', params).fetchall()]
+
+
+def delete_accounts(conn, user_ids=(), worker_ids=()):
+    # Runs in the caller's transaction; returns what was removed so callers can drop cached copies
+    user_ids = list(user_ids)
+    worker_ids = account_workers(conn, user_ids, worker_ids)
+    bookings, params = _scope(user_ids, worker_ids)
+    booking_ids = f'SELECT id FROM bookings WHERE {bookings}'
+
+    # Reviews the users left for workers that stay: those workers' ratings change
+    rated = []
+    if user_ids:
+        users_in, users_params = _in('user_id', user_ids)
+        kept = f' AND NOT ({_in("worker_id", worker_ids)[0]})' if worker_ids else ''
+        rated = [r['worker_id'] for r in db_execute(conn, f'SELECT DISTINCT worker_id FROM reviews WHERE {users_in}{kept}',
+                                                    users_params + worker_ids).fetchall()]
+
+    counters.forget_bookings(conn, bookings, params)
+    analytics.forget_bookings(conn, bookings, params)
+    removed_reviews = db_execute(conn, f'DELETE FROM reviews WHERE {bookings}', params).rowcount
+    db_execute(conn, f'DELETE FROM slot_reservations WHERE booking_id IN ({booking_ids})' +
+               (f' OR {_in("worker_id", worker_ids)[0]}' if worker_ids else ''), params + worker_ids)
+    removed_bookings = db_execute(conn, f'DELETE FROM bookings WHERE {bookings}', params).rowcount
+    search = search_projection.Changes()
+    if worker_ids:
+        workers_in, _ = _in('worker_id', worker_ids)
+        db_execute(conn, f'DELETE FROM worker_slots WHERE {workers_in}', worker_ids)
+        search.add(search_projection.remove_workers(conn, worker_ids))
+        counters.forget_workers(conn, worker_ids)
+        db_execute(conn, f'DELETE FROM workers WHERE {_in("id", worker_ids)[0]}', worker_ids)
+    removed_users = 0
+    if user_ids:
+        removed_users = db_execute(conn, f'DELETE FROM users WHERE {_in("id", user_ids)[0]}', user_ids).rowcount
+        sessions.revoke_users(conn, user_ids)
+        counters.defer_bump(conn, counters.USERS, -removed_users)
+    if rated:
+        reviews.recompute_ratings(conn, rated)
+        search.add(search_projection.refresh_workers(conn, rated))
+    return {'users': removed_users, 'workers': worker_ids, 'bookings': removed_bookings,
+            'reviews': removed_reviews, 'rated': rated, 'search': search}
+
+
+def soft_delete_accounts(conn, user_ids=(), worker_ids=(), delay=PURGE_DELAY_SECONDS):
+    # Hides the accounts now and queues the purge; returns the affected worker ids
+    user_ids = list(user_ids)
+    search = search_projection.Changes()
+    worker_ids = account_workers(conn, user_ids, worker_ids)
+    if user_ids:
+        db_execute(conn, f'UPDATE users SET deleted_at = CURRENT_TIMESTAMP WHERE {_in("id", user_ids)[0]}', user_ids)
+        sessions.revoke_users(conn, user_ids)
+    if worker_ids:
+        db_execute(conn, f'UPDATE workers SET deleted_at = CURRENT_TIMESTAMP WHERE {_in("id", worker_ids)[0]}', worker_ids)
+        search = search_projection.remove_workers(conn, worker_ids)
+    jobs.enqueue(conn, 'cascade.purge', {'users': user_ids, 'workers': worker_ids}, delay)
+    return {'users': len(user_ids), 'workers': worker_ids, 'purge': 'queued', 'search': search}
+
+
+def purge(conn, payload):
+    # The job worker calls the returned function after the batch commits
+    return delete_accounts(conn, payload.get('users', []), payload.get('workers', []))['search'].publish
+
+
+def purge_deleted(conn):
+    # Purges every soft-deleted account now (e.g. when the job worker is not running)
+    users = [r['id'] for r in db_execute(conn, 'SELECT id FROM users WHERE deleted_at IS NOT NULL').fetchall()]
+    workers = [r['id'] for r in db_execute(conn, 'SELECT id FROM workers WHERE deleted_at IS NOT NULL').fetchall()]
+    removed = {'users': 0, 'workers': 0, 'search': search_projection.Changes()}
+    for i in range(0, max(len(users), len(workers)), 500):
+        result = delete_accounts(conn, users[i:i + 500], workers[i:i + 500])
+        removed['users'] += result['users']
+        removed['workers'] += len(result['workers'])
+        removed['search'].add(result['search'])
+    return removed
+
+
+jobs.register('cascade.purge', purge)
+
+
+if __name__ == '__main__':
+    # python cascade.py purge
+    if sys.argv[1:] != ['purge']:
+        sys.exit('usage: python cascade.py purge')
+    conn = get_db_connection()
+    try:
+        removed = purge_deleted(conn)
+        conn.commit()
+        removed.pop('search').publish()
+        print(f'Purged {removed}')
+    finally:
+        conn.close()
@@ -0,0 +1,165 @@
+import sys
+
+from db import get_db_connection, db_execute
+import jobs
+
+# Totals maintained as rows change, so dashboards and profiles read them in O(1).
+# Every helper runs inside the caller's transaction; rebuild_counters() reconciles
+# them against the source tables. Request paths use the defer_* helpers, which only
+# enqueue a job: the job worker sums a whole batch and applies one upsert per row, so
+# requests never wait on the hot counter rows.
+
+USERS = 'users'
+WORKERS = 'workers'
+BOOKINGS = 'bookings'
+REVENUE = 'revenue'
+
+# fn(worker_ids), called after a counters batch that changed those workers' stats commits
+_worker_stats_hooks = []
+
+
+def on_worker_stats_changed(fn):
+    _worker_stats_hooks.append(fn)
+
+
+def _worker_stats_changed(worker_ids):
+    for fn in _worker_stats_hooks:
+        fn(worker_ids)
+
+
+def bump(conn, name, delta=1):
+    if not delta:
+        return
+    db_execute(conn, '''
+        INSERT INTO counters (name, value) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET value = counters.value + excluded.value
+    ''', (name, delta))
+
+
+def bump_worker(conn, worker_id, bookings=0, earnings=0):
+    if not bookings and not earnings:
+        return
+    db_execute(conn, '''
+        INSERT INTO worker_stats (worker_id, completed_bookings, earnings) VALUES (?, ?, ?)
+        ON CONFLICT (worker_id) DO UPDATE SET
+            completed_bookings = worker_stats.completed_bookings + excluded.completed_bookings,
+            earnings = worker_stats.earnings + excluded.earnings
+    ''', (worker_id, bookings, earnings))
+
+
+def defer_bump(conn, name, delta=1):
+    if delta:
+        jobs.enqueue(conn, 'counters', {'counters': {name: delta}})
+
+
+def defer_booking_status_changed(conn, worker_id, price, old_status, new_status):
+    # Only completed bookings count towards earnings and revenue
+    was, now = old_status == 'completed', new_status == 'completed'
+    if was != now:
+        sign = 1 if now else -1
+        jobs.enqueue(conn, 'counters', {'counters': {REVENUE: sign * (price or 0)},
+                                        'workers': {worker_id: [sign, sign * (price or 0)]}})
+
+
+def apply_jobs(conn, payloads):
+    totals, workers = {}, {}
+    for payload in payloads:
+        for name, delta in payload.get('counters', {}).items():
+            totals[name] = totals.get(name, 0) + delta
+        for worker_id, (bookings, earnings) in payload.get('workers', {}).items():
+            entry = workers.setdefault(worker_id, [0, 0])
+            entry[0] += bookings
+            entry[1] += earnings
+    for name, delta in sorted(totals.items()):
+        bump(conn, name, delta)
+    # Workers deleted since the job was queued already had their stats removed
+    ids, changed = sorted(workers), []
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        rows = db_execute(conn, f'SELECT id FROM workers WHERE id IN ({", ".join("?" * len(part))})', part).fetchall()
+        for r in rows:
+            bump_worker(conn, r['id'], *workers[r['id']])
+            changed.append(r['id'])
+    # The job worker calls this after the batch commits
+    return (lambda: _worker_stats_changed(changed)) if changed else None
+
+
+jobs.register('counters', apply_jobs, batch=True)
+
+
+def forget_bookings(conn, where, params):
+    # Call before deleting the bookings matched by `where`. The decrements are queued like
+    # the increments they undo: jobs run in enqueue order, so a booking's pending +1 is
+    # applied before its -1 and no total dips below zero in between
+    totals = db_execute(conn, f'''
+        SELECT COUNT(*) as cnt, SUM(CASE WHEN status = 'completed' THEN COALESCE(price, 0) ELSE 0 END) as earned
+        FROM bookings WHERE {where}
+    ''', params).fetchone()
+    if not totals['cnt']:
+        return
+    rows = db_execute(conn, f'''
+        SELECT worker_id, COUNT(*) as done, SUM(COALESCE(price, 0)) as earned
+        FROM bookings WHERE ({where}) AND status = 'completed'
+        GROUP BY worker_id
+    ''', params).fetchall()
+    jobs.enqueue(conn, 'counters', {
+        'counters': {BOOKINGS: -totals['cnt'], REVENUE: -float(totals['earned'] or 0)},
+        'workers': {r['worker_id']: [-r['done'], -float(r['earned'] or 0)] for r in rows},
+    })
+
+
+def forget_workers(conn, worker_ids):
+    # Pending jobs for these workers skip them once they are gone (see apply_jobs)
+    worker_ids = list(worker_ids)
+    for i in range(0, len(worker_ids), 500):
+        part = worker_ids[i:i + 500]
+        db_execute(conn, f'DELETE FROM worker_stats WHERE worker_id IN ({", ".join("?" * len(part))})', part)
+    defer_bump(conn, WORKERS, -len(worker_ids))
+
+
+def get_counters(conn):
+    rows = db_execute(conn, 'SELECT name, value FROM counters').fetchall()
+    return {r['name']: r['value'] for r in rows}
+
+
+def get_worker_stats(conn, worker_id):
+    row = db_execute(conn, 'SELECT completed_bookings, earnings FROM worker_stats WHERE worker_id = ?', (worker_id,)).fetchone()
+    if not row:
+        return {'bookings': 0, 'earnings': 0}
+    return {'bookings': row['completed_bookings'], 'earnings': row['earnings']}
+
+
+def rebuild_counters(conn):
+    # Reconciliation: recompute every counter from the source tables in one transaction.
+    # Pending counter jobs are already reflected in those tables
+    jobs.discard(conn, 'counters')
+    totals = {
+        USERS: db_execute(conn, 'SELECT COUNT(*) as v FROM users').fetchone()['v'],
+        WORKERS: db_execute(conn, 'SELECT COUNT(*) as v FROM workers').fetchone()['v'],
+        BOOKINGS: db_execute(conn, 'SELECT COUNT(*) as v FROM bookings').fetchone()['v'],
+        REVENUE: db_execute(conn, "SELECT COALESCE(SUM(price), 0) as v FROM bookings WHERE status = 'completed'").fetchone()['v'],
+    }
+    db_execute(conn, 'DELETE FROM counters')
+    for name, value in totals.items():
+        db_execute(conn, 'INSERT INTO counters (name, value) VALUES (?, ?)', (name, value or 0))
+    db_execute(conn, 'DELETE FROM worker_stats')
+    db_execute(conn, '''
+        INSERT INTO worker_stats (worker_id, completed_bookings, earnings)
+        SELECT worker_id, COUNT(*), COALESCE(SUM(price), 0)
+        FROM bookings WHERE status = 'completed'
+        GROUP BY worker_id
+    ''')
+    return totals
+
+
+if __name__ == '__main__':
+    # python counters.py rebuild
+    if sys.argv[1:] != ['rebuild']:
+        sys.exit('usage: python counters.py rebuild')
+    conn = get_db_connection()
+    try:
+        totals = rebuild_counters(conn)
+        conn.commit()
+        print(f'Counters rebuilt: {totals}')
+    finally:
+        conn.close()
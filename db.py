@@ -0,0 +1,295 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# The driver is only imported when there is a Postgres database to talk to; SQLite
+# processes (local runs, tools, benchmarks) skip its import cost
+HAS_POSTGRES = False
+if DATABASE_URL:
+    try:
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+        HAS_POSTGRES = True
+    except ImportError:
+        pass
+
+IS_POSTGRES = HAS_POSTGRES and DATABASE_URL is not None
+
+SQLITE_PATH = os.environ.get('SQLITE_PATH') or os.path.join(os.path.abspath(os.path.dirname(__file__)), 'service_finder.db')
+
+# Pool settings (DB_POOL=0 falls back to one connection per request). A new PostgreSQL
+# connection costs a network handshake and a backend process; a new SQLite connection
+# starts with a cold page cache, which bench_pool.py measures at 1.3-1.5x fewer req/s
+DB_POOL_ENABLED = os.environ.get('DB_POOL', '1') != '0'
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_IDLE_SECONDS = float(os.environ.get('DB_POOL_IDLE_SECONDS', 300))
+DB_POOL_HEALTHCHECK_SECONDS = float(os.environ.get('DB_POOL_HEALTHCHECK_SECONDS', 30))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Unique/foreign key violations from either driver
+IntegrityError = (sqlite3.IntegrityError, psycopg2.IntegrityError) if HAS_POSTGRES else (sqlite3.IntegrityError,)
+
+
+def connect_postgres(dsn=None):
+    return psycopg2.connect(dsn or DATABASE_URL, cursor_factory=RealDictCursor)
+
+
+def connect_sqlite(path=None, wal=False):
+    conn = sqlite3.connect(path or SQLITE_PATH, timeout=DB_POOL_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    if wal:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class PostgresPool:
+    # Thread-safe pool with min/max size, idle eviction and health checks on checkout
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10, idle_seconds=300, healthcheck_seconds=30):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.healthcheck_seconds = healthcheck_seconds
+        self._idle = []  # (conn, last_used), most recently used last
+        self._size = 0
+        self._cond = threading.Condition()
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0, 'evicted': 0, 'waits': 0}
+
+    def _connect(self):
+        conn = connect_postgres(self.dsn)
+        self.stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self):
+        # Caller holds the lock; oldest connections sit at the front of the list
+        now = time.time()
+        evicted = []
+        while self._idle and self._size > self.minconn and now - self._idle[0][1] > self.idle_seconds:
+            evicted.append(self._idle.pop(0)[0])
+            self._size -= 1
+            self.stats['evicted'] += 1
+        return evicted
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.time() - last_used < self.healthcheck_seconds:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        deadline = time.time() + self.timeout
+        while True:
+            conn = last_used = None
+            create = False
+            with self._cond:
+                stale = self._evict_idle()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                    self.stats['waits'] += 1
+                    self._cond.wait(remaining)
+            for c in stale:
+                self._discard(c)
+
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            if conn is not None:
+                if self._healthy(conn, last_used):
+                    self.stats['reused'] += 1
+                    return conn
+                # Broken connection: drop it and loop round to reconnect
+                logging.warning('Discarding broken pooled database connection')
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                    self.stats['discarded'] += 1
+
+    def release(self, conn):
+        ok = not conn.closed
+        if ok:
+            try:
+                conn.rollback()
+            except Exception:
+                ok = False
+        with self._cond:
+            if ok:
+                self._idle.append((conn, time.time()))
+            else:
+                self._size -= 1
+                self.stats['discarded'] += 1
+            self._cond.notify()
+        if not ok:
+            self._discard(conn)
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def info(self):
+        with self._cond:
+            return dict(self.stats, size=self._size, idle=len(self._idle))
+
+
+class SqliteConnections:
+    # One long-lived WAL-mode connection per thread
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+        self.stats = {'created': 0, 'reused': 0}
+
+    def acquire(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect_sqlite(self.path, wal=True)
+            self._local.conn = conn
+            with self._lock:
+                self._all.append(conn)
+                self.stats['created'] += 1
+        else:
+            self.stats['reused'] += 1
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+    def closeall(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._all))
+
+
+class PooledConnection:
+    # Wraps a pooled connection so the routes' conn.close() hands it back instead
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a released connection.')
+        return getattr(self._raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Pools are per process; rebuild after a fork (e.g. gunicorn workers)
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if IS_POSTGRES:
+                    _pool = PostgresPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+                                         DB_POOL_IDLE_SECONDS, DB_POOL_HEALTHCHECK_SECONDS)
+                else:
+                    _pool = SqliteConnections(SQLITE_PATH)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+
+
+def pool_info():
+    if not DB_POOL_ENABLED or _pool is None:
+        return {}
+    return _pool.info()
+
+
+def get_db_connection():
+    if not DB_POOL_ENABLED:
+        return connect_postgres() if IS_POSTGRES else connect_sqlite()
+    pool = get_pool()
+    return PooledConnection(pool, pool.acquire())
+
+
+# Adapt query placeholder based on DB type
+def qry(q):
+    if IS_POSTGRES:
+        return q.replace('?', '%s')
+    return q
+
+
+# hook(query, seconds) is called after every db_execute; metrics.py registers one
+query_hooks = []
+
+
+def db_execute(conn, query, params=None):
+    cur = conn.cursor()
+    if not query_hooks:
+        cur.execute(qry(query), params or ())
+        return cur
+    start = time.perf_counter()
+    try:
+        cur.execute(qry(query), params or ())
+    finally:
+        elapsed = time.perf_counter() - start
+        for hook in query_hooks:
+            hook(query, elapsed)
+    return cur
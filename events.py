@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import queue
+import select
+import logging
+import threading
+
+from db import IS_POSTGRES, DATABASE_URL, connect_postgres, get_db_connection, db_execute
+
+# Booking events pushed to browsers over Server-Sent Events instead of dashboard polling.
+# Channels are 'user:<id>' and 'worker:<id>'. Locally a MemoryBroker fans events out to
+# the streams open in this process; on PostgreSQL, events go through NOTIFY and every
+# process (gunicorn worker) LISTENs and fans out to its own streams.
+
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND') or ('postgres' if IS_POSTGRES else 'memory')
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', 15))
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+# Streams end after this long and the browser reconnects (EventSource does so automatically),
+# which rebalances clients across workers and keeps graceful shutdowns from waiting forever
+EVENTS_MAX_STREAM_SECONDS = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS', 300))
+# Each open stream holds a server thread; beyond this, /api/events answers 503 and clients keep
+# working without live updates
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 16))
+NOTIFY_CHANNEL = 'booking_events'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def worker_channel(worker_id):
+    return f'worker:{worker_id}'
+
+
+class Subscription:
+    def __init__(self, broker, channels, maxsize=EVENTS_QUEUE_SIZE):
+        self.broker = broker
+        self.channels = channels
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.limited = False  # counted against EVENTS_MAX_STREAMS
+
+    def get(self, timeout=None):
+        # -> next event, or None if nothing arrived within timeout
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    def __init__(self):
+        self._subs = {}  # channel -> set of Subscription
+        self._lock = threading.Lock()
+        self.stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+        self.streams = 0
+
+    def subscribe(self, channels):
+        sub = Subscription(self, list(channels))
+        with self._lock:
+            for channel in sub.channels:
+                self._subs.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub.limited:
+                sub.limited = False
+                self.streams -= 1
+            for channel in sub.channels:
+                subs = self._subs.get(channel)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[channel]
+
+    def deliver(self, channel, event):
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(event)
+                self.stats['delivered'] += 1
+            except queue.Full:
+                # Slow client; it resyncs from the API when it reconnects
+                sub.dropped += 1
+                self.stats['dropped'] += 1
+
+    def publish(self, channel, event):
+        self.stats['published'] += 1
+        self.deliver(channel, event)
+
+    def publish_all(self, channels, event):
+        for channel in channels:
+            self.publish(channel, event)
+
+    def subscribe_limited(self, channels, limit=EVENTS_MAX_STREAMS):
+        # -> Subscription, or None if `limit` streams are already open in this process
+        with self._lock:
+            if self.streams >= limit:
+                return None
+            self.streams += 1
+        sub = self.subscribe(channels)
+        sub.limited = True
+        return sub
+
+    def info(self):
+        return dict(self.stats, backend='memory', streams=self.streams)
+
+    def close(self):
+        pass
+
+
+class PostgresBroker(MemoryBroker):
+    # Publishes with pg_notify; a listener thread per process delivers to local streams
+    def __init__(self, dsn, channel=NOTIFY_CHANNEL):
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._closed = threading.Event()
+        self._listener = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+        self._listener.start()
+
+    def publish(self, channel, event):
+        self.publish_all([channel], event)
+
+    def publish_all(self, channels, event):
+        # One transaction for all channels; NOTIFY is delivered on commit
+        conn = get_db_connection()
+        try:
+            for channel in channels:
+                db_execute(conn, 'SELECT pg_notify(?, ?)', (self.channel, json.dumps({'channel': channel, 'event': event})))
+                self.stats['published'] += 1
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _listen(self):
+        while not self._closed.is_set():
+            conn = None
+            try:
+                conn = connect_postgres(self.dsn)
+                conn.autocommit = True
+                conn.cursor().execute(f'LISTEN {self.channel}')
+                while not self._closed.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        self.deliver(message['channel'], message['event'])
+            except Exception:
+                logging.exception('Event listener lost its database connection; reconnecting')
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def info(self):
+        return dict(super().info(), backend='postgres')
+
+    def close(self):
+        self._closed.set()
+
+
+_broker = None
+_broker_pid = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    # One broker per process; the listener thread does not survive a fork
+    global _broker, _broker_pid
+    if _broker is None or _broker_pid != os.getpid():
+        with _broker_lock:
+            if _broker is None or _broker_pid != os.getpid():
+                _broker = PostgresBroker(DATABASE_URL) if EVENTS_BACKEND == 'postgres' else MemoryBroker()
+                _broker_pid = os.getpid()
+    return _broker
+
+
+def publish_booking(event_type, booking_id, user_id, worker_id, **fields):
+    # Call after the transaction commits; failures are logged, never raised into the request
+    event = dict(fields, type=event_type, bookingId=booking_id, userId=user_id, workerId=worker_id, at=time.time())
+    channels = ([user_channel(user_id)] if user_id else []) + ([worker_channel(worker_id)] if worker_id else [])
+    try:
+        get_broker().publish_all(channels, event)
+    except Exception:
+        logging.exception(f'Could not publish {event_type} for booking {booking_id}')
+
+
+def sse_stream(subscription, heartbeat=EVENTS_HEARTBEAT, max_seconds=EVENTS_MAX_STREAM_SECONDS):
+    # Generator for a text/event-stream response; comments keep proxies from closing idle streams
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = subscription.get(min(heartbeat, remaining))
+            if event is None:
+                yield ': ping\n\n'
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        subscription.close()
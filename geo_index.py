@@ -0,0 +1,136 @@
+import os
+import math
+import time
+import threading
+
+from db import db_execute
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+
+GEO_CELL_DEG = float(os.environ.get('GEO_CELL_DEG', 0.02))  # ~2.2 km per cell
+GEO_INDEX_TTL = float(os.environ.get('GEO_INDEX_TTL', 60))  # rebuild so writes from other processes show up
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GeoIndex:
+    # Grid-bucket index over searchable workers: cell -> ids, id -> (lat, lng, service_key)
+    def __init__(self, cell_deg=GEO_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._points = {}
+        # (min row, max row, min col, max col) of the occupied cells. It only grows between
+        # rebuilds: after removals it still bounds the cells, just less tightly
+        self._bounds = None
+        self._lock = threading.RLock()
+        self.built_at = 0
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def upsert(self, worker_id, lat, lng, service_key=None):
+        if lat is None or lng is None:
+            return self.remove(worker_id)
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            self.remove(worker_id)
+            self._points[worker_id] = (lat, lng, service_key)
+            i, j = self._cell(lat, lng)
+            self._cells.setdefault((i, j), set()).add(worker_id)
+            if self._bounds is None:
+                self._bounds = (i, i, j, j)
+            else:
+                bi, bI, bj, bJ = self._bounds
+                self._bounds = (min(bi, i), max(bI, i), min(bj, j), max(bJ, j))
+
+    def remove(self, worker_id):
+        with self._lock:
+            point = self._points.pop(worker_id, None)
+            if point is None:
+                return
+            cell = self._cell(point[0], point[1])
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(worker_id)
+                if not bucket:
+                    del self._cells[cell]
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._cells = {}
+            self._points = {}
+            self._bounds = None
+            for r in rows:
+                self.upsert(r['id'], r['lat'], r['lng'], r['service_key'])
+            self.built_at = time.time()
+
+    def _ring(self, ci, cj, r):
+        if r == 0:
+            yield (ci, cj)
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def nearest(self, lat, lng, radius_km=None, limit=None, match=None):
+        # Expanding ring search; returns [(distance_km, worker_id)] sorted by distance
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            if not self._cells:
+                return []
+            ci, cj = self._cell(lat, lng)
+            min_i, max_i, min_j, max_j = self._bounds
+            max_ring = max(ci - min_i, max_i - ci, cj - min_j, max_j - cj, 0)
+
+            found = []
+            r = 0
+            while r <= max_ring:
+                for cell in self._ring(ci, cj, r):
+                    for wid in self._cells.get(cell, ()):
+                        plat, plng, service_key = self._points[wid]
+                        if match is not None and not match(service_key):
+                            continue
+                        d = distance_km(lat, lng, plat, plng)
+                        if radius_km is None or d <= radius_km:
+                            found.append((d, wid))
+                # Anything in ring r+1 or beyond is at least r whole cells away
+                edge_lat = min(89.9, abs(lat) + (r + 1) * self.cell_deg)
+                bound = r * self.cell_deg * KM_PER_DEG * math.cos(math.radians(edge_lat))
+                if radius_km is not None and bound > radius_km:
+                    break
+                if limit and sum(1 for d, _ in found if d <= bound) >= limit:
+                    break
+                r += 1
+
+        found.sort()
+        return found[:limit] if limit else found
+
+
+def load_geo_index(index, conn):
+    rows = db_execute(conn, '''
+        SELECT id, lat, lng, service_key FROM workers
+        WHERE verified = 1 AND (available IS NULL OR available = 1)
+    ''').fetchall()
+    index.rebuild(rows)
+
+
+def ensure_geo_index(index, connect):
+    # connect() -> a primary connection, opened only for a rebuild (see ServiceResolver.ensure)
+    if not index.built_at or time.time() - index.built_at > GEO_INDEX_TTL:
+        conn = connect()
+        try:
+            load_geo_index(index, conn)
+        finally:
+            conn.close()
+    return index
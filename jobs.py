@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import importlib
+import threading
+
+from db import IS_POSTGRES, get_db_connection, db_execute
+
+# Durable job queue for side work that does not have to finish inside the request.
+# enqueue() adds a row to the `jobs` table in the caller's transaction, so a job exists
+# exactly when the write that caused it commits. Workers claim due jobs in batches and
+# run each batch in one transaction (a savepoint per job, one commit per batch); handlers
+# registered with batch=True get all payloads of their kind at once and can coalesce them.
+# A handler may return a function, which runs once the batch has committed (for effects
+# other processes must not see before the data, such as worker snapshot patches).
+# Failed jobs are retried with exponential backoff and kept as 'dead' after JOBS_MAX_ATTEMPTS.
+#
+#   JOBS_WORKER=thread   (default) each app process drains the queue in a background thread
+#   JOBS_WORKER=off      run `python jobs.py worker` as a separate process instead
+
+JOBS_WORKER = os.environ.get('JOBS_WORKER', 'thread')
+JOBS_BATCH_SIZE = int(os.environ.get('JOBS_BATCH_SIZE', 200))
+JOBS_POLL_SECONDS = float(os.environ.get('JOBS_POLL_SECONDS', 1))
+JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 8))
+JOBS_BACKOFF_SECONDS = float(os.environ.get('JOBS_BACKOFF_SECONDS', 2))
+JOBS_BACKOFF_MAX_SECONDS = float(os.environ.get('JOBS_BACKOFF_MAX_SECONDS', 600))
+JOBS_LEASE_SECONDS = float(os.environ.get('JOBS_LEASE_SECONDS', 300))
+
+# Modules whose import registers handlers; loaded by workers before the first claim
+HANDLER_MODULES = ('counters', 'cascade', 'analytics')
+
+_handlers = {}  # kind -> (fn, batch)
+
+
+def register(kind, fn, batch=False):
+    # fn(conn, payload), or fn(conn, [payload, ...]) with batch=True
+    _handlers[kind] = (fn, batch)
+
+
+def load_handlers():
+    for name in HANDLER_MODULES:
+        importlib.import_module(name)
+
+
+# seq numbers jobs in enqueue order: from a sequence on Postgres, MAX + 1 on SQLite,
+# where writers are serialized so no two transactions can take the same number
+ENQUEUE_SQL = 'INSERT INTO jobs (id, kind, payload, run_at) VALUES (?, ?, ?, ?)' if IS_POSTGRES else \
+    'INSERT INTO jobs (id, kind, payload, run_at, seq) VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs))'
+
+
+def enqueue(conn, kind, payload=None, delay=0):
+    job_id = 'job_' + uuid.uuid4().hex
+    db_execute(conn, ENQUEUE_SQL, (job_id, kind, json.dumps(payload), time.time() + delay))
+    return job_id
+
+
+def discard(conn, kind):
+    # For rebuilds that recompute from the source tables what the jobs of `kind` would
+    # apply: call it first in the rebuild's transaction, before reading those tables. It
+    # holds off enqueues and batches until the caller commits (BEGIN IMMEDIATE on SQLite,
+    # a table lock on Postgres), so a batch in flight commits before the rebuild reads.
+    # Queued and dead jobs are deleted; so are jobs a worker has claimed but not started,
+    # which fences them: run_batch re-checks its claim under the same lock and skips them.
+    if IS_POSTGRES:
+        db_execute(conn, 'LOCK TABLE jobs IN SHARE ROW EXCLUSIVE MODE')
+    elif not conn.in_transaction:
+        db_execute(conn, 'BEGIN IMMEDIATE')
+    return db_execute(conn, 'DELETE FROM jobs WHERE kind = ?', (kind,)).rowcount
+
+
+def backoff(attempts):
+    # 2s, 4s, 8s ... capped, with jitter so failed jobs do not retry in lockstep
+    delay = min(JOBS_BACKOFF_SECONDS * 2 ** (attempts - 1), JOBS_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(conn, worker_id, limit=JOBS_BATCH_SIZE):
+    now = time.time()
+    # Jobs whose worker died mid-batch become due again once their lease runs out
+    db_execute(conn, "UPDATE jobs SET status = 'queued', locked_by = NULL WHERE status = 'running' AND locked_until < ?", (now,))
+    pick = "SELECT id FROM jobs WHERE status = 'queued' AND run_at <= ? ORDER BY run_at, seq LIMIT ?"
+    if IS_POSTGRES:
+        pick += ' FOR UPDATE SKIP LOCKED'
+    rows = db_execute(conn, f'''
+        UPDATE jobs SET status = 'running', locked_by = ?, locked_until = ?, attempts = attempts + 1
+        WHERE id IN ({pick})
+        RETURNING id, kind, payload, attempts, run_at, seq, locked_by
+    ''', (worker_id, now + JOBS_LEASE_SECONDS, now, limit)).fetchall()
+    conn.commit()
+    # RETURNING does not keep the subquery's order
+    return sorted(rows, key=lambda r: (r['run_at'], r['seq']))
+
+
+def _run(conn, fn, arg):
+    db_execute(conn, 'SAVEPOINT job')
+    try:
+        return fn(conn, arg)
+    except Exception:
+        db_execute(conn, 'ROLLBACK TO SAVEPOINT job')
+        raise
+    finally:
+        db_execute(conn, 'RELEASE SAVEPOINT job')
+
+
+def fence(conn, jobs):
+    # -> the jobs still claimed by their worker, row-locked until the batch commits. Jobs
+    # that a rebuild discarded, or that another worker took over after the lease ran out,
+    # are skipped
+    kept = set()
+    for i in range(0, len(jobs), 500):
+        part = jobs[i:i + 500]
+        clauses = ' OR '.join('(id = ? AND locked_by = ?)' for _ in part)
+        rows = db_execute(conn, f"UPDATE jobs SET locked_until = locked_until WHERE status = 'running' AND ({clauses}) RETURNING id",
+                          [v for job in part for v in (job['id'], job['locked_by'])]).fetchall()
+        kept.update(r['id'] for r in rows)
+    return [job for job in jobs if job['id'] in kept]
+
+
+def run_batch(conn, jobs):
+    # -> (done, failed); all results are committed together
+    if not IS_POSTGRES and not conn.in_transaction:
+        # Releasing an outermost SQLite savepoint commits; keep the batch in one transaction
+        db_execute(conn, 'BEGIN IMMEDIATE')
+    jobs = fence(conn, jobs)
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job['kind'], []).append(job)
+    done, failed, after_commit = [], [], []
+    for kind, group in by_kind.items():
+        fn, batch = _handlers.get(kind, (None, False))
+        if fn is None:
+            failed.extend((job, f'No handler for job kind {kind}') for job in group)
+            continue
+        if batch and len(group) > 1:
+            try:
+                after_commit.append(_run(conn, fn, [json.loads(job['payload']) for job in group]))
+                done.extend(group)
+                continue
+            except Exception:
+                # Find the job that broke the batch by running them one at a time
+                logging.warning(f'Batch of {len(group)} {kind} jobs failed; retrying them one by one')
+        for job in group:
+            try:
+                after_commit.append(_run(conn, fn, [json.loads(job['payload'])] if batch else json.loads(job['payload'])))
+                done.append(job)
+            except Exception as e:
+                failed.append((job, f'{type(e).__name__}: {e}'))
+
+    for i in range(0, len(done), 500):
+        part = [job['id'] for job in done[i:i + 500]]
+        db_execute(conn, f'DELETE FROM jobs WHERE id IN ({", ".join("?" * len(part))})', part)
+    for job, error in failed:
+        dead = job['attempts'] >= JOBS_MAX_ATTEMPTS
+        db_execute(conn, '''
+            UPDATE jobs SET status = ?, run_at = ?, last_error = ?, locked_by = NULL, locked_until = NULL WHERE id = ?
+        ''', ('dead' if dead else 'queued', time.time() + backoff(job['attempts']), error[:1000], job['id']))
+        log = logging.error if dead else logging.warning
+        log(f"Job {job['id']} ({job['kind']}) failed on attempt {job['attempts']}: {error}")
+    conn.commit()
+    for fn in after_commit:
+        if callable(fn):
+            try:
+                fn()
+            except Exception:
+                logging.exception('Job after-commit step failed')
+    return len(done), len(failed)
+
+
+class Worker:
+    def __init__(self, batch_size=JOBS_BATCH_SIZE, poll=JOBS_POLL_SECONDS):
+        self.id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.batch_size = batch_size
+        self.poll = poll
+        self.stats = {'batches': 0, 'done': 0, 'failed': 0}
+        self._stop = threading.Event()
+        load_handlers()
+
+    def run_once(self):
+        # -> number of jobs claimed
+        conn = get_db_connection()
+        try:
+            jobs = claim(conn, self.id, self.batch_size)
+            if jobs:
+                done, failed = run_batch(conn, jobs)
+                self.stats['batches'] += 1
+                self.stats['done'] += done
+                self.stats['failed'] += failed
+            return len(jobs)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def drain(self):
+        # Runs every job that is due now; returns how many were claimed
+        total = 0
+        while True:
+            n = self.run_once()
+            total += n
+            if n < self.batch_size:
+                return total
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                n = self.run_once()
+            except Exception:
+                logging.exception('Job worker could not process a batch')
+                n = 0
+            if n < self.batch_size:
+                self._stop.wait(self.poll)
+
+    def stop(self):
+        self._stop.set()
+
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def ensure_worker_thread():
+    # One background worker per process; threads do not survive a fork
+    global _worker, _worker_pid
+    if _worker is not None and _worker_pid == os.getpid():
+        return _worker
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid():
+            _worker = Worker()
+            _worker_pid = os.getpid()
+            threading.Thread(target=_worker.run_forever, name='job-worker', daemon=True).start()
+    return _worker
+
+
+def worker_info():
+    # Counters of this process's background worker (empty when it runs elsewhere)
+    return dict(_worker.stats) if _worker is not None and _worker_pid == os.getpid() else {}
+
+
+def queue_info(conn):
+    rows = db_execute(conn, 'SELECT status, COUNT(*) as cnt, MIN(run_at) as due FROM jobs GROUP BY status').fetchall()
+    info = {'queued': 0, 'running': 0, 'dead': 0}
+    for r in rows:
+        info[r['status']] = r['cnt']
+    queued = [r for r in rows if r['status'] == 'queued']
+    info['oldestQueuedSeconds'] = max(0.0, time.time() - queued[0]['due']) if queued else 0.0
+    return info
+
+
+def retry_dead(conn, kind=None):
+    query = "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ? WHERE status = 'dead'"
+    params = [time.time()]
+    if kind:
+        query += ' AND kind = ?'
+        params.append(kind)
+    return db_execute(conn, query, params).rowcount
+
+
+def init_app(app):
+    if JOBS_WORKER != 'thread':
+        return
+
+    @app.before_request
+    def start_job_worker():
+        ensure_worker_thread()
+
+
+if __name__ == '__main__':
+    # python jobs.py worker    -> process jobs until interrupted
+    # python jobs.py drain     -> process every due job, then exit
+    # python jobs.py stats     -> queue depth by status
+    # python jobs.py retry     -> requeue dead jobs
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command in ('worker', 'drain'):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        worker = Worker()
+        if command == 'drain':
+            print(f'Processed {worker.drain()} jobs: {worker.stats}')
+        else:
+            logging.info(f'Job worker {worker.id} started')
+            try:
+                worker.run_forever()
+            except KeyboardInterrupt:
+                pass
+    elif command in ('stats', 'retry'):
+        conn = get_db_connection()
+        try:
+            if command == 'stats':
+                print(json.dumps(queue_info(conn)))
+            else:
+                print(f'Requeued {retry_dead(conn)} dead jobs')
+                conn.commit()
+        finally:
+            conn.close()
+    else:
+        sys.exit('usage: python jobs.py worker|drain|stats|retry')
@@ -0,0 +1,297 @@
+import os
+import re
+import sys
+import time
+import bisect
+import logging
+import threading
+from collections import Counter
+
+from flask import request
+
+from db import query_hooks, pool_info
+
+# Request and query instrumentation, exposed in Prometheus text format by /metrics:
+#   - per-route latency histograms (with p50/p95/p99 estimated from the buckets)
+#   - per-query count and total time, recorded through db_execute
+#   - N+1 detection: the same query run N_PLUS_ONE_THRESHOLD+ times in one request
+#   - an opt-in sampling profiler that writes collapsed stacks for slow requests
+
+METRICS_ENABLED = os.environ.get('METRICS', '1') != '0'
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))  # 0 leaves the profiler off
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_OUTPUT = os.environ.get('PROFILE_OUTPUT', 'slow_requests.folded')
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_IN_LIST = re.compile(r'IN \((?:\?, )*\?\)')
+_SPACE = re.compile(r'\s+')
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation (like histogram_quantile)
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.routes = {}             # (method, route) -> Histogram
+        self.responses = Counter()   # (method, route, status) -> count
+        self.queries = {}            # fingerprint -> [count, seconds]
+        self.n_plus_one = Counter()  # (route, fingerprint) -> requests flagged
+        self.collectors = []
+        self._fingerprints = {}
+
+    def fingerprint(self, query):
+        fp = self._fingerprints.get(query)
+        if fp is None:
+            fp = _IN_LIST.sub('IN (...)', _SPACE.sub(' ', query).strip())
+            if len(self._fingerprints) < 10000:
+                self._fingerprints[query] = fp
+        return fp
+
+    def on_query(self, query, seconds):
+        fp = self.fingerprint(query)
+        with self._lock:
+            entry = self.queries.get(fp)
+            if entry is None:
+                entry = self.queries[fp] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+        state = getattr(self._local, 'request', None)
+        if state is not None:
+            state['queries'][fp] += 1
+
+    def start_request(self):
+        self._local.request = {'start': time.perf_counter(), 'queries': Counter()}
+        profiler.start(threading.get_ident())
+
+    def finish_request(self, method, route, status):
+        state = getattr(self._local, 'request', None)
+        if state is None:
+            return None
+        elapsed = time.perf_counter() - state['start']
+        repeated = [(fp, n) for fp, n in state['queries'].items() if n >= N_PLUS_ONE_THRESHOLD]
+        with self._lock:
+            hist = self.routes.get((method, route))
+            if hist is None:
+                hist = self.routes[(method, route)] = Histogram()
+            hist.observe(elapsed)
+            self.responses[(method, route, status)] += 1
+            first_seen = []
+            for fp, n in repeated:
+                if not self.n_plus_one[(route, fp)]:
+                    first_seen.append((fp, n))
+                self.n_plus_one[(route, fp)] += 1
+        for fp, n in first_seen:
+            logging.warning(f'Possible N+1 in {method} {route}: query ran {n} times in one request: {fp}')
+        return elapsed
+
+    def end_request(self, route):
+        self._local.request = None
+        profiler.stop(threading.get_ident(), route)
+
+    def register_collector(self, collector):
+        # collector() -> [(metric name, labels dict, value)], rendered as gauges
+        self.collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.responses.clear()
+            self.queries.clear()
+            self.n_plus_one.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            routes = {k: (list(h.counts), h.sum, h.count, [h.quantile(q) for q in QUANTILES])
+                      for k, h in self.routes.items()}
+            responses = dict(self.responses)
+            queries = {fp: tuple(v) for fp, v in self.queries.items()}
+            n_plus_one = dict(self.n_plus_one)
+
+        lines += ['# HELP http_request_duration_seconds Request latency by route',
+                  '# TYPE http_request_duration_seconds histogram']
+        for (method, route), (counts, total, count, _) in sorted(routes.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += n
+                lines.append(_sample('http_request_duration_seconds_bucket', {'method': method, 'route': route, 'le': bound}, cumulative))
+            lines.append(_sample('http_request_duration_seconds_sum', {'method': method, 'route': route}, total))
+            lines.append(_sample('http_request_duration_seconds_count', {'method': method, 'route': route}, count))
+
+        lines += ['# HELP http_request_duration_seconds_quantile Latency quantiles estimated from the histogram',
+                  '# TYPE http_request_duration_seconds_quantile gauge']
+        for (method, route), (_, _, _, values) in sorted(routes.items()):
+            for q, v in zip(QUANTILES, values):
+                lines.append(_sample('http_request_duration_seconds_quantile', {'method': method, 'route': route, 'quantile': q}, v))
+
+        lines += ['# HELP http_responses_total Responses by route and status', '# TYPE http_responses_total counter']
+        for (method, route, status), n in sorted(responses.items()):
+            lines.append(_sample('http_responses_total', {'method': method, 'route': route, 'status': status}, n))
+
+        lines += ['# HELP db_queries_total Queries run through db_execute', '# TYPE db_queries_total counter']
+        lines += [_sample('db_queries_total', {'query': fp}, count) for fp, (count, _) in sorted(queries.items())]
+        lines += ['# HELP db_query_seconds_total Time spent in db_execute', '# TYPE db_query_seconds_total counter']
+        lines += [_sample('db_query_seconds_total', {'query': fp}, seconds) for fp, (_, seconds) in sorted(queries.items())]
+
+        lines += ['# HELP db_n_plus_one_total Requests that ran the same query N_PLUS_ONE_THRESHOLD or more times',
+                  '# TYPE db_n_plus_one_total counter']
+        lines += [_sample('db_n_plus_one_total', {'route': route, 'query': fp}, n) for (route, fp), n in sorted(n_plus_one.items())]
+
+        gauges = [(f'db_pool_{k}', {}, v) for k, v in pool_info().items()]
+        for collector in self.collectors:
+            gauges.extend(collector())
+        seen = set()
+        for name, labels, value in gauges:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# TYPE {name} gauge')
+            lines.append(_sample(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    # Samples the stacks of threads that are serving a request; requests slower than
+    # slow_ms get their collapsed stacks ("route;frame;frame count") appended to PROFILE_OUTPUT,
+    # which flamegraph.pl and speedscope read directly.
+    def __init__(self, slow_ms=0, interval=PROFILE_INTERVAL, output=PROFILE_OUTPUT):
+        self.slow_ms = slow_ms
+        self.interval = interval
+        self.output = output
+        self._active = {}  # thread id -> {'start', 'stacks'}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.dumped = 0
+
+    @property
+    def enabled(self):
+        return self.slow_ms > 0
+
+    def configure(self, slow_ms):
+        self.slow_ms = max(0.0, float(slow_ms or 0))
+        if self.enabled and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def start(self, tid):
+        if self.enabled:
+            with self._lock:
+                self._active[tid] = {'start': time.perf_counter(), 'stacks': Counter()}
+
+    def stop(self, tid, route):
+        with self._lock:
+            state = self._active.pop(tid, None)
+        if state is None or not self.enabled:
+            return
+        elapsed_ms = (time.perf_counter() - state['start']) * 1000
+        if elapsed_ms < self.slow_ms or not state['stacks']:
+            return
+        prefix = route.replace(';', ':').replace(' ', '_')
+        with self._lock:
+            with open(self.output, 'a') as f:
+                for stack, n in state['stacks'].items():
+                    f.write(f'{prefix};{stack} {n}\n')
+            self.dumped += 1
+        logging.warning(f'Slow request {route} took {elapsed_ms:.0f}ms; stacks written to {self.output}')
+
+    def _run(self):
+        while self.enabled:
+            time.sleep(self.interval)
+            with self._lock:
+                tids = list(self._active)
+            if not tids:
+                continue
+            frames = sys._current_frames()
+            for tid in tids:
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                with self._lock:
+                    state = self._active.get(tid)
+                    if state is not None:
+                        state['stacks'][';'.join(reversed(stack))] += 1
+
+    def info(self):
+        return {'enabled': self.enabled, 'slowMs': self.slow_ms, 'intervalMs': self.interval * 1000,
+                'output': self.output, 'dumped': self.dumped}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+    return f'{name} {value}'
+
+
+metrics = Metrics()
+profiler = SamplingProfiler()
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def init_app(app):
+    if not METRICS_ENABLED:
+        return
+    if metrics.on_query not in query_hooks:
+        query_hooks.append(metrics.on_query)
+    if PROFILE_SLOW_MS > 0:
+        profiler.configure(PROFILE_SLOW_MS)
+
+    @app.before_request
+    def start_timer():
+        metrics.start_request()
+
+    @app.after_request
+    def record_request(response):
+        route = _route()
+        metrics.finish_request(request.method, route, response.status_code)
+        if response.status_code >= 500:
+            # Routes turn exceptions into {'error': ...}; keep a trace of them in the log
+            body = response.get_json(silent=True) if response.is_json and not response.is_streamed else None
+            error = body.get('error') if isinstance(body, dict) else None
+            logging.error(f'{request.method} {route} -> {response.status_code}: {error}')
+        return response
+
+    @app.teardown_request
+    def end_request(exc):
+        metrics.end_request(_route())
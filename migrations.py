@@ -0,0 +1,539 @@
+import re
+import sys
+import json
+import logging
+from decimal import Decimal
+from datetime import date, datetime
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+from db import IS_POSTGRES, SQLITE_PATH, get_db_connection, db_execute
+# Only for the query-plan check, which must test the queries the app runs today
+from slots import FREE_AT_QUERY, free_at_params
+
+# Versioned schema changes applied on top of the base tables created by init_db.
+# Append new entries; never edit or reorder ones that have shipped. A migration uses only
+# SQL and the helpers in this file, never app modules: their code keeps changing after a
+# migration has shipped, and the migration must do on a fresh database what it did then.
+# Backfills that need newer logic go in a new migration.
+
+
+def add_column(conn, table, column, decl):
+    if IS_POSTGRES:
+        db_execute(conn, f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {decl}')
+        return
+    existing = [r['name'] for r in db_execute(conn, f'PRAGMA table_info({table})').fetchall()]
+    if column not in existing:
+        db_execute(conn, f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def create_indexes(conn, statements):
+    for sql in statements:
+        db_execute(conn, sql)
+
+
+# Frozen copies of app helpers, as they were when the migrations using them shipped
+
+def _service_key(value):
+    # service_keys.normalize_service_key
+    return re.sub(r'[^a-z0-9]+', '_', (value or '').strip().lower()).strip('_')
+
+
+def _save_service_aliases(conn, key, display_name=None):
+    aliases = {_service_key(key), _service_key(display_name)} - {''}
+    for alias in aliases:
+        db_execute(conn, 'INSERT INTO service_aliases (alias, service_key) VALUES (?, ?) ON CONFLICT (alias) DO NOTHING',
+                   (alias, _service_key(key)))
+
+
+_CLOCK = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?\s*$', re.IGNORECASE)
+
+
+def _clock(text):
+    # slots.parse_clock
+    m = _CLOCK.match(str(text or ''))
+    if not m:
+        raise ValueError(f'Invalid time: {text}')
+    hour, minute, ampm = int(m.group(1)), int(m.group(2) or 0), (m.group(3) or '').lower()
+    if ampm:
+        if not 1 <= hour <= 12:
+            raise ValueError(f'Invalid time: {text}')
+        hour = hour % 12 + (12 if ampm.startswith('p') else 0)
+    if hour > 24 or minute > 59 or (hour == 24 and minute):
+        raise ValueError(f'Invalid time: {text}')
+    return hour * 60 + minute
+
+
+def _slot_window(label):
+    # slots.parse_slot_label
+    try:
+        start, end = (_clock(part) for part in str(label).split('-', 1))
+    except ValueError:
+        return None, None
+    if end <= start:
+        end += 24 * 60
+    return start, end
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _worker_fragment(w):
+    # search_projection.build_fragment: the worker's JSON object minus its closing brace
+    doc = json.dumps({
+        'id': w['id'], '_id': w['id'], 'userId': w['user_id'], 'service': w['service'], 'cost': w['cost'],
+        'lat': w['lat'], 'lng': w['lng'], 'bio': w['bio'], 'verified': bool(w['verified']), 'gender': w['gender'],
+        'experience': w['experience'], 'rating': w['rating'], 'totalReviews': w['total_reviews'],
+        'name': w['name'], 'phone': w['phone'], 'slots': json.loads(w['slots'] or '{}'),
+    }, sort_keys=True, separators=(',', ':'), default=_json_default)
+    return doc[:-1]
+
+
+def _project_workers(conn, columns, values):
+    # Reprojects every worker into worker_search; values(w, fragment) -> the row for `columns`
+    db_execute(conn, 'DELETE FROM worker_search')
+    cur = db_execute(conn, 'SELECT w.*, u.name, u.phone FROM workers w JOIN users u ON w.user_id = u.id')
+    insert = conn.cursor()
+    while True:
+        rows = cur.fetchmany(1000)
+        if not rows:
+            break
+        projected = []
+        for w in rows:
+            try:
+                fragment = _worker_fragment(w)
+            except Exception as e:
+                logging.warning(f'Worker {w["id"]} left out of search results: {e}')
+                fragment = None
+            projected.append(values(w, fragment))
+        if IS_POSTGRES:
+            from psycopg2.extras import execute_values
+            execute_values(insert, f'INSERT INTO worker_search ({", ".join(columns)}) VALUES %s', projected, page_size=1000)
+        else:
+            insert.executemany(f'INSERT INTO worker_search ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                               projected)
+
+
+def m001_workers_available(conn):
+    add_column(conn, 'workers', 'available', 'INTEGER DEFAULT 1')
+
+
+def m002_workers_service_key(conn):
+    add_column(conn, 'workers', 'service_key', 'TEXT')
+    db_execute(conn, 'CREATE TABLE IF NOT EXISTS service_aliases (alias TEXT PRIMARY KEY, service_key TEXT NOT NULL)')
+    db_execute(conn, 'CREATE INDEX IF NOT EXISTS idx_workers_service_key ON workers (service_key)')
+    for s in db_execute(conn, 'SELECT key, display_name FROM services').fetchall():
+        _save_service_aliases(conn, s['key'], s['display_name'])
+    for row in db_execute(conn, 'SELECT DISTINCT service FROM workers WHERE service_key IS NULL').fetchall():
+        db_execute(conn, 'UPDATE workers SET service_key = ? WHERE service = ? AND service_key IS NULL',
+                   (_service_key(row['service']), row['service']))
+        _save_service_aliases(conn, row['service'])
+
+
+def m003_hot_path_indexes(conn):
+    create_indexes(conn, [
+        'CREATE INDEX IF NOT EXISTS idx_users_phone ON users (phone)',
+        'CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)',
+        'CREATE INDEX IF NOT EXISTS idx_workers_user_id ON workers (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_workers_service ON workers (service)',
+        'CREATE INDEX IF NOT EXISTS idx_bookings_user_created ON bookings (user_id, created_at DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_bookings_worker_created ON bookings (worker_id, created_at DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_worker_created ON reviews (worker_id, created_at DESC)',
+    ])
+
+
+def m004_keyset_indexes(conn):
+    create_indexes(conn, [
+        'CREATE INDEX IF NOT EXISTS idx_bookings_created_id ON bookings (created_at DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_users_created_id ON users (created_at DESC, id DESC)',
+    ])
+
+
+def m005_counters(conn):
+    db_execute(conn, 'CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL NOT NULL DEFAULT 0)')
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS worker_stats (worker_id TEXT PRIMARY KEY, completed_bookings INTEGER NOT NULL DEFAULT 0, earnings REAL NOT NULL DEFAULT 0)
+    ''')
+    db_execute(conn, 'DELETE FROM counters')
+    db_execute(conn, '''
+        INSERT INTO counters (name, value)
+        SELECT 'users', COUNT(*) FROM users
+        UNION ALL SELECT 'workers', COUNT(*) FROM workers
+        UNION ALL SELECT 'bookings', COUNT(*) FROM bookings
+        UNION ALL SELECT 'revenue', COALESCE(SUM(price), 0) FROM bookings WHERE status = 'completed'
+    ''')
+    db_execute(conn, 'DELETE FROM worker_stats')
+    db_execute(conn, '''
+        INSERT INTO worker_stats (worker_id, completed_bookings, earnings)
+        SELECT worker_id, COUNT(*), COALESCE(SUM(price), 0)
+        FROM bookings WHERE status = 'completed'
+        GROUP BY worker_id
+    ''')
+
+
+def m006_worker_slots(conn):
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS worker_slots (worker_id TEXT NOT NULL, slot TEXT NOT NULL, start_minute INTEGER, end_minute INTEGER, price REAL, available INTEGER DEFAULT 1, PRIMARY KEY (worker_id, slot))
+    ''')
+    db_execute(conn, 'CREATE INDEX IF NOT EXISTS idx_worker_slots_window ON worker_slots (start_minute, end_minute)')
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS slot_reservations (worker_id TEXT NOT NULL, slot TEXT NOT NULL, booking_id TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (worker_id, slot))
+    ''')
+    db_execute(conn, 'CREATE INDEX IF NOT EXISTS idx_slot_reservations_booking ON slot_reservations (booking_id)')
+
+    for w in db_execute(conn, 'SELECT id, slots FROM workers').fetchall():
+        try:
+            slots = json.loads(w['slots'] or '{}')
+            db_execute(conn, 'DELETE FROM worker_slots WHERE worker_id = ?', (w['id'],))
+            for label, info in (slots or {}).items():
+                info = info if isinstance(info, dict) else {}
+                start, end = _slot_window(label)
+                db_execute(conn, '''
+                    INSERT INTO worker_slots (worker_id, slot, start_minute, end_minute, price, available)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (w['id'], label, start, end, info.get('price'), 1 if info.get('available', True) else 0))
+        except (ValueError, AttributeError):
+            logging.warning(f"Skipping unreadable slots for worker {w['id']}")
+    # Existing active bookings hold their slot. If a slot was double booked the earliest
+    # created booking wins; ids are random and only break ties
+    db_execute(conn, '''
+        INSERT INTO slot_reservations (worker_id, slot, booking_id)
+        SELECT worker_id, slot, id FROM (
+            SELECT worker_id, slot, id,
+                   ROW_NUMBER() OVER (PARTITION BY worker_id, slot ORDER BY created_at IS NULL, created_at, id) as n
+            FROM bookings
+            WHERE slot IS NOT NULL AND status NOT IN ('completed', 'cancelled', 'rejected')
+        ) holders WHERE n = 1
+    ''')
+
+
+def m007_reviews(conn):
+    # (worker_id, created_at, id) serves the keyset review feed and supersedes idx_reviews_worker_created
+    create_indexes(conn, [
+        'CREATE INDEX IF NOT EXISTS idx_reviews_worker_keyset ON reviews (worker_id, created_at DESC, id DESC)',
+        'DROP INDEX IF EXISTS idx_reviews_worker_created',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_booking ON reviews (booking_id)',
+    ])
+    db_execute(conn, '''
+        UPDATE workers SET
+            rating = COALESCE((SELECT AVG(r.rating) FROM reviews r WHERE r.worker_id = workers.id), 0),
+            total_reviews = (SELECT COUNT(*) FROM reviews r WHERE r.worker_id = workers.id)
+    ''')
+
+
+def m008_worker_search(conn):
+    # Denormalized read model behind GET /api/workers (see search_projection.py)
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS worker_search (
+            worker_id TEXT PRIMARY KEY, user_id TEXT, service_key TEXT, verified INTEGER, available INTEGER,
+            lat REAL, lng REAL, rating REAL, cost REAL, fragment TEXT
+        )
+    ''')
+    create_indexes(conn, [
+        'CREATE INDEX IF NOT EXISTS idx_worker_search_service ON worker_search (service_key, verified, available)',
+        'CREATE INDEX IF NOT EXISTS idx_worker_search_user ON worker_search (user_id)',
+    ])
+    _project_workers(conn, ['worker_id', 'user_id', 'service_key', 'verified', 'available', 'lat', 'lng', 'rating',
+                            'cost', 'fragment'],
+                     lambda w, fragment: (w['id'], w['user_id'], w['service_key'], w['verified'],
+                                          1 if w['available'] is None else w['available'],
+                                          w['lat'], w['lng'], w['rating'], w['cost'], fragment))
+
+
+def m009_jobs(conn):
+    # Background job queue (see jobs.py); finished jobs are deleted, dead ones kept for inspection
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT, status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL, locked_by TEXT, locked_until REAL,
+            last_error TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    create_indexes(conn, ['CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, run_at)'])
+
+
+def m010_soft_delete(conn):
+    # Set by DELETE_MODE=soft until the purge job removes the account (see cascade.py)
+    add_column(conn, 'users', 'deleted_at', 'TIMESTAMP')
+    add_column(conn, 'workers', 'deleted_at', 'TIMESTAMP')
+    # Cascade deletes find a user's reviews without scanning the table
+    create_indexes(conn, ['CREATE INDEX IF NOT EXISTS idx_reviews_user ON reviews (user_id)'])
+
+
+def m011_sessions(conn):
+    # Logged-out session tokens, kept until they would have expired anyway (see sessions.py)
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS revoked_sessions (
+            jti TEXT PRIMARY KEY, expires_at REAL NOT NULL, revoked_at REAL NOT NULL
+        )
+    ''')
+    # Case-insensitive login and duplicate checks compare LOWER(name) / LOWER(email)
+    create_indexes(conn, [
+        'CREATE INDEX IF NOT EXISTS idx_revoked_sessions_revoked ON revoked_sessions (revoked_at)',
+        'CREATE INDEX IF NOT EXISTS idx_users_name_lower ON users (LOWER(name))',
+        'CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users (LOWER(email))',
+    ])
+
+
+def m012_search_filters(conn):
+    # Filter columns for GET /api/workers (gender is stored lowercased), then reproject everything
+    add_column(conn, 'worker_search', 'gender', 'TEXT')
+    add_column(conn, 'worker_search', 'experience', 'REAL')
+    add_column(conn, 'worker_search', 'total_reviews', 'INTEGER')
+    # Slots running at a given minute: the window index bounds the start, this one finds
+    # slots that run past midnight
+    create_indexes(conn, ['CREATE INDEX IF NOT EXISTS idx_worker_slots_end ON worker_slots (end_minute)'])
+    _project_workers(conn, ['worker_id', 'user_id', 'service_key', 'verified', 'available', 'lat', 'lng', 'rating',
+                            'cost', 'gender', 'experience', 'total_reviews', 'fragment'],
+                     lambda w, fragment: (w['id'], w['user_id'], w['service_key'], w['verified'],
+                                          1 if w['available'] is None else w['available'],
+                                          w['lat'], w['lng'], w['rating'], w['cost'],
+                                          str(w['gender']).strip().lower() if w['gender'] else None,
+                                          w['experience'], w['total_reviews'], fragment))
+
+
+def m013_booking_rollups(conn):
+    # Time-bucketed booking rollups for admin reports (see analytics.py), backfilled from history
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS booking_rollups (
+            dim TEXT NOT NULL, grain TEXT NOT NULL, bucket TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL,
+            bookings INTEGER NOT NULL DEFAULT 0, revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dim, grain, bucket, key, status)
+        )
+    ''')
+    if IS_POSTGRES:
+        buckets = {
+            'hour': "to_char(created_at, 'YYYY-MM-DD\"T\"HH24:00')",
+            'day': "to_char(created_at, 'YYYY-MM-DD')",
+            'week': "to_char(date_trunc('week', created_at), 'YYYY-MM-DD')",
+        }
+    else:
+        buckets = {
+            'hour': "strftime('%Y-%m-%dT%H:00', created_at)",
+            'day': 'date(created_at)',
+            'week': "date(created_at, 'weekday 0', '-6 days')",
+        }
+    db_execute(conn, 'DELETE FROM booking_rollups')
+    for dim, column, grain in [('service', 'service_key', 'hour'), ('service', 'service_key', 'day'),
+                               ('service', 'service_key', 'week'), ('worker', 'worker_id', 'day'),
+                               ('worker', 'worker_id', 'week')]:
+        db_execute(conn, f'''
+            INSERT INTO booking_rollups (dim, grain, bucket, key, status, bookings, revenue)
+            SELECT '{dim}', '{grain}', {buckets[grain]}, {column}, COALESCE(status, ''), COUNT(*), COALESCE(SUM(price), 0)
+            FROM bookings WHERE created_at IS NOT NULL
+            GROUP BY 3, 4, 5
+        ''')
+
+
+
+def m014_jobs_seq(conn):
+    # Enqueue order for the job queue: ids are random, and jobs enqueued in the same
+    # instant (or by processes with skewed clocks) share a run_at
+    if IS_POSTGRES:
+        add_column(conn, 'jobs', 'seq', 'BIGSERIAL')
+    else:
+        add_column(conn, 'jobs', 'seq', 'INTEGER')
+        db_execute(conn, 'UPDATE jobs SET seq = rowid WHERE seq IS NULL')
+        # enqueue() takes MAX(seq) + 1
+        create_indexes(conn, ['CREATE INDEX IF NOT EXISTS idx_jobs_seq ON jobs (seq)'])
+    create_indexes(conn, ['CREATE INDEX IF NOT EXISTS idx_jobs_due_seq ON jobs (status, run_at, seq)',
+                          'DROP INDEX IF EXISTS idx_jobs_due'])
+
+
+MIGRATIONS = [
+    (1, 'workers.available column', m001_workers_available),
+    (2, 'workers.service_key column, index and alias table', m002_workers_service_key),
+    (3, 'indexes for hot lookups', m003_hot_path_indexes),
+    (4, 'keyset pagination indexes', m004_keyset_indexes),
+    (5, 'counters and worker_stats tables', m005_counters),
+    (6, 'normalized worker slots and slot reservations', m006_worker_slots),
+    (7, 'review feed index, one review per booking, rating backfill', m007_reviews),
+    (8, 'worker_search projection table and backfill', m008_worker_search),
+    (9, 'jobs table for the background queue', m009_jobs),
+    (10, 'soft delete columns and cascade delete indexes', m010_soft_delete),
+    (11, 'revoked sessions table and case-insensitive login indexes', m011_sessions),
+    (12, 'worker_search filter columns, slot end index and backfill', m012_search_filters),
+    (13, 'booking_rollups table and backfill', m013_booking_rollups),
+    (14, 'jobs.seq enqueue order', m014_jobs_seq),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Postgres advisory lock key held while one process changes the schema
+SCHEMA_LOCK_KEY = 5_246_810
+
+
+@contextmanager
+def schema_lock(conn):
+    # Processes booting at the same time apply the schema one after another; the ones
+    # that waited find it current and do nothing
+    if IS_POSTGRES:
+        db_execute(conn, 'SELECT pg_advisory_lock(?)', (SCHEMA_LOCK_KEY,))
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.rollback()
+            db_execute(conn, 'SELECT pg_advisory_unlock(?)', (SCHEMA_LOCK_KEY,))
+            conn.commit()
+    elif HAS_FCNTL:
+        with open(SQLITE_PATH + '.schema.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        yield
+
+
+def applied_versions(conn):
+    db_execute(conn, '''
+        CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    ''')
+    conn.commit()
+    return {r['version'] for r in db_execute(conn, 'SELECT version FROM schema_migrations').fetchall()}
+
+
+def run_migrations(conn):
+    applied = applied_versions(conn)
+    ran = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            migrate(conn)
+            db_execute(conn, 'INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logging.exception(f'Migration {version} ({name}) failed')
+            raise
+        logging.info(f'Applied migration {version}: {name}')
+        ran.append(version)
+    return ran
+
+
+# Queries that must be served by an index: (name, table that must not be scanned, sql, params)
+HOT_QUERIES = [
+    ('user by phone', 'users', 'SELECT id FROM users WHERE phone = ? AND deleted_at IS NULL', ('0',)),
+    ('user by phone or email', 'users', 'SELECT id FROM users WHERE (phone = ? OR email = ?) AND deleted_at IS NULL', ('0', 'x')),
+    ('login by role and phone', 'users', 'SELECT * FROM users WHERE role = ? AND phone = ? AND deleted_at IS NULL', ('user', '0')),
+    ('admin login by name', 'users', '''
+        SELECT * FROM users WHERE role = ? AND password = ? AND LOWER(name) = LOWER(?) AND deleted_at IS NULL
+    ''', ('admin', 'x', 'Admin')),
+    ('duplicate user check', 'users', '''
+        SELECT COUNT(*) as cnt FROM users
+        WHERE (phone = ? OR LOWER(name) = LOWER(?) OR (email != '' AND LOWER(email) = LOWER(?))) AND deleted_at IS NULL
+    ''', ('0', 'x', 'x')),
+    ('revoked sessions since', 'revoked_sessions', '''
+        SELECT jti, expires_at, revoked_at FROM revoked_sessions WHERE revoked_at >= ? AND expires_at > ?
+    ''', (0, 0)),
+    ('worker by user', 'workers', 'SELECT id FROM workers WHERE user_id = ?', ('x',)),
+    ('workers by service key', 'workers', '''
+        SELECT w.*, u.name FROM workers w JOIN users u ON w.user_id = u.id
+        WHERE w.verified = 1 AND (w.available IS NULL OR w.available = 1) AND w.service_key IN (?, ?)
+    ''', ('plumber', 'painter')),
+    ('search projection by service key', 'worker_search', '''
+        SELECT worker_id, lat, lng, rating, cost, fragment FROM worker_search
+        WHERE verified = 1 AND available = 1 AND fragment IS NOT NULL AND service_key IN (?, ?)
+    ''', ('plumber', 'painter')),
+    ('due jobs', 'jobs', '''
+        SELECT id FROM jobs WHERE status = 'queued' AND run_at <= ? ORDER BY run_at, seq LIMIT ?
+    ''', (0, 200)),
+    ('bookings for user', 'bookings', '''
+        SELECT b.*, u.name as worker_name FROM bookings b
+        JOIN workers w ON b.worker_id = w.id JOIN users u ON w.user_id = u.id
+        WHERE b.user_id = ? ORDER BY b.created_at DESC
+    ''', ('x',)),
+    ('bookings for worker', 'bookings', '''
+        SELECT b.*, u.name as user_name FROM bookings b JOIN users u ON b.user_id = u.id
+        WHERE b.worker_id = ? ORDER BY b.created_at DESC
+    ''', ('x',)),
+    ('reviews for worker', 'reviews', '''
+        SELECT r.*, u.name as user_name FROM reviews r JOIN users u ON r.user_id = u.id
+        WHERE r.worker_id = ? AND (r.created_at, r.id) < (?, ?) ORDER BY r.created_at DESC, r.id DESC LIMIT ?
+    ''', ('x', '2100-01-01', 'x', 20)),
+    ('reviews by user', 'reviews', 'SELECT id FROM reviews WHERE user_id = ?', ('x',)),
+    ('review for booking', 'reviews', 'SELECT id FROM reviews WHERE booking_id = ?', ('x',)),
+    ('workers with a free slot now', 'worker_slots', FREE_AT_QUERY, free_at_params(600)),
+    ('free slots in a window', 'worker_slots', '''
+        SELECT s.worker_id FROM worker_slots s
+        LEFT JOIN slot_reservations r ON r.worker_id = s.worker_id AND r.slot = s.slot
+        WHERE s.start_minute >= ? AND s.end_minute <= ? AND s.available = 1 AND r.worker_id IS NULL
+    ''', (1020, 1140)),
+    ('admin bookings page', 'bookings', '''
+        SELECT b.*, u.name as user_name FROM bookings b JOIN users u ON b.user_id = u.id
+        WHERE (b.created_at, b.id) < (?, ?) ORDER BY b.created_at DESC, b.id DESC LIMIT ?
+    ''', ('2100-01-01', 'x', 100)),
+    ('booking rollups for a range', 'booking_rollups', '''
+        SELECT bucket, key, status, bookings, revenue FROM booking_rollups
+        WHERE dim = ? AND grain = ? AND bucket >= ? AND bucket <= ? AND key = ? ORDER BY bucket, key
+    ''', ('worker', 'week', '2026-01-05', '2026-03-30', 'x')),
+    ('admin users page', 'users', '''
+        SELECT * FROM users WHERE deleted_at IS NULL AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', ('2100-01-01', 'x', 100)),
+]
+
+
+def _pg_seq_scans(plan):
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan.get('Relation Name'))
+    for child in plan.get('Plans', []):
+        found.extend(_pg_seq_scans(child))
+    return found
+
+
+def check_query_plans(conn):
+    # Returns [(name, plan detail)] for every hot query that plans a full scan of its table
+    failures = []
+    for name, table, sql, params in HOT_QUERIES:
+        if IS_POSTGRES:
+            # Small tables make seq scans cheapest; ask whether an index path exists at all
+            db_execute(conn, 'SET LOCAL enable_seqscan = off')
+            row = db_execute(conn, 'EXPLAIN (FORMAT JSON) ' + sql, params).fetchone()
+            plan = list(row.values())[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            if table in _pg_seq_scans(plan[0]['Plan']):
+                failures.append((name, json.dumps(plan[0]['Plan'])))
+            conn.rollback()
+        else:
+            details = [r['detail'] for r in db_execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+            aliases = {table, table[0]}
+            if any(d.startswith('SCAN ') and d.split()[1] in aliases and 'INDEX' not in d for d in details):
+                failures.append((name, '; '.join(details)))
+    return failures
+
+
+if __name__ == '__main__':
+    # python migrations.py          -> apply pending migrations
+    # python migrations.py check    -> fail if a hot query plans as a sequential scan
+    conn = get_db_connection()
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == 'check':
+            run_migrations(conn)
+            failures = check_query_plans(conn)
+            for name, detail in failures:
+                print(f'SEQUENTIAL SCAN: {name}: {detail}')
+            print(f'{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} hot queries use an index')
+            sys.exit(1 if failures else 0)
+        with schema_lock(conn):
+            ran = run_migrations(conn)
+        if ran:
+            # Migrations may rewrite worker_search; the snapshot rebuilds on the next search
+            import worker_snapshot
+            worker_snapshot.invalidate()
+        print(f'Applied migrations: {ran}' if ran else 'Schema is up to date.')
+    finally:
+        conn.close()
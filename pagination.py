@@ -0,0 +1,82 @@
+import json
+import uuid
+import base64
+
+from db import IS_POSTGRES, qry
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([str(created_at), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return str(created_at), str(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_limit(value):
+    try:
+        limit = int(value) if value else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError('Invalid limit')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_query(query, params, created_col, id_col, cursor, limit):
+    # Newest first; the cursor is the (created_at, id) of the last row already returned.
+    # `query` must end in a WHERE clause (use WHERE 1 = 1 if there is nothing to filter).
+    params = list(params)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query += f' AND ({created_col}, {id_col}) < (?, ?)'
+        params += [created_at, row_id]
+    query += f' ORDER BY {created_col} DESC, {id_col} DESC LIMIT ?'
+    params.append(limit + 1)  # one extra row tells us whether there is a next page
+    return query, params
+
+
+def split_page(rows, limit):
+    # -> (rows for this page, next cursor or None)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last['created_at'], last['id'])
+
+
+def stream_rows(conn, query, params=None):
+    # Yield rows without materialising the result: a named (server-side) cursor on
+    # PostgreSQL, batched fetchmany on SQLite.
+    if IS_POSTGRES:
+        cur = conn.cursor(name='stream_' + uuid.uuid4().hex)
+        cur.itersize = STREAM_BATCH_SIZE
+    else:
+        cur = conn.cursor()
+    try:
+        cur.execute(qry(query), params or ())
+        while True:
+            rows = cur.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        cur.close()
+
+
+def ndjson_lines(connect, query, params, to_json):
+    # Generator for a streamed response; owns its connection until the client is done
+    conn = connect()
+    try:
+        for row in stream_rows(conn, query, params):
+            yield json.dumps(to_json(row), default=str) + '\n'
+    finally:
+        conn.close()
@@ -0,0 +1,239 @@
+import os
+import math
+import heapq
+import importlib.util
+from array import array
+
+# numpy is imported on the first batched call, not at import time: processes that never
+# rank (the job worker, CLIs, migrations) skip its import cost
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+_numpy = None
+
+
+def numpy_module():
+    # -> the numpy module (imported once, then cached), or None to use the pure Python paths
+    global _numpy, HAS_NUMPY
+    if _numpy is None and HAS_NUMPY:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            HAS_NUMPY = False
+    return _numpy if HAS_NUMPY else None
+
+
+EARTH_RADIUS_KM = 6371
+
+# sort key -> (column, descending)
+SORT_KEYS = {
+    'distance': ('distances', False),
+    'rating': ('ratings', True),
+    'cost': ('costs', False),
+    'cost_desc': ('costs', True),
+    'relevance': ('relevance', True),
+}
+
+
+def _weights(text):
+    weights = {}
+    for part in text.split(','):
+        name, _, value = part.partition('=')
+        weights[name.strip()] = float(value)
+    return weights
+
+
+# Composite relevance: each term is scaled to 0..1 (1 is best) and weighted
+RELEVANCE_WEIGHTS = _weights(os.environ.get('SEARCH_RELEVANCE_WEIGHTS', 'distance=0.4,rating=0.3,reviews=0.1,price=0.2'))
+# Upper edges of the price facet buckets; the last bucket is open-ended
+PRICE_BUCKETS = [float(v) for v in os.environ.get('SEARCH_PRICE_BUCKETS', '250,500,1000,2000').split(',')]
+NO_SERVICE = ''  # facet key for workers whose service key is missing
+
+
+def _column(values):
+    # Contiguous float column; None (or anything unparsable) becomes NaN
+    values = [math.nan if v is None else v for v in values]
+    np = numpy_module()
+    try:
+        return np.array(values, dtype=np.float64) if np is not None else array('d', values)
+    except (TypeError, ValueError):
+        values = [_num(v) for v in values]
+        return np.array(values, dtype=np.float64) if np is not None else array('d', values)
+
+
+def _num(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class WorkerArrays:
+    # Candidate coordinates and ranking columns held in contiguous float arrays
+    def __init__(self, lats, lngs, ratings=None, costs=None, reviews=None):
+        self.lats = _column(lats)
+        self.lngs = _column(lngs)
+        self._raw = {'ratings': ratings, 'costs': costs, 'reviews': reviews}
+        self._columns = {}
+        self.distances = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls([r['lat'] for r in rows], [r['lng'] for r in rows],
+                   [r['rating'] for r in rows], [r['cost'] for r in rows],
+                   [r['total_reviews'] for r in rows] if rows and 'total_reviews' in rows[0].keys() else None)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def compute_distances(self, lat, lng):
+        # One pass over all candidates; rows without coordinates get 0 like haversine()
+        self.distances = haversine_batch(float(lat), float(lng), self.lats, self.lngs)
+        return self.distances
+
+    def top_k(self, sort='distance', k=None):
+        # Indices of the best k rows for the sort key, best first
+        column, descending = SORT_KEYS[sort]
+        values = self.column(column)
+        if values is None:
+            values = [0.0] * len(self)
+        return top_k(values, k, descending)
+
+    def column(self, name):
+        if name == 'distances':
+            return self.distances
+        if name == 'relevance':
+            return relevance_scores(self.distances, self.column('ratings'), self.column('reviews'), self.column('costs'), len(self))
+        if name not in self._columns:
+            raw = self._raw.get(name)
+            self._columns[name] = _column(raw) if raw is not None else None
+        return self._columns[name]
+
+
+def haversine_batch(lat, lng, lats, lngs):
+    np = numpy_module()
+    if np is not None:
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        missing = np.isnan(lats) | np.isnan(lngs) | (lats == 0) | (lngs == 0)
+        p1 = math.radians(lat)
+        p2 = np.radians(lats)
+        a = np.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(np.radians(lngs - lng) / 2) ** 2
+        d = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+        d[missing] = 0
+        return d
+
+    p1 = math.radians(lat)
+    cos_p1 = math.cos(p1)
+    sin, cos, asin, sqrt, rad = math.sin, math.cos, math.asin, math.sqrt, math.radians
+    out = array('d', bytes(8 * len(lats)))
+    for i, (la, ln) in enumerate(zip(lats, lngs)):
+        if not la or not ln or la != la or ln != ln:
+            continue
+        p2 = rad(la)
+        a = sin((p2 - p1) / 2) ** 2 + cos_p1 * cos(p2) * sin(rad(ln - lng) / 2) ** 2
+        out[i] = 2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0)))
+    return out
+
+
+def top_k(values, k=None, descending=False):
+    # Partial sort: select k then order only those; missing values sort last
+    n = len(values)
+    if k is None or k > n:
+        k = n
+    if k <= 0:
+        return []
+    np = numpy_module()
+    if np is not None:
+        keys = np.asarray(values, dtype=np.float64)
+        keys = -keys if descending else keys.copy()
+        keys[np.isnan(keys)] = np.inf
+        if k < n:
+            idx = np.argpartition(keys, k - 1)[:k]
+            return idx[np.argsort(keys[idx], kind='stable')].tolist()
+        return np.argsort(keys, kind='stable').tolist()
+
+    def key(i):
+        v = values[i]
+        if v != v:
+            return math.inf
+        return -v if descending else v
+    if k < n:
+        return heapq.nsmallest(k, range(n), key=key)
+    return sorted(range(n), key=key)
+
+
+def _scaled(values, n, best_low=False, top=None):
+    # 0..1 with 1 the best; missing values score 0
+    np = numpy_module()
+    if values is None:
+        return np.zeros(n) if np is not None else [0.0] * n
+    if np is not None:
+        v = np.asarray(values, dtype=np.float64)
+        known = ~np.isnan(v)
+        if top is None:
+            top = float(v[known].max()) if known.any() else 0.0
+        if top <= 0:
+            # All zero (free, or right here): the best possible value when lower is better
+            return known.astype(np.float64) if best_low else np.zeros(n)
+        out = np.clip(v / top, 0, 1)
+        out = 1 - out if best_low else out
+        out[~known] = 0
+        return out
+    known = [x for x in values if x == x]
+    if top is None:
+        top = max(known) if known else 0.0
+    if top <= 0:
+        return [1.0 if best_low and x == x else 0.0 for x in values]
+    return [0.0 if x != x else (1 - min(max(x / top, 0), 1) if best_low else min(max(x / top, 0), 1)) for x in values]
+
+
+def relevance_scores(distances, ratings, reviews, costs, n, weights=None):
+    # Higher is better: near, well rated, often reviewed and cheap, relative to the other candidates
+    w = weights or RELEVANCE_WEIGHTS
+    np = numpy_module()
+    if reviews is not None:
+        reviews = np.log1p(np.asarray(reviews, dtype=np.float64)) if np is not None else \
+            [math.log1p(x) if x == x and x > -1 else math.nan for x in reviews]
+    terms = [
+        (w.get('distance', 0), _scaled(distances, n, best_low=True)),
+        (w.get('rating', 0), _scaled(ratings, n, top=5.0)),
+        (w.get('reviews', 0), _scaled(reviews, n)),
+        (w.get('price', 0), _scaled(costs, n, best_low=True)),
+    ]
+    if np is not None:
+        return sum(weight * term for weight, term in terms)
+    return [sum(weight * term[i] for weight, term in terms) for i in range(n)]
+
+
+def price_bucket_labels(edges=None):
+    edges = PRICE_BUCKETS if edges is None else edges
+    lows = [0.0] + edges
+    return [f'{lo:g}-{hi:g}' for lo, hi in zip(lows, edges)] + [f'{edges[-1]:g}+']
+
+
+def facet_counts(services, costs, edges=None):
+    # -> ({service: count}, {price bucket: count}) over the same candidates; unknown prices are
+    # skipped and workers without a service key are counted under NO_SERVICE
+    edges = PRICE_BUCKETS if edges is None else edges
+    labels = price_bucket_labels(edges)
+    np = numpy_module()
+    if np is not None:
+        # np.unique sorts, and None does not compare with str
+        services = np.asarray(services, dtype=object)
+        services = np.where(np.equal(services, None), NO_SERVICE, services)
+        keys, counts = np.unique(services, return_counts=True)
+        by_service = {k.item() if hasattr(k, 'item') else k: int(c) for k, c in zip(keys, counts)}
+        costs = np.asarray(costs, dtype=np.float64)
+        costs = costs[~np.isnan(costs)]
+        buckets = np.bincount(np.searchsorted(edges, costs, side='right'), minlength=len(labels))
+        by_price = {label: int(c) for label, c in zip(labels, buckets) if c}
+        return by_service, by_price
+    by_service, by_price = {}, {}
+    for key in services:
+        key = NO_SERVICE if key is None else key
+        by_service[key] = by_service.get(key, 0) + 1
+    for cost in costs:
+        if cost == cost:
+            label = labels[sum(1 for edge in edges if cost >= edge)]
+            by_price[label] = by_price.get(label, 0) + 1
+    return by_service, by_price
@@ -0,0 +1,187 @@
+import os
+import math
+import time
+import logging
+import itertools
+import threading
+
+from flask import request
+
+from db import IS_POSTGRES, PostgresPool, SqliteConnections, PooledConnection, get_db_connection, \
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_IDLE_SECONDS, DB_POOL_HEALTHCHECK_SECONDS
+
+# Read/write splitting. Read-only routes take their connection from get_read_connection(),
+# which hands out replica connections round-robin and falls back to the primary when no
+# replica is healthy. After a client writes, it reads from the primary for
+# REPLICA_STICKY_SECONDS (tracked in a cookie), so it sees its own writes despite lag.
+#
+#   DATABASE_REPLICA_URLS=postgres://r1/db,postgres://r2/db     (PostgreSQL)
+#   SQLITE_REPLICA_PATHS=/data/replica1.db,/data/replica2.db    (SQLite, for local testing)
+
+REPLICA_URLS = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+SQLITE_REPLICA_PATHS = [p.strip() for p in os.environ.get('SQLITE_REPLICA_PATHS', '').split(',') if p.strip()]
+REPLICA_HEALTHCHECK_SECONDS = float(os.environ.get('REPLICA_HEALTHCHECK_SECONDS', 10))
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 30))
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+STICKY_COOKIE = 'db_primary_until'
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# NULL on a primary (nothing replayed), so a primary standing in as a replica reports no lag
+LAG_QUERY = 'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) as lag'
+
+
+class Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+        self.checked_at = 0.0
+        self.lag = 0.0
+        self.stats = {'reads': 0, 'failures': 0}
+
+
+class ReplicaRouter:
+    def __init__(self, replicas, healthcheck_seconds=REPLICA_HEALTHCHECK_SECONDS, max_lag=REPLICA_MAX_LAG_SECONDS):
+        self.replicas = replicas
+        self.healthcheck_seconds = healthcheck_seconds
+        self.max_lag = max_lag
+        self._turn = itertools.count()
+        self.stats = {'primary_fallbacks': 0, 'sticky_reads': 0}
+
+    def _probe(self, replica):
+        raw = replica.pool.acquire()
+        try:
+            cur = raw.cursor()
+            if IS_POSTGRES:
+                cur.execute(LAG_QUERY)
+                row = cur.fetchone()
+                replica.lag = float(row['lag'] or 0)
+            else:
+                # An empty or foreign file would open fine; require the migrated schema
+                cur.execute('SELECT MAX(version) FROM schema_migrations')
+            cur.close()
+        finally:
+            replica.pool.release(raw)
+        return replica.lag <= self.max_lag
+
+    def _available(self, replica):
+        # Health is re-checked at most every healthcheck_seconds, in the request that notices
+        now = time.time()
+        if now - replica.checked_at >= self.healthcheck_seconds:
+            replica.checked_at = now
+            try:
+                healthy = self._probe(replica)
+            except Exception as e:
+                healthy = False
+                replica.stats['failures'] += 1
+                if replica.healthy:
+                    logging.warning(f'Read replica {replica.name} failed its health check: {e}')
+            if healthy != replica.healthy:
+                if healthy:
+                    logging.info(f'Read replica {replica.name} is healthy again')
+                elif replica.lag > self.max_lag:
+                    logging.warning(f'Read replica {replica.name} is {replica.lag:.0f}s behind; reading from the primary')
+            replica.healthy = healthy
+        return replica.healthy
+
+    def acquire(self):
+        # -> (replica, raw connection), or (None, None) if no replica can serve reads
+        n = len(self.replicas)
+        start = next(self._turn)
+        for i in range(n):
+            replica = self.replicas[(start + i) % n]
+            if not self._available(replica):
+                continue
+            try:
+                raw = replica.pool.acquire()
+            except Exception as e:
+                replica.healthy = False
+                replica.checked_at = time.time()
+                replica.stats['failures'] += 1
+                logging.warning(f'Read replica {replica.name} is unreachable: {e}')
+                continue
+            replica.stats['reads'] += 1
+            return replica, raw
+        self.stats['primary_fallbacks'] += 1
+        return None, None
+
+    def info(self):
+        info = dict(self.stats, replicas=len(self.replicas), healthy=sum(r.healthy for r in self.replicas))
+        for r in self.replicas:
+            info[f'{r.name}_reads'] = r.stats['reads']
+            info[f'{r.name}_failures'] = r.stats['failures']
+        return info
+
+
+def build_router():
+    if IS_POSTGRES and REPLICA_URLS:
+        return ReplicaRouter([
+            Replica(f'replica{i}', PostgresPool(url, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+                                                DB_POOL_IDLE_SECONDS, DB_POOL_HEALTHCHECK_SECONDS))
+            for i, url in enumerate(REPLICA_URLS)
+        ])
+    if not IS_POSTGRES and SQLITE_REPLICA_PATHS:
+        return ReplicaRouter([Replica(f'replica{i}', SqliteConnections(path)) for i, path in enumerate(SQLITE_REPLICA_PATHS)])
+    return None
+
+
+_router = None
+_router_pid = None
+_router_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_router():
+    # Replica pools are per process, like the primary pool
+    global _router, _router_pid
+    if _router_pid != os.getpid():
+        with _router_lock:
+            if _router_pid != os.getpid():
+                _router = build_router()
+                _router_pid = os.getpid()
+    return _router
+
+
+def get_read_connection():
+    # For read-only work; writes must keep using get_db_connection()
+    router = get_router()
+    if router is None:
+        return get_db_connection()
+    if getattr(_local, 'primary', False):
+        router.stats['sticky_reads'] += 1
+        return get_db_connection()
+    replica, raw = router.acquire()
+    if raw is None:
+        return get_db_connection()
+    return PooledConnection(replica.pool, raw)
+
+
+def replica_info():
+    router = get_router()
+    return router.info() if router is not None else {}
+
+
+def init_app(app):
+    if get_router() is None:
+        return
+
+    @app.before_request
+    def choose_read_target():
+        try:
+            until = float(request.cookies.get(STICKY_COOKIE, 0))
+        except ValueError:
+            until = 0
+        _local.primary = request.method not in READ_METHODS or until > time.time()
+
+    @app.after_request
+    def stick_to_primary(response):
+        # Read-your-writes: this client's next reads go to the primary until replicas catch up
+        if request.method not in READ_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + REPLICA_STICKY_SECONDS:.3f}',
+                                max_age=math.ceil(REPLICA_STICKY_SECONDS), httponly=True, samesite='Lax')
+        return response
+
+    @app.teardown_request
+    def reset_read_target(exc):
+        _local.primary = False
@@ -0,0 +1,138 @@
+import os
+import gzip
+import threading
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+# auto: orjson when installed, else the standard library; stdlib forces the standard library
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+
+# Static files kept precompressed in memory (refreshed when the file changes on disk)
+PRECOMPRESSED_FILES = ('indexx.html', 'style.css')
+
+_static_variants = {}  # (path, encoding) -> (mtime, bytes)
+_static_lock = threading.Lock()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # jsonify() through orjson; dates still go through Flask's default (HTTP date strings)
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent') or kwargs.get('cls'):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def choose_encoding(accept_encoding):
+    accepted = {part.split(';')[0].strip() for part in (accept_encoding or '').lower().split(',')}
+    if HAS_BROTLI and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=max(1, min(COMPRESS_LEVEL, 11)))
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+def static_variant(path, encoding):
+    mtime = os.path.getmtime(path)
+    with _static_lock:
+        entry = _static_variants.get((path, encoding))
+    if entry and entry[0] == mtime:
+        return entry[1]
+    with open(path, 'rb') as f:
+        data = compress(f.read(), encoding)
+    with _static_lock:
+        _static_variants[(path, encoding)] = (mtime, data)
+    return data
+
+
+def _static_file(app):
+    if request.endpoint == 'serve_index':
+        name = 'indexx.html'
+    elif request.endpoint == 'static':
+        name = (request.view_args or {}).get('filename')
+    else:
+        return None
+    if name not in PRECOMPRESSED_FILES:
+        return None
+    return os.path.join(app.static_folder, name)
+
+
+def init_app(app):
+    if JSON_BACKEND == 'orjson' and not HAS_ORJSON:
+        raise RuntimeError('JSON_BACKEND=orjson but orjson is not installed')
+    if JSON_BACKEND != 'stdlib' and HAS_ORJSON:
+        app.json = OrjsonProvider(app)
+
+    # Warm the precompressed static variants once per process
+    for name in PRECOMPRESSED_FILES:
+        path = os.path.join(app.static_folder, name)
+        if os.path.exists(path):
+            for encoding in ('br', 'gzip') if HAS_BROTLI else ('gzip',):
+                static_variant(path, encoding)
+
+    @app.after_request
+    def conditional_and_compressed(response):
+        if request.method != 'GET' or response.status_code != 200:
+            return response
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+
+        static_path = _static_file(app)
+        if static_path is not None:
+            if encoding:
+                # send_static_file already handled ETag/If-None-Match; swap in the cached encoded body
+                data = static_variant(static_path, encoding)
+                etag, weak = response.get_etag()
+                response.direct_passthrough = False
+                response.set_data(data)
+                response.headers['Content-Encoding'] = encoding
+                if etag:
+                    response.set_etag(f'{etag}-{encoding}', weak=bool(weak))
+                    response.make_conditional(request)
+            response.vary.add('Accept-Encoding')
+            return response
+
+        if response.mimetype != 'application/json' or response.is_streamed:
+            return response
+
+        # Clients keep the body and revalidate with If-None-Match; unchanged data costs a 304
+        response.add_etag()
+        response.headers.setdefault('Cache-Control', 'no-cache')
+        response.make_conditional(request)
+        if response.status_code != 200:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if encoding and 'Content-Encoding' not in response.headers:
+            body = response.get_data()
+            if len(body) >= COMPRESS_MIN_BYTES:
+                response.set_data(compress(body, encoding))
+                response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,83 @@
+import sys
+import uuid
+
+from db import get_db_connection, db_execute
+import search_projection
+import worker_snapshot
+
+# workers.rating / total_reviews are a running mean kept current as reviews are written,
+# so searches never aggregate the reviews table. recompute_ratings() rebuilds them.
+
+
+class ReviewError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_rating(value):
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        raise ReviewError('Rating must be a number from 1 to 5')
+    if not 1 <= rating <= 5:
+        raise ReviewError('Rating must be a number from 1 to 5')
+    return rating
+
+
+def add_review(conn, booking_id, user_id, rating, comments=None):
+    # Runs in the caller's transaction; a second review of the same booking raises IntegrityError
+    rating = parse_rating(rating)
+    booking = db_execute(conn, 'SELECT user_id, worker_id, status FROM bookings WHERE id = ?', (booking_id,)).fetchone()
+    if not booking:
+        raise ReviewError('Booking not found', 404)
+    if user_id and booking['user_id'] != user_id:
+        raise ReviewError('Only the customer who made the booking can review it', 403)
+    if booking['status'] != 'completed':
+        raise ReviewError('Only completed bookings can be reviewed')
+
+    review_id = 'review_' + uuid.uuid4().hex
+    db_execute(conn, '''
+        INSERT INTO reviews (id, booking_id, user_id, worker_id, rating, comments)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (review_id, booking_id, booking['user_id'], booking['worker_id'], rating, comments))
+    # Single statement, so concurrent reviews of one worker cannot lose an update
+    db_execute(conn, '''
+        UPDATE workers SET
+            rating = (COALESCE(rating, 0) * COALESCE(total_reviews, 0) + ?) / (COALESCE(total_reviews, 0) + 1),
+            total_reviews = COALESCE(total_reviews, 0) + 1
+        WHERE id = ?
+    ''', (rating, booking['worker_id']))
+    return review_id, booking['worker_id']
+
+
+def recompute_ratings(conn, worker_ids=None):
+    # Batch reconciliation from the reviews table; returns the number of workers updated
+    query = '''
+        UPDATE workers SET
+            rating = COALESCE((SELECT AVG(r.rating) FROM reviews r WHERE r.worker_id = workers.id), 0),
+            total_reviews = (SELECT COUNT(*) FROM reviews r WHERE r.worker_id = workers.id)
+    '''
+    if worker_ids is None:
+        return db_execute(conn, query).rowcount
+    updated = 0
+    worker_ids = list(worker_ids)
+    for i in range(0, len(worker_ids), 500):
+        part = worker_ids[i:i + 500]
+        updated += db_execute(conn, query + f' WHERE id IN ({", ".join("?" * len(part))})', part).rowcount
+    return updated
+
+
+if __name__ == '__main__':
+    # python reviews.py recompute
+    if sys.argv[1:] != ['recompute']:
+        sys.exit('usage: python reviews.py recompute')
+    conn = get_db_connection()
+    try:
+        updated = recompute_ratings(conn)
+        search_projection.rebuild(conn)
+        conn.commit()
+        worker_snapshot.invalidate()
+        print(f'Ratings recomputed for {updated} workers')
+    finally:
+        conn.close()
@@ -0,0 +1,237 @@
+import sys
+import json
+import logging
+from decimal import Decimal
+from datetime import date, datetime
+
+from db import IS_POSTGRES, get_db_connection, db_execute
+import slots
+import worker_snapshot
+
+# worker_search is a read model for GET /api/workers: one row per worker with the columns
+# the search filters and ranks on, plus `fragment`, the worker's JSON object already
+# serialized minus its closing brace. A search response is assembled by appending the
+# per-request distance to each fragment and joining them, so no dict is built per row.
+# Writers call refresh_workers() in their own transaction; rebuild() reconciles everything.
+# Every change is mirrored into the shared worker snapshot (see worker_snapshot.py), which
+# other processes read without a transaction: writers get the patches back as a Changes
+# and publish() them only after their commit, so a rollback never reaches the snapshot.
+
+BATCH_SIZE = 1000
+
+COLUMNS = ['worker_id', 'user_id', 'service_key', 'verified', 'available', 'lat', 'lng', 'rating', 'cost',
+           'gender', 'experience', 'total_reviews', 'fragment']
+
+SOURCE_QUERY = '''
+    SELECT w.*, u.name, u.phone FROM workers w JOIN users u ON w.user_id = u.id
+'''
+
+# Rows a search may return, with what ranking needs; fragments are NULL for rows that cannot be served
+SEARCH_QUERY = '''
+    SELECT s.worker_id as id, s.service_key, s.lat, s.lng, s.rating, s.cost, s.total_reviews, s.fragment FROM worker_search s
+    WHERE s.verified = 1 AND s.available = 1 AND s.fragment IS NOT NULL
+'''
+
+
+def normalize_gender(value):
+    return str(value).strip().lower() if value else None
+
+
+def _number(args, name, cast=float):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def parse_filters(args):
+    # Search filters from query parameters; raises ValueError for values that do not parse
+    at = args.get('at')
+    filters = {
+        'min_cost': _number(args, 'min_cost'),
+        'max_cost': _number(args, 'max_cost'),
+        'min_rating': _number(args, 'min_rating'),
+        'min_experience': _number(args, 'min_experience'),
+        'genders': [g for g in (normalize_gender(v) for v in args.get('gender', '').split(',')) if g] or None,
+        'available_now': args.get('available_now', '').lower() in ('1', 'true', 'yes') or bool(at),
+        'minute': slots.parse_clock(at) if at else None,
+    }
+    if filters['available_now'] and filters['minute'] is None:
+        filters['minute'] = slots.minute_of_day()
+    return filters
+
+
+def has_filters(filters):
+    return any(filters[k] is not None for k in ('min_cost', 'max_cost', 'min_rating', 'min_experience')) or \
+        bool(filters['genders']) or filters['available_now']
+
+
+def filter_sql(filters):
+    # -> (' AND ...', params) over worker_search aliased as s
+    clauses, params = [], []
+    for name, sql in (('min_cost', 's.cost >= ?'), ('max_cost', 's.cost <= ?'),
+                      ('min_rating', 's.rating >= ?'), ('min_experience', 's.experience >= ?')):
+        if filters[name] is not None:
+            clauses.append(sql)
+            params.append(filters[name])
+    if filters['genders']:
+        clauses.append(f's.gender IN ({", ".join("?" * len(filters["genders"]))})')
+        params.extend(filters['genders'])
+    if filters['available_now']:
+        clauses.append(f's.worker_id IN ({slots.FREE_AT_QUERY})')
+        params.extend(slots.free_at_params(filters['minute']))
+    return ''.join(f' AND {c}' for c in clauses), params
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def build_fragment(w):
+    # Same fields and encoding as the per-row dicts /api/workers used to jsonify, without distance
+    slots = json.loads(w['slots'] or '{}')
+    doc = json.dumps({
+        'id': w['id'],
+        '_id': w['id'],
+        'userId': w['user_id'],
+        'service': w['service'],
+        'cost': w['cost'],
+        'lat': w['lat'],
+        'lng': w['lng'],
+        'bio': w['bio'],
+        'verified': bool(w['verified']),
+        'gender': w['gender'],
+        'experience': w['experience'],
+        'rating': w['rating'],
+        'totalReviews': w['total_reviews'],
+        'name': w['name'],
+        'phone': w['phone'],
+        'slots': slots,
+    }, sort_keys=True, separators=(',', ':'), default=_default)
+    return doc[:-1]
+
+
+def projection_row(w):
+    try:
+        fragment = build_fragment(w)
+    except Exception as e:
+        logging.warning(f'Worker {w["id"]} left out of search results: {e}')
+        fragment = None
+    available = 1 if w['available'] is None else w['available']
+    return (w['id'], w['user_id'], w['service_key'], w['verified'], available,
+            w['lat'], w['lng'], w['rating'], w['cost'], normalize_gender(w['gender']), w['experience'],
+            w['total_reviews'], fragment)
+
+
+class Changes:
+    # Snapshot patches made by one transaction; publish() once it has committed
+    def __init__(self, rows=(), removed=()):
+        self.rows = list(rows)
+        self.removed = list(removed)
+
+    def add(self, other):
+        self.rows.extend(other.rows)
+        self.removed.extend(other.removed)
+        return self
+
+    def publish(self):
+        if self.rows:
+            worker_snapshot.apply_projection_rows(self.rows)
+        if self.removed:
+            worker_snapshot.remove_workers(self.removed)
+
+
+def _upsert(conn, rows):
+    if not rows:
+        return
+    cols = ', '.join(COLUMNS)
+    updates = ', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:])
+    suffix = f'ON CONFLICT (worker_id) DO UPDATE SET {updates}'
+    cur = conn.cursor()
+    if IS_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cur, f'INSERT INTO worker_search ({cols}) VALUES %s {suffix}', rows, page_size=BATCH_SIZE)
+    else:
+        cur.executemany(f'INSERT INTO worker_search ({cols}) VALUES ({", ".join("?" * len(COLUMNS))}) {suffix}', rows)
+
+
+def remove_workers(conn, worker_ids):
+    worker_ids = list(worker_ids)
+    for i in range(0, len(worker_ids), 500):
+        part = worker_ids[i:i + 500]
+        db_execute(conn, f'DELETE FROM worker_search WHERE worker_id IN ({", ".join("?" * len(part))})', part)
+    return Changes(removed=worker_ids)
+
+
+def refresh_workers(conn, worker_ids):
+    # Re-project the given workers; ids that no longer exist are dropped from the projection
+    changes = Changes()
+    worker_ids = list(dict.fromkeys(worker_ids))
+    for i in range(0, len(worker_ids), 500):
+        part = worker_ids[i:i + 500]
+        rows = db_execute(conn, SOURCE_QUERY + f' WHERE w.id IN ({", ".join("?" * len(part))})', part).fetchall()
+        projected = [projection_row(w) for w in rows]
+        _upsert(conn, projected)
+        changes.rows.extend(dict(zip(COLUMNS, r)) for r in projected)
+        found = {w['id'] for w in rows}
+        changes.add(remove_workers(conn, [wid for wid in part if wid not in found]))
+    return changes
+
+
+def refresh_user(conn, user_id):
+    ids = [r['id'] for r in db_execute(conn, 'SELECT id FROM workers WHERE user_id = ?', (user_id,)).fetchall()]
+    return refresh_workers(conn, ids)
+
+
+def rebuild(conn):
+    # Full reprojection in the caller's transaction; returns the number of workers projected.
+    # Callers invalidate the worker snapshot once it has committed.
+    db_execute(conn, 'DELETE FROM worker_search')
+    cur = db_execute(conn, SOURCE_QUERY)
+    total = 0
+    while True:
+        rows = cur.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        _upsert(conn, [projection_row(w) for w in rows])
+        total += len(rows)
+    return total
+
+
+def render(rows, distances=None, order=None):
+    # rows from SEARCH_QUERY -> JSON array text; distance is the one per-request field
+    parts = []
+    for i in (range(len(rows)) if order is None else order):
+        if distances is None:
+            parts.append(rows[i]['fragment'] + ',"distance":0}')
+        else:
+            parts.append(f'{rows[i]["fragment"]},"distance":{round(float(distances[i]), 1)!r}}}')
+    return '[' + ','.join(parts) + ']'
+
+
+def render_faceted(body, total, facets):
+    # Wraps a rendered page with the match count and facet counts
+    by_service, by_price = facets
+    counts = json.dumps({'service': by_service, 'price': by_price}, sort_keys=True, separators=(',', ':'))
+    return f'{{"workers":{body},"total":{total},"facets":{counts}}}'
+
+
+if __name__ == '__main__':
+    # python search_projection.py rebuild
+    if sys.argv[1:] != ['rebuild']:
+        sys.exit('usage: python search_projection.py rebuild')
+    conn = get_db_connection()
+    try:
+        total = rebuild(conn)
+        conn.commit()
+        worker_snapshot.invalidate()
+        print(f'Search projection rebuilt for {total} workers')
+    finally:
+        conn.close()
@@ -0,0 +1,71 @@
+import os
+import re
+import time
+import threading
+
+from db import db_execute
+
+SERVICE_RESOLVER_TTL = float(os.environ.get('SERVICE_RESOLVER_TTL', 60))
+
+
+def normalize_service_key(value):
+    # "AC Service" / "ac-service" / " ac_service " -> "ac_service"
+    return re.sub(r'[^a-z0-9]+', '_', (value or '').strip().lower()).strip('_')
+
+
+def service_aliases(key, display_name=None):
+    aliases = {normalize_service_key(key), normalize_service_key(display_name)}
+    aliases.discard('')
+    return aliases
+
+
+def save_service_aliases(conn, key, display_name=None):
+    service_key = normalize_service_key(key)
+    for alias in service_aliases(key, display_name):
+        db_execute(conn, '''
+            INSERT INTO service_aliases (alias, service_key) VALUES (?, ?)
+            ON CONFLICT (alias) DO NOTHING
+        ''', (alias, service_key))
+
+
+class ServiceResolver:
+    # In-memory alias -> canonical key map used to turn free text into an indexed IN (...) filter
+    def __init__(self):
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self.loaded_at = 0
+
+    def load(self, conn):
+        rows = db_execute(conn, 'SELECT alias, service_key FROM service_aliases').fetchall()
+        aliases = {}
+        for r in rows:
+            aliases.setdefault(r['alias'], set()).add(r['service_key'])
+            aliases.setdefault(r['service_key'], set()).add(r['service_key'])
+        with self._lock:
+            self._aliases = aliases
+            self.loaded_at = time.time()
+
+    def ensure(self, connect):
+        # connect() -> a primary connection, opened only for a reload: the map serves every
+        # request of the process, so it is never loaded from a lagging replica
+        if not self.loaded_at or time.time() - self.loaded_at > SERVICE_RESOLVER_TTL:
+            conn = connect()
+            try:
+                self.load(conn)
+            finally:
+                conn.close()
+        return self
+
+    def add(self, key, display_name=None):
+        service_key = normalize_service_key(key)
+        with self._lock:
+            for alias in service_aliases(key, display_name) | {service_key}:
+                self._aliases.setdefault(alias, set()).add(service_key)
+
+    def resolve(self, text):
+        # Every canonical key with an alias containing the input ("plumb" -> plumber, "ac service" -> ac_service)
+        q = normalize_service_key(text)
+        if not q:
+            return set()
+        with self._lock:
+            return {k for alias, keys in self._aliases.items() if q in alias for k in keys}
@@ -0,0 +1,239 @@
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+import logging
+import secrets
+import threading
+
+from flask import g, request, jsonify
+
+from db import get_db_connection, db_execute
+
+# Signed session tokens: "v1.<payload>.<signature>", where the payload carries the user's
+# id, role, name and worker id and the signature is an HMAC-SHA256 over it. Verifying a
+# token is pure CPU; the before-request hook puts the session in g.user with no query.
+# Logged-out tokens go into an in-memory revocation set. Each revocation is also stored
+# in revoked_sessions, and a background thread in every process reloads new rows every
+# SESSION_REVOCATION_REFRESH_SECONDS, so no request waits on that query. Deleting an
+# account revokes every token issued to the user so far (a "user:<id>" row).
+#
+#   SESSION_REQUIRED=0   (default) requests without a valid token are still served as before
+#   SESSION_REQUIRED=1   /api/admin/* needs an admin session and user routes take the user
+#                        from the token only
+
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 7 * 24 * 3600))
+SESSION_REVOCATION_REFRESH_SECONDS = float(os.environ.get('SESSION_REVOCATION_REFRESH_SECONDS', 5))
+SESSION_REQUIRED = os.environ.get('SESSION_REQUIRED', '0') == '1'
+TOKEN_VERSION = 'v1'
+ADMIN_PREFIX = '/api/admin/'
+USER_PREFIX = 'user:'  # revoked_sessions rows that revoke all of a user's tokens
+QUERY_TOKEN_PATHS = ('/api/events',)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def load_secret():
+    # Every process and instance must sign with the same key, and it has to outlive
+    # restarts and redeploys, so it can only come from the environment
+    secret = os.environ.get('SESSION_SECRET')
+    if not secret:
+        raise RuntimeError('SESSION_SECRET is not set; set it to a long random string shared by every instance '
+                           f'(e.g. {secrets.token_hex(32)})')
+    return secret.encode()
+
+
+class SessionError(ValueError):
+    pass
+
+
+class Sessions:
+    def __init__(self, secret, ttl=SESSION_TTL_SECONDS, refresh_seconds=SESSION_REVOCATION_REFRESH_SECONDS):
+        self.secret = secret
+        self.ttl = ttl
+        self.refresh_seconds = refresh_seconds
+        self._revoked = {}  # token id -> expiry
+        self._revoked_users = {}  # user id -> (revoked at, expiry): tokens issued up to then are revoked
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+        self._seen_until = 0.0
+        self.stats = {'issued': 0, 'verified': 0, 'rejected': 0, 'revoked': 0}
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user_id, role, name=None, worker_id=None):
+        now = int(time.time())
+        claims = {'sub': user_id, 'role': role, 'name': name, 'iat': now, 'exp': now + self.ttl, 'jti': uuid.uuid4().hex}
+        if worker_id:
+            claims['wid'] = worker_id
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+        self.stats['issued'] += 1
+        return f'{TOKEN_VERSION}.{payload}.{self._sign(payload)}'
+
+    def verify(self, token):
+        # -> claims dict; raises SessionError for anything that is not a live token
+        try:
+            version, payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            raise SessionError('Malformed token')
+        if version != TOKEN_VERSION or not hmac.compare_digest(signature, self._sign(payload)):
+            raise SessionError('Invalid token signature')
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise SessionError('Malformed token')
+        if claims.get('exp', 0) < time.time():
+            raise SessionError('Token expired')
+        if claims.get('jti') in self._revoked:
+            raise SessionError('Token revoked')
+        revoked_user = self._revoked_users.get(claims.get('sub'))
+        if revoked_user and claims.get('iat', 0) <= revoked_user[0]:
+            raise SessionError('Token revoked')
+        return claims
+
+    def revoke(self, conn, claims):
+        # Caller commits; the token is rejected by this process immediately
+        with self._lock:
+            self._revoked[claims['jti']] = claims['exp']
+        db_execute(conn, '''
+            INSERT INTO revoked_sessions (jti, expires_at, revoked_at) VALUES (?, ?, ?)
+            ON CONFLICT (jti) DO NOTHING
+        ''', (claims['jti'], claims['exp'], time.time()))
+        self.stats['revoked'] += 1
+
+    def revoke_users(self, user_ids, revoked_at):
+        with self._lock:
+            for user_id in user_ids:
+                self._revoked_users[user_id] = (revoked_at, revoked_at + self.ttl)
+
+    def refresh(self, conn=None):
+        # Pull revocations made by other processes
+        now = time.time()
+        own = conn is None
+        conn = conn or get_db_connection()
+        try:
+            rows = db_execute(conn, 'SELECT jti, expires_at, revoked_at FROM revoked_sessions WHERE revoked_at >= ? AND expires_at > ?',
+                              (self._seen_until, now)).fetchall()
+        finally:
+            if own:
+                conn.close()
+        with self._lock:
+            for r in rows:
+                if r['jti'].startswith(USER_PREFIX):
+                    self._revoked_users[r['jti'][len(USER_PREFIX):]] = (r['revoked_at'], r['expires_at'])
+                else:
+                    self._revoked[r['jti']] = r['expires_at']
+                self._seen_until = max(self._seen_until, r['revoked_at'])
+            for jti in [j for j, exp in self._revoked.items() if exp < now]:
+                del self._revoked[jti]
+            for user_id in [u for u, (_, exp) in self._revoked_users.items() if exp < now]:
+                del self._revoked_users[user_id]
+
+    def ensure_refresher(self):
+        # One refresh thread per process; threads do not survive a fork
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+        threading.Thread(target=self._refresh_forever, name='session-revocations', daemon=True).start()
+
+    def _refresh_forever(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logging.exception('Could not refresh revoked sessions')
+            time.sleep(self.refresh_seconds)
+
+    def info(self):
+        return dict(self.stats, revoked_cached=len(self._revoked), revoked_users_cached=len(self._revoked_users))
+
+
+sessions = None
+
+
+def bearer_token():
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        return header[7:].strip()
+    # EventSource cannot set headers, so the live updates stream takes ?token= instead
+    if request.path in QUERY_TOKEN_PATHS:
+        return request.args.get('token') or None
+    return None
+
+
+def request_user_id(claimed=None):
+    # The session's user when the request has one; the client-supplied id only while
+    # SESSION_REQUIRED is off (clients that still hold the old unsigned tokens)
+    if g.get('user'):
+        return g.user['id']
+    return None if SESSION_REQUIRED else claimed
+
+
+def revoke_users(conn, user_ids):
+    # Every token issued so far to these users, for deleted accounts; the caller commits
+    now = time.time()
+    for user_id in user_ids:
+        db_execute(conn, '''
+            INSERT INTO revoked_sessions (jti, expires_at, revoked_at) VALUES (?, ?, ?)
+            ON CONFLICT (jti) DO UPDATE SET expires_at = excluded.expires_at, revoked_at = excluded.revoked_at
+        ''', (USER_PREFIX + user_id, now + SESSION_TTL_SECONDS, now))
+    if sessions is not None:
+        sessions.revoke_users(user_ids, now)
+
+
+def prune(conn):
+    # Revocations of tokens that have expired anyway
+    return db_execute(conn, 'DELETE FROM revoked_sessions WHERE expires_at < ?', (time.time(),)).rowcount
+
+
+def init_app(app):
+    global sessions
+    sessions = Sessions(load_secret())
+
+    @app.before_request
+    def load_session():
+        g.user = None
+        g.session = None
+        sessions.ensure_refresher()
+        token = bearer_token()
+        if token:
+            try:
+                claims = sessions.verify(token)
+                sessions.stats['verified'] += 1
+                g.session = claims
+                g.user = {'id': claims['sub'], 'role': claims['role'], 'name': claims.get('name'), 'workerId': claims.get('wid')}
+            except SessionError:
+                # Unsigned, expired and revoked tokens: the request continues without a session
+                sessions.stats['rejected'] += 1
+        if SESSION_REQUIRED and request.path.startswith(ADMIN_PREFIX):
+            if g.user is None:
+                return jsonify({'error': 'Please log in again.'}), 401
+            if g.user['role'] != 'admin':
+                return jsonify({'error': 'Admin access only.'}), 403
+
+
+if __name__ == '__main__':
+    # python sessions.py prune    -> drop revocations of tokens that have expired
+    if sys.argv[1:] != ['prune']:
+        sys.exit('usage: python sessions.py prune')
+    conn = get_db_connection()
+    try:
+        removed = prune(conn)
+        conn.commit()
+        print(f'Pruned {removed} expired revocations')
+    finally:
+        conn.close()
@@ -0,0 +1,133 @@
+import re
+import json
+from datetime import datetime
+
+from db import db_execute
+
+# Workers publish daily slots as {"9:00 AM - 10:00 AM": {"available": true, "price": 300}}.
+# They are mirrored into worker_slots (one row per worker and slot, with the window in
+# minutes after midnight) and booked through slot_reservations, whose primary key on
+# (worker_id, slot) makes double booking impossible.
+#
+# Limitation: bookings carry no date (the API and the UI book a slot label such as
+# "9:00 AM - 10:00 AM"), so the reservation key has none either. Each of a worker's slots
+# is held by at most one active booking until that booking is completed, cancelled or
+# rejected. Day-by-day booking needs a booking date in the API and a
+# (worker_id, slot_date, slot) key.
+
+# Booking statuses that give the slot back
+RELEASED_STATUSES = ('completed', 'cancelled', 'rejected')
+
+_CLOCK = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?\s*$', re.IGNORECASE)
+
+
+def parse_clock(text):
+    # "17:00", "5:00 PM", "5pm" -> minutes after midnight
+    m = _CLOCK.match(str(text or ''))
+    if not m:
+        raise ValueError(f'Invalid time: {text}')
+    hour, minute, ampm = int(m.group(1)), int(m.group(2) or 0), (m.group(3) or '').lower()
+    if ampm:
+        if not 1 <= hour <= 12:
+            raise ValueError(f'Invalid time: {text}')
+        hour = hour % 12 + (12 if ampm.startswith('p') else 0)
+    if hour > 24 or minute > 59 or (hour == 24 and minute):
+        raise ValueError(f'Invalid time: {text}')
+    return hour * 60 + minute
+
+
+def parse_slot_label(label):
+    # "11:00 PM - 12:00 AM" -> (1380, 1440); (None, None) if the label is free text
+    try:
+        start, end = (parse_clock(part) for part in str(label).split('-', 1))
+    except ValueError:
+        return None, None
+    if end <= start:
+        end += 24 * 60
+    return start, end
+
+
+def save_worker_slots(conn, worker_id, slots):
+    if isinstance(slots, str):
+        slots = json.loads(slots or '{}')
+    db_execute(conn, 'DELETE FROM worker_slots WHERE worker_id = ?', (worker_id,))
+    for label, info in (slots or {}).items():
+        info = info if isinstance(info, dict) else {}
+        start, end = parse_slot_label(label)
+        db_execute(conn, '''
+            INSERT INTO worker_slots (worker_id, slot, start_minute, end_minute, price, available)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (worker_id, label, start, end, info.get('price'), 1 if info.get('available', True) else 0))
+
+
+def reserve_slot(conn, worker_id, slot, booking_id):
+    # Raises the driver's IntegrityError if the slot is already reserved
+    db_execute(conn, 'INSERT INTO slot_reservations (worker_id, slot, booking_id) VALUES (?, ?, ?)',
+               (worker_id, slot, booking_id))
+
+
+def release_slot(conn, booking_id):
+    db_execute(conn, 'DELETE FROM slot_reservations WHERE booking_id = ?', (booking_id,))
+
+
+# Workers with an open, unreserved slot running at a given minute of the day; slots that
+# cross midnight are stored with end_minute past 1440 and match the next morning too
+FREE_AT_QUERY = '''
+    SELECT fs.worker_id FROM worker_slots fs
+    LEFT JOIN slot_reservations fr ON fr.worker_id = fs.worker_id AND fr.slot = fs.slot
+    WHERE fs.start_minute <= ? AND fs.end_minute > ? AND fs.available = 1 AND fr.worker_id IS NULL
+    UNION
+    SELECT fs.worker_id FROM worker_slots fs
+    LEFT JOIN slot_reservations fr ON fr.worker_id = fs.worker_id AND fr.slot = fs.slot
+    WHERE fs.end_minute > ? AND fs.start_minute <= ? AND fs.available = 1 AND fr.worker_id IS NULL
+'''
+
+
+def minute_of_day(now=None):
+    now = now or datetime.now()
+    return now.hour * 60 + now.minute
+
+
+def free_at_params(minute):
+    return [minute, minute, minute + 24 * 60, minute + 24 * 60]
+
+
+def free_worker_ids_at(conn, minute):
+    return {r['worker_id'] for r in db_execute(conn, FREE_AT_QUERY, free_at_params(minute)).fetchall()}
+
+
+def free_workers(conn, start, end, service_keys=None, limit=None):
+    # Workers with an open, unreserved slot inside [start, end)
+    query = '''
+        SELECT s.worker_id, s.slot, s.price, s.start_minute, s.end_minute,
+               w.service, w.cost, w.rating, u.name
+        FROM worker_slots s
+        JOIN workers w ON w.id = s.worker_id
+        JOIN users u ON u.id = w.user_id
+        LEFT JOIN slot_reservations r ON r.worker_id = s.worker_id AND r.slot = s.slot
+        WHERE s.start_minute >= ? AND s.end_minute <= ? AND s.available = 1 AND r.worker_id IS NULL
+          AND w.verified = 1 AND (w.available IS NULL OR w.available = 1)
+    '''
+    params = [start, end]
+    if service_keys is not None:
+        if not service_keys:
+            return []
+        query += f' AND w.service_key IN ({", ".join("?" * len(service_keys))})'
+        params.extend(service_keys)
+    query += ' ORDER BY s.start_minute, s.worker_id'
+
+    result = {}
+    for r in db_execute(conn, query, params).fetchall():
+        if r['worker_id'] not in result:
+            if limit and len(result) >= limit:
+                continue
+            result[r['worker_id']] = {
+                'workerId': r['worker_id'],
+                'name': r['name'],
+                'service': r['service'],
+                'cost': r['cost'],
+                'rating': r['rating'],
+                'slots': []
+            }
+        result[r['worker_id']]['slots'].append({'slot': r['slot'], 'price': r['price']})
+    return list(result.values())
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# db.py and jobs.py read their settings at import: point them at a throwaway SQLite
+# file and leave the job queue to the tests, which drain it explicitly
+os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['JOBS_WORKER'] = 'off'
+os.environ['SESSION_SECRET'] = 'test'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def conn(app):
+    from db import get_db_connection
+    conn = get_db_connection()
+    yield conn
+    conn.close()
@@ -0,0 +1,37 @@
+import jobs
+from db import db_execute
+
+
+def ok(response, code=200):
+    assert response.status_code == code, (response.status_code, response.data[:500])
+    return response.get_json()
+
+
+def lowest_rollup(conn):
+    conn.rollback()
+    return db_execute(conn, 'SELECT MIN(bookings) as low, MIN(revenue) as revenue FROM booking_rollups').fetchone()
+
+
+def test_delete_with_queued_jobs_keeps_rollups_non_negative(client, conn):
+    worker = ok(client.post('/api/workers/register', json={
+        'user': {'name': 'Meena', 'phone': '7100000001', 'password': 'p'},
+        'worker': {'service': 'electrician', 'cost': 400, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }))['user']
+    customer = ok(client.post('/api/auth/login', json={'role': 'user', 'phone': '7100000002', 'name': 'Ravi'}))['user']
+    for status in ('completed', 'cancelled'):
+        booking = ok(client.post('/api/bookings', json={
+            'userId': customer['id'], 'workerId': worker['workerId'], 'service': 'electrician',
+            'price': 400, 'location': {'lat': 12.97, 'lng': 77.59},
+        }))
+        ok(client.patch(f"/api/bookings/{booking['bookingId']}/status", json={'status': status}))
+    ok(client.delete(f"/api/admin/users/{customer['id']}"))
+
+    one_at_a_time = jobs.Worker(batch_size=1)
+    while True:
+        low = lowest_rollup(conn)
+        assert (low['low'] or 0) >= 0 and (low['revenue'] or 0) >= 0
+        if not one_at_a_time.run_once():
+            break
+    rows = db_execute(conn, 'SELECT COUNT(*) as cnt FROM booking_rollups WHERE key = ? AND bookings != 0',
+                      (worker['workerId'],)).fetchone()
+    assert rows['cnt'] == 0
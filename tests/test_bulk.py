@@ -0,0 +1,24 @@
+import io
+
+import bulk
+from db import db_execute
+
+
+def test_worker_export_round_trips_rating_and_availability(conn):
+    rows = [{'id': 'worker_bulk_1', 'name': 'Ravi', 'phone': '7500000001', 'service': 'painter', 'cost': 700,
+             'lat': 12.9, 'lng': 77.6, 'rating': 4.5, 'total_reviews': 12, 'available': 0}]
+    assert bulk.import_rows(conn, 'workers', enumerate(rows, 1))['inserted'] == 1
+
+    exported = ''.join(bulk.export_lines(conn, 'workers', 'csv'))
+    row = next(r for _, r in bulk.read_rows(io.StringIO(exported), 'csv') if r['id'] == 'worker_bulk_1')
+    # Imported again as a new worker, it keeps what the export carried
+    row.update(id='worker_bulk_2', phone='7500000002')
+    assert bulk.import_rows(conn, 'workers', [(2, row)])['inserted'] == 1
+    copy = db_execute(conn, 'SELECT rating, total_reviews, available FROM workers WHERE id = ?', ('worker_bulk_2',)).fetchone()
+    assert (copy['rating'], copy['total_reviews'], copy['available']) == (4.5, 12, 0)
+
+
+def test_worker_import_rejects_bad_availability(conn):
+    report = bulk.import_rows(conn, 'workers', [(1, {'name': 'Ravi', 'phone': '7500000003', 'service': 'painter',
+                                                     'available': 'maybe'})])
+    assert report['inserted'] == 0 and report['errors'] == [{'line': 1, 'error': 'available must be 1 or 0'}]
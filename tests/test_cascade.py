@@ -0,0 +1,35 @@
+import jobs
+from db import db_execute
+
+
+def ok(response, code=200):
+    assert response.status_code == code, (response.status_code, response.data[:500])
+    return response.get_json()
+
+
+def register_worker(client, name, phone):
+    return ok(client.post('/api/workers/register', json={
+        'user': {'name': name, 'phone': phone, 'password': 'p'},
+        'worker': {'service': 'carpenter', 'cost': 400, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }))['user']
+
+
+def test_soft_deleted_account_can_register_again(client, conn):
+    old = register_worker(client, 'Farhan', '7400000001')
+    ok(client.delete(f"/api/admin/users/{old['id']}?mode=soft"))
+
+    # The hidden account neither blocks nor matches the phone any more
+    assert ok(client.get('/api/check-duplicate?phone=7400000001&name=Farhan'))['exists'] is False
+    assert ok(client.get('/api/check-duplicate?phone=7400000001&name=Farhan&service=carpenter'))['exists'] is False
+    ok(client.post('/api/auth/register', json={'name': 'Farhan', 'phone': '7400000001', 'password': 'p', 'role': 'user'}))
+
+    new = register_worker(client, 'Farhan', '7400000001')
+    assert new['id'] != old['id']
+
+    # The queued purge removes the old account only
+    jobs.Worker().drain()
+    conn.rollback()
+    workers = {r['id']: r['user_id'] for r in db_execute(conn, 'SELECT id, user_id FROM workers WHERE id IN (?, ?)',
+                                                             (old['workerId'], new['workerId'])).fetchall()}
+    assert workers == {new['workerId']: new['id']}
+    assert db_execute(conn, 'SELECT id FROM users WHERE id = ?', (old['id'],)).fetchone() is None
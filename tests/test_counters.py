@@ -0,0 +1,85 @@
+import jobs
+import counters
+from db import db_execute
+
+
+def ok(response, code=200):
+    assert response.status_code == code, (response.status_code, response.data[:500])
+    return response.get_json()
+
+
+def snapshot(conn, worker_id):
+    conn.rollback()
+    stats = counters.get_counters(conn)
+    stats['worker'] = counters.get_worker_stats(conn, worker_id)
+    return stats
+
+
+def test_delete_with_queued_jobs_never_goes_negative(client, conn):
+    jobs.Worker().drain()
+    before = counters.get_counters(conn)
+
+    worker = ok(client.post('/api/workers/register', json={
+        'user': {'name': 'Asha', 'phone': '7000000001', 'password': 'p'},
+        'worker': {'service': 'plumber', 'cost': 300, 'latitude': 12.97, 'longitude': 77.59,
+                   'slots': {'9:00 AM - 10:00 AM': {'available': True, 'price': 300}}},
+    }))['user']
+    customer = ok(client.post('/api/auth/login', json={'role': 'user', 'phone': '7000000002', 'name': 'Kiran'}))['user']
+    booking = ok(client.post('/api/bookings', json={
+        'userId': customer['id'], 'workerId': worker['workerId'], 'service': 'plumber',
+        'slot': '9:00 AM - 10:00 AM', 'price': 300, 'location': {'lat': 12.97, 'lng': 77.59},
+    }))
+    ok(client.patch(f"/api/bookings/{booking['bookingId']}/status", json={'status': 'completed'}))
+    # The customer goes while the booking's counter jobs are still queued
+    ok(client.delete(f"/api/admin/users/{customer['id']}"))
+    assert db_execute(conn, "SELECT COUNT(*) as cnt FROM jobs WHERE kind = 'counters'").fetchone()['cnt'] > 0
+
+    seen = [snapshot(conn, worker['workerId'])]
+    one_at_a_time = jobs.Worker(batch_size=1)
+    while one_at_a_time.run_once():
+        seen.append(snapshot(conn, worker['workerId']))
+
+    for stats in seen:
+        for name in (counters.BOOKINGS, counters.REVENUE):
+            assert stats.get(name, 0) >= before.get(name, 0), (name, seen)
+        assert stats['worker']['bookings'] >= 0 and stats['worker']['earnings'] >= 0, seen
+
+    final = seen[-1]
+    assert final[counters.BOOKINGS] == before.get(counters.BOOKINGS, 0)
+    assert final[counters.REVENUE] == before.get(counters.REVENUE, 0)
+    assert final[counters.USERS] == before.get(counters.USERS, 0) + 1
+    assert final['worker'] == {'bookings': 0, 'earnings': 0}
+
+
+def test_rebuild_fences_jobs_claimed_before_it(client, conn):
+    jobs.Worker().drain()
+    ok(client.post('/api/workers/register', json={
+        'user': {'name': 'Meera', 'phone': '7000000003', 'password': 'p'},
+        'worker': {'service': 'plumber', 'cost': 300, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }))
+    # A worker claims the registration's counter jobs, then a rebuild runs before its batch
+    claimed = jobs.claim(conn, jobs.Worker().id)
+    assert claimed and {job['kind'] for job in claimed} == {'counters'}
+    counters.rebuild_counters(conn)
+    conn.commit()
+    rebuilt = counters.get_counters(conn)
+
+    assert jobs.run_batch(conn, claimed) == (0, 0)
+    assert counters.get_counters(conn) == rebuilt
+
+
+def test_applied_counters_refresh_the_cached_worker_profile(client):
+    jobs.Worker().drain()
+    worker = ok(client.post('/api/workers/register', json={
+        'user': {'name': 'Devi', 'phone': '7000000031', 'password': 'p'},
+        'worker': {'service': 'plumber', 'cost': 300, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }))['user']['workerId']
+    customer = ok(client.post('/api/auth/login', json={'role': 'user', 'phone': '7000000032', 'name': 'Gopal'}))['user']
+    booking = ok(client.post('/api/bookings', json={'userId': customer['id'], 'workerId': worker, 'service': 'plumber', 'price': 450}))
+    ok(client.patch(f"/api/bookings/{booking['bookingId']}/status", json={'status': 'completed'}))
+
+    # Read (and cached) before the counters job has applied the completed booking
+    assert ok(client.get(f'/api/workers/{worker}'))['earnings'] == 0
+    jobs.Worker().drain()
+    profile = ok(client.get(f'/api/workers/{worker}'))
+    assert (profile['earnings'], profile['totalBookings']) == (450, 1)
@@ -0,0 +1,28 @@
+import events
+
+
+def test_events_stream_needs_a_session(client):
+    assert client.get('/api/events').status_code == 401
+    assert client.get('/api/events?userId=user_someone_else').status_code == 401
+    assert client.get('/api/events?token=v1.forged.token').status_code == 401
+
+
+def test_events_stream_follows_the_session_not_the_query(client, monkeypatch):
+    worker = client.post('/api/workers/register', json={
+        'user': {'name': 'Lakshmi', 'phone': '7300000001', 'password': 'p'},
+        'worker': {'service': 'painter', 'cost': 500, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }).get_json()
+    subscribed = []
+
+    def subscribe_limited(channels):
+        # Stop before the stream starts: the route answers 503
+        subscribed.append(sorted(channels))
+        return None
+
+    monkeypatch.setattr(events.get_broker(), 'subscribe_limited', subscribe_limited)
+    response = client.get(f"/api/events?token={worker['token']}&userId=user_someone_else&workerId=worker_someone_else")
+    assert response.status_code == 503
+    response = client.get('/api/events', headers={'Authorization': f"Bearer {worker['token']}"})
+    assert response.status_code == 503
+    expected = sorted([events.user_channel(worker['user']['id']), events.worker_channel(worker['user']['workerId'])])
+    assert subscribed == [expected, expected]
@@ -0,0 +1,31 @@
+import random
+
+from geo_index import GeoIndex, distance_km
+
+
+def test_nearest_matches_a_full_scan_as_workers_move():
+    rnd = random.Random(7)
+    index, points = GeoIndex(), {}
+    for step in range(2000):
+        wid = f'w{rnd.randrange(300)}'
+        if rnd.random() < 0.3:
+            index.remove(wid)
+            points.pop(wid, None)
+        else:
+            points[wid] = (12.5 + rnd.random(), 77 + rnd.random())
+            index.upsert(wid, *points[wid])
+        if step % 40 == 0:
+            # Queries inside and outside the occupied area
+            lat, lng = 12 + rnd.random() * 2, 76.5 + rnd.random() * 2
+            everything = sorted((distance_km(lat, lng, *p), wid) for wid, p in points.items())
+            assert index.nearest(lat, lng, limit=10) == everything[:10]
+            assert index.nearest(lat, lng, radius_km=15) == [(d, w) for d, w in everything if d <= 15]
+
+
+def test_rebuild_resets_the_searched_area():
+    index = GeoIndex()
+    index.upsert('far', 40.0, -3.0)
+    index.rebuild([{'id': 'near', 'lat': 12.97, 'lng': 77.59, 'service_key': 'plumber'}])
+    assert [wid for _, wid in index.nearest(12.97, 77.59)] == ['near']
+    i, j = index._cell(12.97, 77.59)
+    assert index._bounds == (i, i, j, j)
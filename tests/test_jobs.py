@@ -0,0 +1,16 @@
+import jobs
+
+
+def test_jobs_due_together_run_in_enqueue_order(conn, monkeypatch):
+    jobs.Worker().drain()
+    ran = []
+    jobs.register('test.order', lambda conn, payloads: ran.extend(payloads), batch=True)
+    # Same run_at for all of them: only the enqueue sequence can order them
+    monkeypatch.setattr(jobs.time, 'time', lambda: 1000.0)
+    for i in range(50):
+        jobs.enqueue(conn, 'test.order', i)
+    conn.commit()
+    monkeypatch.undo()
+
+    jobs.Worker(batch_size=7).drain()
+    assert ran == list(range(50))
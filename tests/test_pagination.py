@@ -0,0 +1,37 @@
+from db import db_execute
+
+
+def ok(response, code=200):
+    assert response.status_code == code, (response.status_code, response.data[:500])
+    return response.get_json()
+
+
+def add_users(conn, prefix, n, created_at):
+    for i in range(n):
+        db_execute(conn, 'INSERT INTO users (id, name, phone, password, role, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                   (f'{prefix}_{i:02d}', f'Keyset {i}', f'75{i:08d}', 'p', 'user', created_at))
+    conn.commit()
+
+
+def test_cursor_pages_stay_stable_across_inserts(client, conn):
+    # Ties on created_at are ordered by id
+    add_users(conn, 'keyset_old', 12, '2001-01-01 00:00:00')
+    before = [u['_id'] for u in ok(client.get('/api/admin/users'))]
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/admin/users?limit=5' + (f'&cursor={cursor}' if cursor else ''))
+        seen += [u['_id'] for u in ok(response)]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        if len(seen) == 5:
+            # Newer rows land ahead of the cursor and do not shift the pages still to come
+            add_users(conn, 'keyset_new', 4, '2099-01-01 00:00:00')
+
+    assert seen == before
+    assert seen[-12:] == [f'keyset_old_{i:02d}' for i in reversed(range(12))]
+
+
+def test_bad_cursor_is_a_400(client):
+    assert 'error' in ok(client.get('/api/admin/users?cursor=not-a-cursor'), 400)
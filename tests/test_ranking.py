@@ -0,0 +1,16 @@
+import pytest
+
+import ranking
+from ranking import NO_SERVICE, facet_counts
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_facets_count_workers_without_a_service_key(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(ranking, 'numpy_module', lambda: None)
+    elif ranking.numpy_module() is None:
+        pytest.skip('numpy is not installed')
+    by_service, by_price = facet_counts(['plumber', None, 'tiler', 'plumber', None],
+                                        [100, float('nan'), 600, 1200, 300], edges=[250, 500, 1000])
+    assert by_service == {'plumber': 2, 'tiler': 1, NO_SERVICE: 2}
+    assert by_price == {'0-250': 1, '250-500': 1, '500-1000': 1, '1000+': 1}
@@ -0,0 +1,153 @@
+import os
+import time
+import sqlite3
+
+import pytest
+from flask import Flask, jsonify
+
+import replicas
+from db import SQLITE_PATH, db_execute
+
+PRIMARY = os.path.basename(SQLITE_PATH)
+
+
+def make_replica(path):
+    # The health check only needs the migrated schema to be there
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)')
+    conn.execute('INSERT OR IGNORE INTO schema_migrations (version) VALUES (1)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def break_replica(path):
+    conn = sqlite3.connect(path)
+    conn.execute('DROP TABLE schema_migrations')
+    conn.commit()
+    conn.close()
+
+
+def database_file(conn):
+    return os.path.basename(db_execute(conn, 'PRAGMA database_list').fetchone()['file'])
+
+
+def read_target():
+    conn = replicas.get_read_connection()
+    try:
+        return database_file(conn)
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def replica_paths(tmp_path, monkeypatch):
+    paths = [make_replica(str(tmp_path / f'replica{i}.db')) for i in range(2)]
+    monkeypatch.setattr(replicas, 'SQLITE_REPLICA_PATHS', paths)
+    monkeypatch.setattr(replicas, '_router', None)
+    monkeypatch.setattr(replicas, '_router_pid', None)
+    replicas._local.primary = False
+    yield paths
+    for replica in replicas._router.replicas:
+        replica.pool.closeall()
+
+
+@pytest.fixture
+def replica_client(replica_paths):
+    app = Flask(__name__)
+    replicas.init_app(app)
+
+    @app.route('/read')
+    def read():
+        return jsonify({'database': read_target()})
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        return jsonify({'success': True})
+
+    @app.route('/fail', methods=['POST'])
+    def fail():
+        raise RuntimeError('write failed')
+
+    return app.test_client()
+
+
+def test_reads_rotate_across_replicas(replica_paths):
+    assert [read_target() for _ in range(4)] == ['replica0.db', 'replica1.db', 'replica0.db', 'replica1.db']
+    assert replicas.replica_info()['replica0_reads'] == 2
+    assert replicas.replica_info()['replica1_reads'] == 2
+
+
+def test_unhealthy_replicas_fall_back_to_the_primary(replica_paths):
+    router = replicas.get_router()
+    router.healthcheck_seconds = 0
+    break_replica(replica_paths[0])
+    assert [read_target() for _ in range(3)] == ['replica1.db'] * 3
+
+    break_replica(replica_paths[1])
+    assert read_target() == PRIMARY
+    assert router.stats['primary_fallbacks'] == 1
+    assert replicas.replica_info()['healthy'] == 0
+
+    make_replica(replica_paths[0])
+    assert read_target() == 'replica0.db'
+
+
+def test_write_sends_the_next_reads_to_the_primary(replica_client):
+    assert replica_client.get('/read').get_json()['database'].startswith('replica')
+
+    response = replica_client.post('/write')
+    assert replicas.STICKY_COOKIE in response.headers['Set-Cookie']
+    assert replica_client.get('/read').get_json()['database'] == PRIMARY
+    assert replicas.get_router().stats['sticky_reads'] == 1
+
+    # Once the cookie's time has passed, reads go back to the replicas
+    replica_client.set_cookie(replicas.STICKY_COOKIE, f'{time.time() - 1:.3f}')
+    assert replica_client.get('/read').get_json()['database'].startswith('replica')
+
+
+def test_failed_write_does_not_stick_to_the_primary(replica_client):
+    response = replica_client.post('/fail')
+    assert response.status_code == 500
+    assert 'Set-Cookie' not in response.headers
+    assert replica_client.get('/read').get_json()['database'].startswith('replica')
+
+
+def test_primary_flag_is_reset_after_each_request(replica_client):
+    for path in ('/write', '/fail'):
+        replica_client.post(path)
+        # Same thread, outside any request: reads must not inherit the write's primary flag
+        assert replicas._local.primary is False
+        assert read_target().startswith('replica')
+
+
+def copy_primary(path):
+    source, target = sqlite3.connect(SQLITE_PATH), sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+def test_shared_search_state_is_built_from_the_primary(app, client, replica_paths, monkeypatch):
+    from app import service_resolver, worker_geo_index
+    import worker_snapshot
+
+    # The replicas lag behind a registration that added a new service
+    for path in replica_paths:
+        copy_primary(path)
+    worker = client.post('/api/workers/register', json={
+        'user': {'name': 'Imran', 'phone': '7600000001', 'password': 'p'},
+        'worker': {'service': 'Tiler', 'cost': 650, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }).get_json()['user']
+    service_resolver.loaded_at = 0
+    worker_geo_index.built_at = 0
+    worker_snapshot.invalidate()
+
+    # A reader with no sticky cookie: its page comes from a replica, the shared state must not
+    assert app.test_client().get('/api/workers?service=tiler&lat=12.97&lng=77.59&radius_km=5').status_code == 200
+    assert service_resolver.resolve('tiler') == {'tiler'}
+    assert worker_snapshot.snapshot.search(['tiler'])[0] == [worker['workerId']]
+    # Without the snapshot, nearest-first search runs on the grid index
+    monkeypatch.setattr(worker_snapshot, 'WORKER_SNAPSHOT', 'off')
+    assert app.test_client().get('/api/workers?service=tiler&lat=12.97&lng=77.59&radius_km=5').status_code == 200
+    assert [wid for _, wid in worker_geo_index.nearest(12.97, 77.59, 5, match={'tiler'}.__contains__)] == [worker['workerId']]
@@ -0,0 +1,33 @@
+import gzip
+import json
+
+import responses
+
+
+def test_unchanged_json_revalidates_with_304(client):
+    first = client.get('/api/services')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/services', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert client.get('/api/services', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_json_is_gzipped_only_when_the_client_accepts_it(client, monkeypatch):
+    monkeypatch.setattr(responses, 'COMPRESS_MIN_BYTES', 0)
+    plain = client.get('/api/services')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    packed = client.get('/api/services', headers={'Accept-Encoding': 'gzip;q=1.0, identity'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(packed.data)) == plain.get_json()
+    # The validator is the same whichever encoding went out
+    assert packed.headers['ETag'] == plain.headers['ETag']
+
+
+def test_small_bodies_go_out_uncompressed(client, monkeypatch):
+    monkeypatch.setattr(responses, 'COMPRESS_MIN_BYTES', 1 << 20)
+    assert 'Content-Encoding' not in client.get('/api/services', headers={'Accept-Encoding': 'gzip'}).headers
@@ -0,0 +1,57 @@
+import pytest
+
+import reviews
+from db import db_execute
+
+
+def ok(response, code=200):
+    assert response.status_code == code, (response.status_code, response.data[:500])
+    return response.get_json()
+
+
+def completed_booking(client, user_id, worker_id):
+    booking = ok(client.post('/api/bookings', json={'userId': user_id, 'workerId': worker_id, 'service': 'carpenter', 'price': 300}))['bookingId']
+    ok(client.patch(f'/api/bookings/{booking}/status', json={'status': 'completed'}))
+    return booking
+
+
+def test_reviews_keep_a_running_mean(client, conn):
+    worker = ok(client.post('/api/workers/register', json={
+        'user': {'name': 'Joseph', 'phone': '7400000301', 'password': 'p'},
+        'worker': {'service': 'carpenter', 'cost': 300, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }))['user']['workerId']
+    bookings = []
+    for i, rating in enumerate([5, 4, 2]):
+        user = ok(client.post('/api/auth/register', json={'name': f'Reviewer {i}', 'phone': f'740000031{i}', 'password': 'p', 'role': 'user'}))['user']['id']
+        bookings.append((user, completed_booking(client, user, worker)))
+        ok(client.post('/api/reviews', json={'userId': user, 'bookingId': bookings[-1][1], 'rating': rating}))
+
+    profile = ok(client.get(f'/api/workers/{worker}'))
+    assert profile['totalReviews'] == 3
+    assert profile['rating'] == pytest.approx(11 / 3)
+
+    # Rejected reviews leave the mean alone
+    user, booking = bookings[0]
+    assert 'already been reviewed' in ok(client.post('/api/reviews', json={'userId': user, 'bookingId': booking, 'rating': 1}), 409)['error']
+    ok(client.post('/api/reviews', json={'userId': user, 'bookingId': booking, 'rating': 9}), 400)
+    ok(client.post('/api/reviews', json={'userId': bookings[1][0], 'bookingId': booking, 'rating': 1}), 403)
+
+    # The batch recompute agrees with the running mean
+    conn.rollback()
+    running = db_execute(conn, 'SELECT rating, total_reviews FROM workers WHERE id = ?', (worker,)).fetchone()
+    assert (running['rating'], running['total_reviews']) == (pytest.approx(11 / 3), 3)
+    assert reviews.recompute_ratings(conn, [worker]) == 1
+    recomputed = db_execute(conn, 'SELECT rating, total_reviews FROM workers WHERE id = ?', (worker,)).fetchone()
+    conn.rollback()
+    assert (recomputed['rating'], recomputed['total_reviews']) == (pytest.approx(11 / 3), 3)
+
+
+def test_reviews_need_a_completed_booking(client):
+    worker = ok(client.post('/api/workers/register', json={
+        'user': {'name': 'Kiran', 'phone': '7400000321', 'password': 'p'},
+        'worker': {'service': 'carpenter', 'cost': 300, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    }))['user']['workerId']
+    user = ok(client.post('/api/auth/register', json={'name': 'Lata', 'phone': '7400000322', 'password': 'p', 'role': 'user'}))['user']['id']
+    booking = ok(client.post('/api/bookings', json={'userId': user, 'workerId': worker, 'service': 'carpenter', 'price': 300}))['bookingId']
+    assert 'completed' in ok(client.post('/api/reviews', json={'userId': user, 'bookingId': booking, 'rating': 4}), 400)['error']
+    ok(client.post('/api/reviews', json={'userId': user, 'bookingId': 'book_missing', 'rating': 4}), 404)
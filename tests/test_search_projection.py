@@ -0,0 +1,39 @@
+import search_projection
+import worker_snapshot
+from db import get_db_connection, db_execute
+
+
+def expensive_carpenters(conn):
+    assert worker_snapshot.snapshot.ensure(get_db_connection)
+    ids, _, _, _ = worker_snapshot.snapshot.search(['carpenter'], filters={'min_cost': 5000})
+    return ids
+
+
+def set_cost(conn, worker_id, cost):
+    db_execute(conn, 'UPDATE workers SET cost = ?, verified = 1 WHERE id = ?', (cost, worker_id))
+    return search_projection.refresh_workers(conn, [worker_id])
+
+
+def test_snapshot_only_sees_committed_projection_changes(client, conn):
+    response = client.post('/api/workers/register', json={
+        'user': {'name': 'Joseph', 'phone': '7200000001', 'password': 'p'},
+        'worker': {'service': 'carpenter', 'cost': 300, 'latitude': 12.97, 'longitude': 77.59, 'slots': {}},
+    })
+    worker_id = response.get_json()['user']['workerId']
+    set_cost(conn, worker_id, 300)
+    conn.commit()
+    assert worker_id not in expensive_carpenters(conn)
+
+    set_cost(conn, worker_id, 9000)
+    assert worker_id not in expensive_carpenters(conn)
+    conn.rollback()
+    assert worker_id not in expensive_carpenters(conn)
+
+    search = set_cost(conn, worker_id, 9000)
+    conn.commit()
+    search.publish()
+    assert worker_id in expensive_carpenters(conn)
+
+    search_projection.remove_workers(conn, [worker_id])
+    conn.rollback()
+    assert worker_id in expensive_carpenters(conn)
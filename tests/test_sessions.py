@@ -0,0 +1,55 @@
+import pytest
+
+import sessions
+from sessions import Sessions, SessionError
+
+
+def ok(response, code=200):
+    assert response.status_code == code, (response.status_code, response.data[:500])
+    return response.get_json()
+
+
+def test_verify_rejects_tampered_and_expired_tokens(monkeypatch):
+    s = Sessions(b'secret', ttl=60)
+    token = s.issue('u1', 'user', 'Asha')
+    assert s.verify(token)['sub'] == 'u1'
+
+    version, payload, signature = token.split('.')
+    with pytest.raises(SessionError):
+        s.verify(f'{version}.{payload}.{signature[:-2]}AA')
+    with pytest.raises(SessionError):
+        Sessions(b'other').verify(token)
+
+    now = sessions.time.time()
+    monkeypatch.setattr(sessions.time, 'time', lambda: now + 61)
+    with pytest.raises(SessionError, match='expired'):
+        s.verify(token)
+
+
+def test_revocation_reaches_other_processes(app, conn):
+    here, there = Sessions(b'secret'), Sessions(b'secret')
+    token = here.issue('u2', 'user')
+    there.refresh(conn)
+    assert there.verify(token)
+
+    here.revoke(conn, here.verify(token))
+    conn.commit()
+    with pytest.raises(SessionError, match='revoked'):
+        here.verify(token)
+    there.refresh(conn)
+    with pytest.raises(SessionError, match='revoked'):
+        there.verify(token)
+
+
+def test_deleting_an_account_revokes_its_tokens(client, conn):
+    user = ok(client.post('/api/auth/register', json={'name': 'Ravi', 'phone': '7400000101', 'password': 'p', 'role': 'user'}))
+    token = ok(client.post('/api/auth/login', json={'phone': '7400000101', 'password': 'p', 'role': 'user'}))['token']
+    assert sessions.sessions.verify(token)['sub'] == user['user']['id']
+
+    ok(client.delete(f"/api/admin/users/{user['user']['id']}?mode=soft"))
+    with pytest.raises(SessionError, match='revoked'):
+        sessions.sessions.verify(token)
+    other = Sessions(sessions.load_secret())
+    other.refresh(conn)
+    with pytest.raises(SessionError, match='revoked'):
+        other.verify(token)
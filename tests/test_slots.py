@@ -0,0 +1,44 @@
+import slots
+
+SLOT = '9:00 AM - 10:00 AM'
+
+
+def ok(response, code=200):
+    assert response.status_code == code, (response.status_code, response.data[:500])
+    return response.get_json()
+
+
+def book(client, user_id, worker_id, slot=SLOT):
+    return client.post('/api/bookings', json={'userId': user_id, 'workerId': worker_id, 'service': 'carpenter',
+                                              'slot': slot, 'price': 300})
+
+
+def free_slots(client, worker_id):
+    workers = ok(client.get('/api/availability?service=carpenter&from=9am&to=10am'))
+    return [s['slot'] for w in workers if w['workerId'] == worker_id for s in w['slots']]
+
+
+def test_slot_labels_parse_to_minutes():
+    assert slots.parse_slot_label(SLOT) == (540, 600)
+    assert slots.parse_slot_label('11:00 PM - 12:00 AM') == (1380, 1440)
+    assert slots.parse_slot_label('after lunch') == (None, None)
+
+
+def test_double_booked_slot_is_a_409_until_released(client):
+    worker = ok(client.post('/api/workers/register', json={
+        'user': {'name': 'Meera', 'phone': '7400000201', 'password': 'p'},
+        'worker': {'service': 'carpenter', 'cost': 300, 'latitude': 12.97, 'longitude': 77.59,
+                   'slots': {SLOT: {'available': True, 'price': 300}}},
+    }))['user']['workerId']
+    first = ok(client.post('/api/auth/register', json={'name': 'Anil', 'phone': '7400000202', 'password': 'p', 'role': 'user'}))['user']['id']
+    second = ok(client.post('/api/auth/register', json={'name': 'Sara', 'phone': '7400000203', 'password': 'p', 'role': 'user'}))['user']['id']
+    assert free_slots(client, worker) == [SLOT]
+
+    booking = ok(book(client, first, worker))['bookingId']
+    assert free_slots(client, worker) == []
+    assert 'already booked' in ok(book(client, second, worker), 409)['error']
+
+    # Cancelling gives the slot back; reopening the cancelled booking cannot take it again
+    ok(client.patch(f'/api/bookings/{booking}/status', json={'status': 'cancelled'}))
+    ok(book(client, second, worker))
+    ok(client.patch(f'/api/bookings/{booking}/status', json={'status': 'confirmed'}), 409)
@@ -0,0 +1,467 @@
+import os
+import sys
+import json
+import math
+import mmap
+import time
+import zlib
+import struct
+import logging
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+from db import IS_POSTGRES, SQLITE_PATH, get_db_connection, db_execute
+from ranking import SORT_KEYS, numpy_module, haversine_batch, top_k, relevance_scores, facet_counts
+
+# Memory-mapped snapshot of the searchable worker fields, shared by every process on the
+# machine. The file holds a fixed header and one column per field (lat, lng, cost, rating,
+# experience, review count, service and gender codes, flags, id) with room for more rows
+# than it has. Processes map it and rank
+# straight off the mapped pages, so the page cache holds one copy however many gunicorn
+# workers run; GET /api/workers then loads only the final page from the database.
+#
+# Writers patch rows in place whenever the worker_search projection changes (appending into
+# the spare capacity, under a file lock); a full rebuild writes a new file and renames it
+# over the old one, and readers remap when the inode changes. Rebuilds happen when the
+# file is missing, full, invalidated, or older than WORKER_SNAPSHOT_TTL (which bounds how
+# long writes made on other machines take to show up).
+#
+#   WORKER_SNAPSHOT=on    (default) search ranks against the snapshot
+#   WORKER_SNAPSHOT=off   search queries worker_search for every request
+
+WORKER_SNAPSHOT = os.environ.get('WORKER_SNAPSHOT', 'on')
+WORKER_SNAPSHOT_PATH = os.environ.get('WORKER_SNAPSHOT_PATH') or (
+    os.path.join(tempfile.gettempdir(), 'service_finder_workers.snapshot') if IS_POSTGRES
+    else SQLITE_PATH + '-workers.snapshot')
+WORKER_SNAPSHOT_TTL = float(os.environ.get('WORKER_SNAPSHOT_TTL', 60))
+# Extra rows ranked past the page, in case some of them went away since the snapshot was written
+WORKER_SNAPSHOT_SLACK = int(os.environ.get('WORKER_SNAPSHOT_SLACK', 8))
+
+MAGIC = b'WSNP'
+FORMAT_VERSION = 2
+# magic, format version, capacity, count, built_at, stale, overflow
+HEADER = struct.Struct('<4sIQQdII')
+HEADER_SIZE = 64
+COUNT_OFFSET = 16
+STALE_OFFSET = 32
+MIN_CAPACITY = 1024
+GROWTH = 1.5
+ID_BYTES = 64
+
+# name, numpy dtype, memoryview format, size
+FIELDS = [
+    ('lat', '<f8', 'd', 8),
+    ('lng', '<f8', 'd', 8),
+    ('cost', '<f8', 'd', 8),
+    ('rating', '<f8', 'd', 8),
+    ('experience', '<f8', 'd', 8),
+    ('reviews', '<f8', 'd', 8),
+    ('service', '<u4', 'I', 4),
+    ('gender', '<u4', 'I', 4),
+    ('flags', 'u1', 'B', 1),
+]
+
+AVAILABLE, VERIFIED, SERVABLE = 1, 2, 4
+SEARCHABLE = AVAILABLE | VERIFIED | SERVABLE
+
+FLOAT_FIELDS = ['lat', 'lng', 'cost', 'rating', 'experience', 'reviews']
+
+# sort key -> (snapshot column, descending); distance and relevance are computed per request
+RANK_COLUMNS = {'rating': ('rating', True), 'cost': ('cost', False), 'cost_desc': ('cost', True)}
+
+# filter -> (snapshot column, lower bound)
+RANGE_FILTERS = {'min_cost': ('cost', True), 'max_cost': ('cost', False),
+                 'min_rating': ('rating', True), 'min_experience': ('experience', True)}
+
+SOURCE_QUERY = '''
+    SELECT worker_id, service_key, verified, available, lat, lng, cost, rating, gender, experience, total_reviews,
+           CASE WHEN fragment IS NULL THEN 0 ELSE 1 END as servable
+    FROM worker_search
+'''
+
+
+def service_code(service_key):
+    # Stable across processes without a shared table; hydration re-checks the key itself
+    return zlib.crc32((service_key or '').encode())
+
+
+def gender_code(gender):
+    # worker_search stores gender lowercased; 0 for none
+    return zlib.crc32(gender.encode()) if gender else 0
+
+
+def _float(value):
+    try:
+        return math.nan if value is None else float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _layout(capacity):
+    offsets, offset = {}, HEADER_SIZE
+    for name, _, _, size in FIELDS:
+        offsets[name] = offset
+        offset += capacity * size
+    offsets['id'] = offset
+    return offsets, offset + capacity * ID_BYTES
+
+
+def snapshot_row(r):
+    # worker_search columns (as written by search_projection) -> snapshot row
+    flags = (AVAILABLE if r['available'] == 1 else 0) | (VERIFIED if r['verified'] == 1 else 0) | \
+        (SERVABLE if r['servable'] else 0)
+    return (r['worker_id'], service_code(r['service_key']), gender_code(r['gender']), flags,
+            *(_float(r[c]) for c in ('lat', 'lng', 'cost', 'rating', 'experience', 'total_reviews')))
+
+
+def _read_id(mm, offsets, i):
+    start = offsets['id'] + i * ID_BYTES
+    return bytes(mm[start:start + ID_BYTES]).rstrip(b'\0').decode()
+
+
+def _put(mm, offsets, i, row):
+    worker_id, code, gender, flags = row[:4]
+    for name, value in zip(FLOAT_FIELDS, row[4:]):
+        struct.pack_into('<d', mm, offsets[name] + i * 8, value)
+    struct.pack_into('<I', mm, offsets['service'] + i * 4, code)
+    struct.pack_into('<I', mm, offsets['gender'] + i * 4, gender)
+    struct.pack_into('B', mm, offsets['flags'] + i, flags)
+    key = worker_id.encode()
+    mm[offsets['id'] + i * ID_BYTES:offsets['id'] + (i + 1) * ID_BYTES] = key.ljust(ID_BYTES, b'\0')
+
+
+@contextmanager
+def _file_lock(path):
+    # Serializes writers across processes; readers never take it
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_snapshot(path, rows):
+    # Writes a new generation next to the old one and swaps it in atomically
+    rows = list(rows)
+    fits = [r for r in rows if len(r[0].encode()) <= ID_BYTES]
+    capacity = max(MIN_CAPACITY, int(len(fits) * GROWTH))
+    offsets, size = _layout(capacity)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w+b') as f:
+        f.truncate(size)
+        mm = mmap.mmap(f.fileno(), size)
+        try:
+            for i, row in enumerate(fits):
+                _put(mm, offsets, i, row)
+            HEADER.pack_into(mm, 0, MAGIC, FORMAT_VERSION, capacity, len(fits), time.time(), 0, len(rows) - len(fits))
+            mm.flush()
+        finally:
+            mm.close()
+    os.replace(tmp, path)
+    return len(fits)
+
+
+class WorkerSnapshot:
+    def __init__(self, path=WORKER_SNAPSHOT_PATH, ttl=WORKER_SNAPSHOT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._rebuilding = threading.Lock()
+        self._map = None
+        self._inode = None
+        self._capacity = 0
+        self._offsets = None
+        self._views = None
+        self._rows = {}  # worker id -> row number, for rows below _indexed
+        self._indexed = 0
+        self._service_names = {}
+        self.stats = {'searches': 0, 'rebuilds': 0, 'updates': 0, 'remaps': 0}
+
+    def _lock_file(self):
+        return _file_lock(self.path) if HAS_FCNTL else nullcontext()
+
+    def _open(self):
+        # Maps the current generation if it changed; -> False when there is no usable file
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self._map = None
+            return False
+        if inode == self._inode and self._map is not None:
+            return True
+        with open(self.path, 'r+b') as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        magic, version, capacity = HEADER.unpack_from(mm, 0)[:3]
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return False
+        offsets, _ = _layout(capacity)
+        np = numpy_module()
+        views = {}
+        for name, dtype, fmt, size in FIELDS:
+            start = offsets[name]
+            if np is not None:
+                views[name] = np.frombuffer(mm, dtype=dtype, count=capacity, offset=start)
+            else:
+                views[name] = memoryview(mm)[start:start + capacity * size].cast(fmt)
+        # Old mappings are left to the garbage collector: other threads may still be ranking on them
+        self._map, self._inode, self._capacity, self._offsets, self._views = mm, inode, capacity, offsets, views
+        self._rows, self._indexed = {}, 0
+        self.stats['remaps'] += 1
+        return True
+
+    def _header(self):
+        _, _, capacity, count, built_at, stale, overflow = HEADER.unpack_from(self._map, 0)
+        return count, built_at, stale, overflow
+
+    def _fresh(self):
+        count, built_at, stale, overflow = self._header()
+        return not stale and time.time() - built_at < self.ttl
+
+    def _index(self, count):
+        # Learn ids of rows other processes appended since this process last looked
+        for i in range(self._indexed, count):
+            self._rows[_read_id(self._map, self._offsets, i)] = i
+        self._indexed = count
+
+    def rebuild(self, conn, force=True):
+        with self._lock_file():
+            with self._lock:
+                if not force and self._open() and self._fresh():
+                    # Another process rebuilt it while this one waited for the lock
+                    return self._header()[0]
+            total = write_snapshot(self.path, [snapshot_row(r) for r in db_execute(conn, SOURCE_QUERY).fetchall()])
+            self.stats['rebuilds'] += 1
+        with self._lock:
+            self._open()
+        return total
+
+    def _rebuild_from(self, connect):
+        conn = connect()
+        try:
+            return self.rebuild(conn, force=False)
+        finally:
+            conn.close()
+
+    def ensure(self, connect):
+        # -> True when searches can be served from the snapshot. connect() -> a primary
+        # connection, opened only for a rebuild: every process maps the file, so it is
+        # never written from a lagging replica
+        with self._lock:
+            usable = self._open()
+            fresh = usable and self._fresh()
+        if not usable:
+            self._rebuild_from(connect)
+        elif not fresh and self._rebuilding.acquire(blocking=False):
+            # Expired or invalidated: one thread rebuilds, the others keep using the mapped generation
+            try:
+                self._rebuild_from(connect)
+            finally:
+                self._rebuilding.release()
+        with self._lock:
+            # Some worker ids may not fit the id column (overflow); those searches use the database
+            return self._map is not None and not self._header()[3]
+
+    def invalidate(self):
+        # Marks the current generation stale in every process; the next search rebuilds it
+        with self._lock:
+            if self._open():
+                struct.pack_into('<I', self._map, STALE_OFFSET, 1)
+
+    def apply(self, rows=(), removed=()):
+        # Patches rows in place after worker writes; rows as returned by snapshot_row()
+        if not os.path.exists(self.path):
+            # Nothing to patch; the first search builds the file
+            return
+        with self._lock, self._lock_file():
+            if not self._open():
+                return
+            count = self._header()[0]
+            self._index(count)
+            for row in rows:
+                i = self._rows.get(row[0])
+                if i is None:
+                    if count >= self._capacity or len(row[0].encode()) > ID_BYTES:
+                        struct.pack_into('<I', self._map, STALE_OFFSET, 1)
+                        continue
+                    i = count
+                    count += 1
+                    self._rows[row[0]] = i
+                _put(self._map, self._offsets, i, row)
+            for worker_id in removed:
+                i = self._rows.get(worker_id)
+                if i is not None:
+                    self._views['flags'][i] = 0
+            # Publish appended rows only after they are written
+            struct.pack_into('<Q', self._map, COUNT_OFFSET, count)
+            self._indexed = count
+        self.stats['updates'] += 1
+
+    def search(self, service_keys=None, lat=None, lng=None, radius_km=None, sort=None, limit=None, nearest=False,
+               filters=None, free_ids=None, facets=False):
+        # -> (worker ids, distances or None, total matches, facets or None), best first and ranked
+        # past limit by WORKER_SNAPSHOT_SLACK. nearest=True: rows need coordinates, radius_km
+        # applies and the default order is by distance. free_ids keeps only those workers.
+        with self._lock:
+            mm, offsets, views, count = self._map, self._offsets, self._views, self._header()[0]
+            free_rows = None
+            if free_ids is not None:
+                self._index(count)
+                free_rows = [self._rows[w] for w in free_ids if self._rows.get(w, count) < count]
+        self.stats['searches'] += 1
+        filters = filters or {}
+        codes = [service_code(k) for k in service_keys] if service_keys else None
+        genders = [gender_code(g) for g in filters['genders']] if filters.get('genders') else None
+        ranges = [(RANGE_FILTERS[name], filters[name]) for name in RANGE_FILTERS if filters.get(name) is not None]
+
+        # One pass of vectorized masks over all rows, or one loop without numpy
+        np = numpy_module()
+        if np is not None:
+            mask = views['flags'][:count] == SEARCHABLE
+            if codes is not None:
+                mask &= np.isin(views['service'][:count], codes)
+            if genders is not None:
+                mask &= np.isin(views['gender'][:count], genders)
+            for (name, lower), value in ranges:
+                mask &= views[name][:count] >= value if lower else views[name][:count] <= value
+            if free_rows is not None:
+                free = np.zeros(count, dtype=bool)
+                free[free_rows] = True
+                mask &= free
+            rows = np.nonzero(mask)[0]
+            column = lambda name: views[name][rows]
+        else:
+            flags, services, gender_col = views['flags'], views['service'], views['gender']
+            wanted, wanted_genders = set(codes or ()), set(genders or ())
+            free = set(free_rows or ())
+
+            def match(i):
+                if flags[i] != SEARCHABLE or (codes is not None and services[i] not in wanted):
+                    return False
+                if genders is not None and gender_col[i] not in wanted_genders:
+                    return False
+                if free_rows is not None and i not in free:
+                    return False
+                return all(views[name][i] >= value if lower else views[name][i] <= value
+                           for (name, lower), value in ranges)
+            rows = [i for i in range(count) if match(i)]
+            column = lambda name: array('d', (views[name][i] for i in rows))
+
+        distances = None
+        if lat and lng:
+            lats, lngs = column('lat'), column('lng')
+            distances = haversine_batch(float(lat), float(lng), lats, lngs)
+            if nearest:
+                if np is not None:
+                    keep = ~(np.isnan(lats) | np.isnan(lngs))
+                    if radius_km is not None:
+                        keep &= distances <= radius_km
+                    rows, distances = rows[keep], distances[keep]
+                else:
+                    keep = [j for j in range(len(rows)) if lats[j] == lats[j] and lngs[j] == lngs[j]
+                            and (radius_km is None or distances[j] <= radius_km)]
+                    rows = [rows[j] for j in keep]
+                    distances = array('d', (distances[j] for j in keep))
+
+        counts = None
+        if facets:
+            services = views['service'][rows] if np is not None else [views['service'][i] for i in rows]
+            counts = facet_counts(services, column('cost'))
+
+        k = limit + WORKER_SNAPSHOT_SLACK if limit else None
+        key = sort if sort in SORT_KEYS else ('distance' if nearest else None)
+        if key is None:
+            order = range(min(k, len(rows)) if k else len(rows))
+        elif key == 'distance':
+            order = top_k(distances if distances is not None else [0.0] * len(rows), k)
+        elif key == 'relevance':
+            order = top_k(relevance_scores(distances, column('rating'), column('reviews'), column('cost'), len(rows)),
+                          k, True)
+        else:
+            name, descending = RANK_COLUMNS[key]
+            order = top_k(column(name), k, descending)
+
+        ids = [_read_id(mm, offsets, int(rows[j])) for j in order]
+        return ids, (None if distances is None else [float(distances[j]) for j in order]), len(rows), counts
+
+    def service_names(self, connect, codes):
+        # Service code -> key for facet output; unknown codes reload the keys from worker_search
+        # on a primary connection from connect()
+        if any(code not in self._service_names for code in codes):
+            conn = connect()
+            try:
+                keys = [r['service_key'] for r in db_execute(conn, 'SELECT DISTINCT service_key FROM worker_search').fetchall()]
+            finally:
+                conn.close()
+            self._service_names = {service_code(k): k for k in keys if k}
+        return self._service_names
+
+    def info(self):
+        info = dict(self.stats)
+        with self._lock:
+            if self._open():
+                count, built_at, stale, overflow = self._header()
+                info.update(rows=count, capacity=self._capacity, age_seconds=round(time.time() - built_at, 1),
+                            stale=stale, overflow=overflow)
+        return info
+
+
+snapshot = WorkerSnapshot()
+
+
+def enabled():
+    return WORKER_SNAPSHOT == 'on'
+
+
+def apply_projection_rows(rows):
+    # Called by search_projection with worker_search rows as dicts; never fails the write
+    if not enabled():
+        return
+    try:
+        snapshot.apply([snapshot_row(dict(r, servable=r['fragment'] is not None)) for r in rows])
+    except Exception:
+        logging.exception('Could not update the worker snapshot; marking it stale')
+        invalidate()
+
+
+def remove_workers(worker_ids):
+    if not enabled() or not worker_ids:
+        return
+    try:
+        snapshot.apply(removed=worker_ids)
+    except Exception:
+        logging.exception('Could not update the worker snapshot; marking it stale')
+        invalidate()
+
+
+def invalidate():
+    if not enabled():
+        return
+    try:
+        snapshot.invalidate()
+    except Exception:
+        logging.exception('Could not invalidate the worker snapshot')
+
+
+if __name__ == '__main__':
+    # python worker_snapshot.py build   -> write a fresh snapshot from worker_search
+    # python worker_snapshot.py info    -> rows, capacity and age of the current snapshot
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'build':
+        conn = get_db_connection()
+        try:
+            print(f'Worker snapshot written with {snapshot.rebuild(conn)} workers to {snapshot.path}')
+        finally:
+            conn.close()
+    elif command == 'info':
+        print(json.dumps(snapshot.info()))
+    else:
+        sys.exit('usage: python worker_snapshot.py build|info')